@@ -1,10 +1,13 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.exc import OperationalError
 
 import time
 import os
+from typing import AsyncIterator
 from dotenv import load_dotenv, find_dotenv
 
 
@@ -50,3 +53,29 @@ def get_db():
 
     raise RuntimeError("Failed to connect to the database after several attempts.")
 
+
+def _async_db_url(url: str) -> str:
+    """
+    La misma base de datos con el driver asyncpg. asyncpg no entiende
+    ``sslmode`` de libpq: se traduce a su parámetro ``ssl``.
+    """
+    parsed = make_url(url).set(drivername="postgresql+asyncpg")
+    query = dict(parsed.query)
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    return parsed.set(query=query).render_as_string(hide_password=False)
+
+
+# Motor async para las rutas que no deben ocupar un hilo mientras esperan a la red.
+# ASYNC_DB_URL permite indicarlo explícitamente; por defecto se deriva de DB_URL.
+ASYNC_DB_URL = os.getenv("ASYNC_DB_URL") or _async_db_url(DB_URL)
+
+async_engine = create_async_engine(ASYNC_DB_URL, pool_pre_ping=True)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Dependencia async: una sesión por petición, cerrada al terminar."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -200,6 +200,37 @@ def get_item_data(business_id: int, db: Session) -> List[Item]:
             }
         )
         
+def get_items_by_ids(business_id: int, item_ids: List[int], db: Session) -> List[Item]:
+    """
+    Trae en una sola consulta los items de un negocio con esos IDs y sus
+    categorías. El orden no está garantizado; los IDs que no existan se omiten.
+    """
+    if not item_ids:
+        return []
+    try:
+        return db.query(Item)\
+            .options(joinedload(Item.categories))\
+            .filter(Item.business_id == business_id, Item.item_id.in_(item_ids))\
+            .all()
+    except SQLAlchemyError as e:
+        raise_app_error(
+            error_code="DatabaseItemError",
+            message="Failed to get Items from the database.",
+            error_type=ErrorType.DATA,
+            status_code=500,
+            details=str(e),
+            additional_data={
+                "operation": "get",
+                "model": "Item"
+            }
+        )
+
+
+def get_item_business_id(item_id: int, db: Session):
+    """Negocio de un item, o ``None`` si no existe."""
+    return db.query(Item.business_id).filter(Item.item_id == item_id).scalar()
+
+
 def delete_item_data(item_id: int, db: Session) -> DeleteItemResponse:
     """
     Delete an existing ACTIVITY item from the database.
@@ -1,27 +1,36 @@
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models.sql_alchemy_models import KnowledgeEntries
 from app.schemas._error import ErrorType, raise_app_error
 from app.schemas._knowledge_entry import KnowledgeEntryCreate, KnowledgeEntryDBModel, KnowledgeEntryUpdate
+from app.search._bm25 import get_lexical_index
 import datetime
+from typing import List, Tuple
 from sqlalchemy.exc import SQLAlchemyError
+def _new_entry(data: KnowledgeEntryDBModel) -> KnowledgeEntries:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return KnowledgeEntries(
+        business_id=data.business_id,
+        title=data.title,
+        content=data.content,
+        content_type=data.content_type,
+        icon=data.icon,
+        improved_title=data.improved_title,
+        improved_content=data.improved_content, 
+        categories=data.categories,
+        created_at=now,
+        updated_at=now
+    )
+
+
 def create_knowledge_entry(db: Session, data: KnowledgeEntryDBModel) -> KnowledgeEntries:
     try:
-        now = datetime.datetime.now(datetime.timezone.utc)
-        entry = KnowledgeEntries(
-            business_id=data.business_id,
-            title=data.title,
-            content=data.content,
-            content_type=data.content_type,
-            icon=data.icon,
-            improved_title=data.improved_title,
-            improved_content=data.improved_content, 
-            categories=data.categories,
-            created_at=now,
-            updated_at=now
-        )
+        entry = _new_entry(data)
         db.add(entry)
         db.commit()
         db.refresh(entry)
+        _index_entry(entry)
         return entry
 
     except SQLAlchemyError as e:
@@ -37,6 +46,31 @@ def create_knowledge_entry(db: Session, data: KnowledgeEntryDBModel) -> Knowledg
                 "model": "Entry"
             }
         )
+async def create_knowledge_entry_async(db: AsyncSession, data: KnowledgeEntryDBModel) -> KnowledgeEntries:
+    """Versión async de ``create_knowledge_entry``: no ocupa un hilo mientras espera a la BD."""
+    try:
+        entry = _new_entry(data)
+        db.add(entry)
+        await db.commit()
+        await db.refresh(entry)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise_app_error(
+            error_code="DatabaseEntryError",
+            message="Failed to insert the new Entry into the database.",
+            error_type=ErrorType.DATA,
+            status_code=500,
+            details=str(e),
+            additional_data={
+                "operation": "insert",
+                "model": "Entry"
+            }
+        )
+    # El índice léxico escribe su versión en SQLite local: breve, pero bloqueante
+    await asyncio.to_thread(_index_entry, entry)
+    return entry
+
+
 def update_knowledge_entry(db: Session, entry_id: int, data: KnowledgeEntryUpdate) -> KnowledgeEntries:
     entry = db.query(KnowledgeEntries).filter(KnowledgeEntries.entry_id == entry_id).first()
     if not entry:
@@ -48,4 +82,52 @@ def update_knowledge_entry(db: Session, entry_id: int, data: KnowledgeEntryUpdat
     entry.updated_at = datetime.datetime.now(datetime.timezone.utc)
     db.commit()
     db.refresh(entry)
+    _index_entry(entry)
     return entry
+
+
+def _index_entry(entry: KnowledgeEntries) -> None:
+    """Actualiza el índice léxico del negocio; un fallo aquí no deshace la escritura."""
+    try:
+        get_lexical_index().entry_saved(
+            entry.business_id, entry.entry_id, entry.improved_title, entry.improved_content, entry.categories
+        )
+    except Exception as e:
+        print(f"ADVERTENCIA: No se pudo actualizar el índice léxico de la entrada {entry.entry_id}: {e}")
+
+
+def get_knowledge_entry_texts(db: Session, business_id: int) -> List[Tuple[int, str, str, List[str]]]:
+    """Campos indexables ``(entry_id, improved_title, improved_content, categories)`` de un negocio."""
+    return [
+        tuple(row) for row in db.query(
+            KnowledgeEntries.entry_id,
+            KnowledgeEntries.improved_title,
+            KnowledgeEntries.improved_content,
+            KnowledgeEntries.categories,
+        ).filter(KnowledgeEntries.business_id == business_id).all()
+    ]
+
+
+def get_knowledge_entries_by_ids(db: Session, business_id: int, entry_ids: List[int]) -> List[KnowledgeEntries]:
+    """
+    Trae en una sola consulta (``IN``) las entradas de un negocio con esos IDs.
+    El orden no está garantizado; los IDs que no existan se omiten.
+    """
+    if not entry_ids:
+        return []
+    try:
+        return db.query(KnowledgeEntries)\
+            .filter(KnowledgeEntries.business_id == business_id, KnowledgeEntries.entry_id.in_(entry_ids))\
+            .all()
+    except SQLAlchemyError as e:
+        raise_app_error(
+            error_code="DatabaseEntryError",
+            message="Failed to get Entries from the database.",
+            error_type=ErrorType.DATA,
+            status_code=500,
+            details=str(e),
+            additional_data={
+                "operation": "get",
+                "model": "Entry"
+            }
+        )
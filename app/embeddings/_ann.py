@@ -0,0 +1,148 @@
+""" Índice aproximado de vecinos cercanos (IVF) para shards grandes
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._matrix_store import VECTOR_DTYPE
+from app.embeddings._scoring import normalize_rows, top_k
+
+ANN_INDEX_FILE = "ivf.npz"
+# Por debajo de este tamaño la búsqueda exacta ya es barata y no se construye índice
+ANN_MIN_ROWS = 5000
+DEFAULT_NPROBE = 16
+# Fracción de filas del snapshot borradas o reemplazadas a partir de la cual se
+# reconstruye el índice (compactando): las listas siguen recorriendo esas filas
+DEFAULT_MAX_TOMBSTONE_RATIO = 0.2
+
+_ASSIGN_CHUNK_ROWS = 16384
+
+
+class IVFIndex:
+    """
+    Índice de listas invertidas (IVF) sobre vectores normalizados.
+
+    Los vectores se agrupan con k-means esférico en ``nlist`` listas. Una
+    consulta puntúa los centroides, recorre solo las ``nprobe`` listas más
+    cercanas y puntúa exactamente sus filas: más ``nprobe`` = más recall y más
+    latencia; ``nprobe = nlist`` equivale a la búsqueda exacta.
+
+    El índice guarda números de fila del snapshot, no vectores: los candidatos
+    se leen del memmap float32 del propio snapshot. Las filas escritas después
+    (registros del log) no se añaden a las listas: se asignan a su centroide
+    con ``assign`` y se recorren si su lista está entre las visitadas.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self) -> int:
+        return self.list_rows.shape[0]
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """
+        Entrena los centroides con una muestra (hasta 64 filas por lista) y
+        asigna todas las filas por bloques, sin cargar la matriz completa.
+        """
+        rows = vectors.shape[0]
+        nlist = max(1, min(rows, nlist or int(np.sqrt(rows))))
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(rows, size=min(rows, 64 * nlist), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=VECTOR_DTYPE)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Las listas vacías conservan su centroide anterior
+            filled = counts > 0
+            centroids[filled] = normalize_rows(sums[filled])
+
+        assignment = np.empty(rows, dtype=np.int32)
+        for start in range(0, rows, _ASSIGN_CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + _ASSIGN_CHUNK_ROWS], dtype=VECTOR_DTYPE)
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+
+        list_rows = np.argsort(assignment, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_rows)
+
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Las ``nprobe`` listas más cercanas a ``query``."""
+        lists, _ = top_k(self.centroids @ query, min(nprobe, self.nlist))
+        return lists
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Lista (centroide más cercano) de cada vector, sin modificar el índice."""
+        if len(vectors) == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.argmax(np.asarray(vectors, dtype=VECTOR_DTYPE) @ self.centroids.T, axis=1).astype(np.int32)
+
+    def candidates(self, query: np.ndarray, nprobe: int, lists: Optional[np.ndarray] = None) -> np.ndarray:
+        """Filas de las ``nprobe`` listas más cercanas a ``query`` (o de ``lists``), ordenadas."""
+        if lists is None:
+            lists = self.probe(query, nprobe)
+        parts = [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists.tolist()]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        nprobe: int = DEFAULT_NPROBE,
+        invalid_rows: Optional[np.ndarray] = None,
+        lists: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filas y puntuaciones de los ``k`` mejores candidatos, de mayor a menor.
+        Las filas de ``invalid_rows`` (borradas o reemplazadas) se descartan
+        antes de puntuar. ``lists`` reutiliza listas ya elegidas con ``probe``.
+        """
+        query = np.asarray(query, dtype=VECTOR_DTYPE)
+        rows = self.candidates(query, nprobe, lists)
+        if invalid_rows is not None:
+            rows = rows[~invalid_rows[rows]]
+        scores = np.asarray(vectors[rows], dtype=VECTOR_DTYPE) @ query
+        order, best = top_k(scores, k)
+        return rows[order], best
+
+    # --- Persistencia junto al snapshot ---
+
+    def save(self, directory: str) -> None:
+        path = os.path.join(directory, ANN_INDEX_FILE)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: str, rows: int) -> Optional["IVFIndex"]:
+        """Carga el índice del snapshot, o ``None`` si no tiene (o no corresponde a sus filas)."""
+        path = os.path.join(directory, ANN_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            index = cls(data["centroids"], data["list_offsets"], data["list_rows"])
+        if len(index) != rows:
+            return None
+        return index
+
+
+def build_ann_index(directory: str, vectors: np.ndarray, min_rows: int = ANN_MIN_ROWS) -> Optional[IVFIndex]:
+    """Construye y guarda el índice de un snapshot si tiene al menos ``min_rows`` filas."""
+    if vectors.shape[0] < min_rows:
+        return None
+    index = IVFIndex.build(vectors)
+    index.save(directory)
+    return index
@@ -0,0 +1,148 @@
+""" Generación masiva de embeddings: lotes concurrentes con límite de tasa y reintentos
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.embeddings._provider import MAX_BATCH_SIZE
+
+# (entry_ids, matriz de embeddings) de un lote terminado
+BatchCallback = Callable[[List[int], np.ndarray], None]
+
+
+class RateLimiter:
+    """
+    Token bucket compartido entre hilos. ``acquire()`` bloquea hasta que haya
+    un token disponible, con ráfagas de hasta ``burst`` peticiones.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute debe ser mayor que 0")
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+@dataclass
+class BulkEmbeddingReport:
+    entries: int = 0
+    failed_entry_ids: List[int] = field(default_factory=list)
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def entries_per_second(self) -> float:
+        return self.entries / self.seconds if self.seconds > 0 else 0.0
+
+
+def iter_batches(items: Iterable[Tuple[int, str]], batch_size: int) -> Iterator[List[Tuple[int, str]]]:
+    batch: List[Tuple[int, str]] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_texts_bulk(
+    provider,
+    items: Iterable[Tuple[int, str]],
+    on_batch: BatchCallback,
+    *,
+    task_type: str = "RETRIEVAL_DOCUMENT",
+    batch_size: int = MAX_BATCH_SIZE,
+    max_concurrency: int = 4,
+    requests_per_minute: float = 1500,
+    max_retries: int = 5,
+    backoff_seconds: float = 1.0,
+    log_every_seconds: float = 10.0,
+) -> BulkEmbeddingReport:
+    """
+    Genera embeddings para ``items`` (pares ``(entry_id, texto)``) en lotes.
+
+    Hasta ``max_concurrency`` lotes se envían a la vez y cada llamada pasa por un
+    limitador de tasa. Un lote fallido se reintenta con backoff exponencial; si
+    agota los reintentos, sus ids quedan en ``failed_entry_ids``. ``on_batch`` se
+    llama desde el hilo que invoca esta función, así que puede escribir en el
+    almacén sin sincronización adicional. ``items`` se consume de forma
+    perezosa: solo hay en memoria unos pocos lotes a la vez.
+
+    Returns:
+        BulkEmbeddingReport: Totales y throughput (entradas/s) del proceso.
+    """
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    limiter = RateLimiter(requests_per_minute, burst=max_concurrency)
+    report = BulkEmbeddingReport()
+    report_lock = threading.Lock()
+    started = time.monotonic()
+    last_log = started
+
+    def embed_batch(batch: List[Tuple[int, str]]) -> Tuple[List[int], Optional[np.ndarray]]:
+        entry_ids = [entry_id for entry_id, _ in batch]
+        texts = [text for _, text in batch]
+        for attempt in range(max_retries + 1):
+            limiter.acquire()
+            try:
+                return entry_ids, provider.embed(texts, task_type=task_type)
+            except Exception as e:
+                if attempt == max_retries:
+                    print(f"    ERROR: lote de {len(batch)} entradas descartado tras {attempt + 1} intentos: {e}")
+                    return entry_ids, None
+                with report_lock:
+                    report.retries += 1
+                delay = backoff_seconds * (2 ** attempt) * (0.5 + random.random())
+                print(f"    Reintentando lote en {delay:.1f}s (intento {attempt + 1}/{max_retries}): {e}")
+                time.sleep(delay)
+
+    def collect(done: Set[Future]) -> None:
+        nonlocal last_log
+        for future in done:
+            entry_ids, matrix = future.result()
+            report.batches += 1
+            if matrix is None:
+                report.failed_entry_ids.extend(entry_ids)
+                continue
+            on_batch(entry_ids, matrix)
+            report.entries += len(entry_ids)
+        now = time.monotonic()
+        if now - last_log >= log_every_seconds:
+            last_log = now
+            print(f"  -> {report.entries} embeddings ({report.entries / (now - started):.1f} entradas/s)")
+
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed-batch") as executor:
+        pending: Set[Future] = set()
+        for batch in iter_batches(items, batch_size):
+            # Como mucho el doble de lotes que hilos en vuelo: memoria acotada
+            if len(pending) >= 2 * max_concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(embed_batch, batch))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    report.seconds = time.monotonic() - started
+    return report
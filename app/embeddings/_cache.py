@@ -0,0 +1,100 @@
+""" Caché de embeddings direccionada por contenido, delante del proveedor
+"""
+import hashlib
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.embeddings._matrix_store import VECTOR_DTYPE
+from app.utils.cache import DiskCache, LRUCache
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza Unicode (NFC) y espacios para que textos equivalentes compartan clave."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model: str, task_type: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}|{task_type}|{digest}"
+
+
+class CachedEmbeddingProvider:
+    """
+    Envuelve un proveedor de embeddings con dos niveles de caché:
+
+    - LRU en memoria del proceso.
+    - SQLite en disco, compartido entre procesos y ejecuciones, con expulsión por tamaño.
+
+    La clave es ``(modelo, task_type, sha256(texto normalizado))``, así que
+    entradas casi idénticas de distintos negocios comparten el mismo vector.
+    Solo los textos que fallan en ambos niveles se envían al proveedor, en una
+    única llamada por lote.
+    """
+
+    def __init__(
+        self,
+        provider,
+        memory_entries: int = 10_000,
+        disk_path: Optional[str] = DEFAULT_CACHE_PATH,
+        disk_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ):
+        self.provider = provider
+        self.model = provider.model
+        # Un mismo modelo con otra dimensión de salida produce vectores distintos
+        output_dimensionality = getattr(provider, "output_dimensionality", None)
+        self._namespace = f"{self.model}@{output_dimensionality}" if output_dimensionality else self.model
+        self.memory = LRUCache(memory_entries)
+        self.disk = DiskCache(disk_path, disk_max_bytes) if disk_path else None
+        self.provider_texts = 0
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        keys = [cache_key(self._namespace, task_type, text) for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing and self.disk is not None:
+            for key, value in self.disk.get_many(missing).items():
+                vector = np.frombuffer(value, dtype=VECTOR_DTYPE)
+                vectors[key] = vector
+                self.memory.set(key, vector)
+
+        # Un solo texto por clave, aunque el lote tenga repetidos
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in pending:
+                pending[key] = text
+        if pending:
+            matrix = self.provider.embed(list(pending.values()), task_type=task_type)
+            self.provider_texts += len(pending)
+            fresh = {}
+            for key, vector in zip(pending, matrix):
+                vector = np.ascontiguousarray(vector, dtype=VECTOR_DTYPE)
+                vectors[key] = vector
+                self.memory.set(key, vector)
+                fresh[key] = vector.tobytes()
+            if self.disk is not None:
+                self.disk.set_many(fresh)
+
+        return np.stack([vectors[key] for key in keys])
+
+    def stats(self) -> Dict[str, dict]:
+        """Contadores de aciertos y fallos de cada nivel y textos enviados al proveedor."""
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "provider_texts": self.provider_texts,
+        }
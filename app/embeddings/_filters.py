@@ -0,0 +1,215 @@
+""" Metadatos de filtrado por fila (categorías y content_type) para la búsqueda vectorial
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+FILTERS_FILE = "filters.npz"
+
+_WORD_BITS = 64
+
+
+@dataclass(frozen=True)
+class EntryMetadata:
+    """
+    Campos de una entrada por los que se puede filtrar una búsqueda. Las
+    categorías se guardan ordenadas y sin repetir, así dos metadatos iguales
+    se comparan iguales aunque vengan en otro orden.
+    """
+    categories: Tuple[str, ...] = ()
+    content_type: Optional[str] = None
+
+    @classmethod
+    def of(cls, categories: Optional[Iterable[str]], content_type: Optional[str]) -> "EntryMetadata":
+        return cls(tuple(sorted(set(categories or ()))), content_type)
+
+    def encode(self) -> bytes:
+        return json.dumps({"categories": list(self.categories), "content_type": self.content_type}, ensure_ascii=False).encode("utf-8")
+
+    @classmethod
+    def decode(cls, data: bytes) -> "EntryMetadata":
+        value = json.loads(data.decode("utf-8"))
+        return cls.of(value.get("categories"), value.get("content_type"))
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """
+    Filtro de búsqueda: la entrada debe tener alguna de ``categories`` (si se
+    indican) y el ``content_type`` pedido (si se indica).
+    """
+    categories: Tuple[str, ...] = ()
+    content_type: Optional[str] = None
+
+    @classmethod
+    def of(cls, categories: Optional[Iterable[str]] = None, content_type: Optional[str] = None) -> Optional["SearchFilter"]:
+        """Filtro con los criterios indicados, o ``None`` si no se indicó ninguno."""
+        categories = tuple(dict.fromkeys(categories or ()))
+        if not categories and content_type is None:
+            return None
+        return cls(categories, content_type)
+
+    def matches(self, metadata: Optional[EntryMetadata]) -> bool:
+        """Comprobación de una sola entrada (filas del log, todavía sin columnas)."""
+        if metadata is None:
+            return False
+        if self.content_type is not None and metadata.content_type != self.content_type:
+            return False
+        return not self.categories or any(category in metadata.categories for category in self.categories)
+
+
+class FilterColumns:
+    """
+    Columnas de metadatos alineadas con las filas de un snapshot::
+
+        category_bits       (filas, palabras) uint64  -> bit i = categoría i del vocabulario
+        content_type_codes  (filas,) int16            -> posición en el vocabulario de content_type
+        known               (filas,) bool             -> la fila se escribió con metadatos
+
+    Los vocabularios son del shard y solo crecen: al compactar, las categorías
+    nuevas se añaden al final y los bits de las filas conservadas siguen
+    siendo válidos. Un filtro se evalúa como una máscara vectorizada sobre
+    todas las filas, sin tocar los vectores.
+    """
+
+    def __init__(
+        self,
+        categories: List[str],
+        content_types: List[str],
+        category_bits: np.ndarray,
+        content_type_codes: np.ndarray,
+        known: np.ndarray,
+    ):
+        self.categories = categories
+        self.content_types = content_types
+        self.category_bits = category_bits
+        self.content_type_codes = content_type_codes
+        self.known = known
+        self._category_codes = {category: code for code, category in enumerate(categories)}
+        self._content_type_codes = {content_type: code for code, content_type in enumerate(content_types)}
+
+    def __len__(self) -> int:
+        return self.known.shape[0]
+
+    @classmethod
+    def empty(cls, rows: int) -> "FilterColumns":
+        """Columnas de ``rows`` filas sin metadatos (no coinciden con ningún filtro)."""
+        return cls(
+            [], [],
+            np.zeros((rows, 1), dtype=np.uint64),
+            np.full(rows, -1, dtype=np.int16),
+            np.zeros(rows, dtype=bool),
+        )
+
+    def take(self, rows: np.ndarray) -> "FilterColumns":
+        """Columnas de las filas indicadas, con los mismos vocabularios."""
+        return FilterColumns(
+            self.categories, self.content_types,
+            self.category_bits[rows], self.content_type_codes[rows], self.known[rows],
+        )
+
+    def extend(self, metadata: List[Optional[EntryMetadata]]) -> "FilterColumns":
+        """Columnas con ``metadata`` añadidas al final; amplía los vocabularios si hace falta."""
+        categories = list(self.categories)
+        content_types = list(self.content_types)
+        category_codes = dict(self._category_codes)
+        content_type_codes = dict(self._content_type_codes)
+        encoded_categories: List[List[int]] = []
+        encoded_types = np.full(len(metadata), -1, dtype=np.int16)
+        known = np.zeros(len(metadata), dtype=bool)
+        for position, item in enumerate(metadata):
+            codes = []
+            if item is not None:
+                known[position] = True
+                for category in item.categories:
+                    if category not in category_codes:
+                        category_codes[category] = len(categories)
+                        categories.append(category)
+                    codes.append(category_codes[category])
+                if item.content_type is not None:
+                    if item.content_type not in content_type_codes:
+                        content_type_codes[item.content_type] = len(content_types)
+                        content_types.append(item.content_type)
+                    encoded_types[position] = content_type_codes[item.content_type]
+            encoded_categories.append(codes)
+
+        words = max(1, -(-len(categories) // _WORD_BITS))
+        bits = np.zeros((len(self) + len(metadata), words), dtype=np.uint64)
+        bits[:len(self), :self.category_bits.shape[1]] = self.category_bits
+        for position, codes in enumerate(encoded_categories):
+            for code in codes:
+                bits[len(self) + position, code // _WORD_BITS] |= np.uint64(1 << (code % _WORD_BITS))
+        return FilterColumns(
+            categories, content_types, bits,
+            np.concatenate([self.content_type_codes, encoded_types]),
+            np.concatenate([self.known, known]),
+        )
+
+    def mask(self, filters: SearchFilter) -> np.ndarray:
+        """Filas que cumplen el filtro, como máscara booleana."""
+        mask = self.known.copy()
+        if filters.content_type is not None:
+            code = self._content_type_codes.get(filters.content_type)
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.content_type_codes == code
+        if filters.categories:
+            # Bits pedidos agrupados por palabra: una operación por palabra, no por categoría
+            words: Dict[int, int] = {}
+            for category in filters.categories:
+                code = self._category_codes.get(category)
+                if code is not None:
+                    words[code // _WORD_BITS] = words.get(code // _WORD_BITS, 0) | (1 << (code % _WORD_BITS))
+            any_category = np.zeros(len(self), dtype=bool)
+            for word, bits in words.items():
+                any_category |= (self.category_bits[:, word] & np.uint64(bits)) != 0
+            mask &= any_category
+        return mask
+
+    def metadata(self, row: int) -> Optional[EntryMetadata]:
+        """Metadatos de una fila, o ``None`` si se escribió sin ellos."""
+        if not self.known[row]:
+            return None
+        bits = self.category_bits[row]
+        categories = [
+            category for code, category in enumerate(self.categories)
+            if int(bits[code // _WORD_BITS]) >> (code % _WORD_BITS) & 1
+        ]
+        code = int(self.content_type_codes[row])
+        return EntryMetadata.of(categories, self.content_types[code] if code >= 0 else None)
+
+    # --- Persistencia junto al snapshot ---
+
+    def save(self, directory: str) -> None:
+        path = os.path.join(directory, FILTERS_FILE)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            categories=np.asarray(self.categories, dtype=str),
+            content_types=np.asarray(self.content_types, dtype=str),
+            category_bits=self.category_bits,
+            content_type_codes=self.content_type_codes,
+            known=self.known,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: str, rows: int) -> "FilterColumns":
+        """Columnas del snapshot; si no tiene (snapshots anteriores), filas sin metadatos."""
+        path = os.path.join(directory, FILTERS_FILE)
+        if not os.path.exists(path):
+            return cls.empty(rows)
+        with np.load(path) as data:
+            columns = cls(
+                data["categories"].tolist(),
+                data["content_types"].tolist(),
+                data["category_bits"],
+                data["content_type_codes"],
+                data["known"],
+            )
+        if len(columns) != rows:
+            return cls.empty(rows)
+        return columns
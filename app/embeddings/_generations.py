@@ -0,0 +1,190 @@
+""" Generaciones versionadas del almacén de embeddings: una por (modelo, dimensión)
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.embeddings._matrix_store import _write_json_atomic
+from app.embeddings._sharded_store import ShardedEmbeddingStore
+
+POINTER_FILE = "ACTIVE"
+GENERATION_FILE = "GENERATION"
+GENERATION_PREFIX = "gen-"
+
+
+def generation_name(model: str, dim: int) -> str:
+    """``models/text-embedding-004`` con 768 dimensiones -> ``gen-text-embedding-004-768``."""
+    slug = re.sub(r"[^a-z0-9]+", "-", model.split("/")[-1].lower()).strip("-")
+    return f"{GENERATION_PREFIX}{slug}-{int(dim)}"
+
+
+@dataclass
+class Generation:
+    """Vectores de un único modelo y dimensión; nunca se mezclan espacios distintos."""
+    name: str
+    model: str
+    dim: int
+    store: ShardedEmbeddingStore
+
+
+class GenerationalEmbeddingStore:
+    """
+    Almacén de embeddings con una generación por modelo::
+
+        <root>/ACTIVE                     -> {"active": ..., "backfill": ..., "previous": ...}
+        <root>/gen-embedding-001-768/     -> GENERATION (modelo y dimensión) + shards por negocio
+        <root>/gen-text-embedding-004-768/
+
+    Las lecturas usan siempre la generación activa. Mientras otra generación se
+    rellena en segundo plano (``generar_embeddings.py --model``), las escrituras
+    nuevas van a ambas para que el relleno no quede desactualizado. ``cut_over()``
+    cambia de generación reemplazando ``ACTIVE`` de forma atómica; la anterior se
+    conserva como ``previous`` hasta que se borre con ``drop_generation``.
+
+    ``ACTIVE`` se relee cuando cambia en disco, así que un cambio hecho por otro
+    proceso (el script de relleno) lo ven todos los workers de la aplicación.
+    """
+
+    def __init__(self, root: str, default_model: str, default_dim: int):
+        self.root = root
+        self._lock = threading.Lock()
+        self._generations: Dict[str, Generation] = {}
+        self._pointer: Optional[dict] = None
+        self._pointer_stamp = None
+        os.makedirs(root, exist_ok=True)
+        if not os.path.exists(os.path.join(root, POINTER_FILE)):
+            name = self.create_generation(default_model, default_dim).name
+            self._write_pointer({"active": name, "backfill": None, "previous": None})
+
+    # --- Puntero ---
+
+    def _read_pointer(self) -> dict:
+        path = os.path.join(self.root, POINTER_FILE)
+        stat = os.stat(path)
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if self._pointer is None or stamp != self._pointer_stamp:
+            with open(path, "r", encoding="utf-8") as f:
+                self._pointer = json.load(f)
+            self._pointer_stamp = stamp
+        return self._pointer
+
+    def _write_pointer(self, pointer: dict) -> None:
+        _write_json_atomic(os.path.join(self.root, POINTER_FILE), pointer)
+        self._pointer = None
+
+    # --- Generaciones ---
+
+    def create_generation(self, model: str, dim: int) -> Generation:
+        """Crea (o abre) la generación de ``model`` con ``dim`` dimensiones."""
+        name = generation_name(model, dim)
+        path = os.path.join(self.root, name)
+        meta_path = os.path.join(path, GENERATION_FILE)
+        if not os.path.exists(meta_path):
+            os.makedirs(path, exist_ok=True)
+            _write_json_atomic(meta_path, {"model": model, "dim": int(dim), "created_at": time.time()})
+        return self.generation(name)
+
+    def generation(self, name: str) -> Generation:
+        with self._lock:
+            generation = self._generations.get(name)
+            if generation is None:
+                path = os.path.join(self.root, name)
+                with open(os.path.join(path, GENERATION_FILE), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                generation = Generation(name, meta["model"], int(meta["dim"]), ShardedEmbeddingStore(path, int(meta["dim"])))
+                self._generations[name] = generation
+            return generation
+
+    def generation_names(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.root)
+            if name.startswith(GENERATION_PREFIX) and os.path.exists(os.path.join(self.root, name, GENERATION_FILE))
+        )
+
+    def active(self) -> Generation:
+        """Generación desde la que se sirven las búsquedas."""
+        return self.generation(self._read_pointer()["active"])
+
+    def backfill(self) -> Optional[Generation]:
+        name = self._read_pointer().get("backfill")
+        return self.generation(name) if name else None
+
+    def write_generations(self) -> List[Generation]:
+        """Generaciones que deben recibir cada escritura nueva: la activa y, si hay, la que se rellena."""
+        generations = [self.active()]
+        backfill = self.backfill()
+        if backfill is not None:
+            generations.append(backfill)
+        return generations
+
+    # --- Migración ---
+
+    def start_backfill(self, model: str, dim: int) -> Generation:
+        """Empieza (o retoma) el relleno de una generación nueva sin tocar la activa."""
+        pointer = dict(self._read_pointer())
+        generation = self.create_generation(model, dim)
+        if generation.name == pointer["active"]:
+            raise ValueError(f"La generación '{generation.name}' ya es la activa")
+        if pointer.get("backfill") not in (None, generation.name):
+            raise ValueError(f"Ya hay otra generación en relleno: '{pointer['backfill']}'")
+        pointer["backfill"] = generation.name
+        self._write_pointer(pointer)
+        return generation
+
+    def cut_over(self) -> Generation:
+        """Publica la generación rellenada como activa (reemplazo atómico de ``ACTIVE``)."""
+        pointer = self._read_pointer()
+        if not pointer.get("backfill"):
+            raise ValueError("No hay ninguna generación en relleno")
+        self._write_pointer({"active": pointer["backfill"], "backfill": None, "previous": pointer["active"]})
+        return self.active()
+
+    def abort_backfill(self) -> None:
+        pointer = dict(self._read_pointer())
+        pointer["backfill"] = None
+        self._write_pointer(pointer)
+
+    def drop_generation(self, name: str) -> None:
+        """Borra una generación que ya no está activa ni en relleno."""
+        pointer = self._read_pointer()
+        if name in (pointer["active"], pointer.get("backfill")):
+            raise ValueError(f"No se puede borrar la generación en uso '{name}'")
+        with self._lock:
+            generation = self._generations.pop(name, None)
+        if generation is not None:
+            generation.store.close()
+        if pointer.get("previous") == name:
+            self._write_pointer({**pointer, "previous": None})
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    # --- Mantenimiento ---
+
+    def close(self) -> None:
+        with self._lock:
+            for generation in self._generations.values():
+                generation.store.close()
+
+    def compact_if_needed(self, min_log_bytes: int, max_tombstone_ratio: Optional[float] = None) -> bool:
+        compacted = False
+        for generation in self.write_generations():
+            compacted = generation.store.compact_if_needed(min_log_bytes, max_tombstone_ratio) or compacted
+        return compacted
+
+
+_generational_stores: Dict[str, GenerationalEmbeddingStore] = {}
+_generational_stores_lock = threading.Lock()
+
+
+def get_generational_store(root: str, default_model: str, default_dim: int) -> GenerationalEmbeddingStore:
+    """Devuelve la instancia compartida del almacén versionado para este proceso."""
+    with _generational_stores_lock:
+        store = _generational_stores.get(root)
+        if store is None:
+            store = GenerationalEmbeddingStore(root, default_model, default_dim)
+            _generational_stores[root] = store
+        return store
@@ -0,0 +1,232 @@
+""" Almacén binario de embeddings basado en una matriz float32 mapeable en memoria
+"""
+import json
+import os
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 2
+VECTORS_FILE = "vectors.f32"
+ROWS_FILE = "rows.bin"
+META_FILE = "meta.json"
+
+VECTOR_DTYPE = np.dtype("<f4")
+# Filas por bloque en la búsqueda por bloques: 4096 x 768 float32 = 12 MB
+DEFAULT_BLOCK_ROWS = 4096
+# Hash hexadecimal (ASCII): los campos S de numpy recortan bytes nulos finales
+TEXT_HASH_SIZE = 32
+MODEL_NAME_SIZE = 40
+# Metadatos de cada fila: id de la entrada, hash del texto embebido y modelo usado
+ROW_DTYPE = np.dtype([
+    ("entry_id", "<i8"),
+    ("text_hash", f"S{TEXT_HASH_SIZE}"),
+    ("model", f"S{MODEL_NAME_SIZE}"),
+])
+
+
+def make_rows(entry_ids: Iterable[int], text_hashes: Optional[Iterable[bytes]] = None, models: Optional[Iterable[str]] = None) -> np.ndarray:
+    """Construye el arreglo estructurado de metadatos para ``append_many``."""
+    entry_ids = list(entry_ids)
+    rows = np.zeros(len(entry_ids), dtype=ROW_DTYPE)
+    rows["entry_id"] = entry_ids
+    if text_hashes is not None:
+        rows["text_hash"] = list(text_hashes)
+    if models is not None:
+        rows["model"] = [model.encode("ascii") for model in models]
+    return rows
+
+
+class EmbeddingMatrixStore:
+    """
+    Almacén de embeddings en un directorio con tres archivos:
+
+    - ``vectors.f32``: matriz contigua ``(filas, dim)`` en float32 little-endian.
+    - ``rows.bin``: metadatos de cada fila (``ROW_DTYPE``), en el mismo orden.
+    - ``meta.json``: dimensión y versión del formato.
+
+    Añadir un vector es O(1): se escribe una fila al final de cada archivo.
+    Si un ``entry_id`` se añade dos veces, la fila más reciente es la válida.
+    Los lectores abren la matriz con ``np.memmap``, sin copiarla a memoria.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._index: Optional[Dict[int, int]] = None
+        self._indexed_rows = 0
+        self._mmap: Optional[np.memmap] = None
+
+    # --- Apertura / creación ---
+
+    @classmethod
+    def create(cls, path: str, dim: int) -> "EmbeddingMatrixStore":
+        """Crea un almacén vacío. Falla si el directorio ya contiene uno."""
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            raise FileExistsError(f"Ya existe un almacén de embeddings en '{path}'")
+        for name in (VECTORS_FILE, ROWS_FILE):
+            open(os.path.join(path, name), "ab").close()
+        _write_json_atomic(meta_path, {"format_version": FORMAT_VERSION, "dim": dim})
+        return cls(path, dim)
+
+    @classmethod
+    def open(cls, path: str) -> "EmbeddingMatrixStore":
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Versión de formato no soportada en '{path}': {meta.get('format_version')}. "
+                "Vuelve a generarlo con convertir_embeddings.py o generar_embeddings.py."
+            )
+        return cls(path, int(meta["dim"]))
+
+    @classmethod
+    def open_or_create(cls, path: str, dim: int) -> "EmbeddingMatrixStore":
+        if os.path.exists(os.path.join(path, META_FILE)):
+            store = cls.open(path)
+            if store.dim != dim:
+                raise ValueError(f"El almacén '{path}' tiene dimensión {store.dim}, se recibió {dim}")
+            return store
+        return cls.create(path, dim)
+
+    # --- Escritura ---
+
+    def append(self, entry_id: int, vector: Iterable[float], text_hash: bytes = b"", model: str = "") -> int:
+        """Añade un vector al final del almacén y devuelve su número de fila."""
+        matrix = np.asarray(vector, dtype=VECTOR_DTYPE).reshape(1, -1)
+        return self.append_many(make_rows([entry_id], [text_hash], [model]), matrix)
+
+    def append_many(self, rows: np.ndarray, vectors: np.ndarray) -> int:
+        """
+        Añade varias filas de una vez. ``rows`` es un arreglo ``ROW_DTYPE``
+        (ver ``make_rows``). Devuelve el número de la última fila escrita.
+
+        Los vectores se escriben antes que los metadatos: si el proceso muere entre
+        ambas escrituras, la fila incompleta queda fuera porque ``len()`` usa el mínimo.
+        """
+        rows = np.ascontiguousarray(rows, dtype=ROW_DTYPE)
+        matrix = np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE)
+        if matrix.ndim != 2 or matrix.shape[1] != self.dim:
+            raise ValueError(f"Se esperaban vectores de dimensión {self.dim}, se recibió {matrix.shape}")
+        if matrix.shape[0] != rows.shape[0]:
+            raise ValueError("La cantidad de filas y de vectores no coincide")
+
+        start = len(self)
+        # Recorta restos de una escritura interrumpida antes de añadir
+        self._truncate_to(start)
+        _append_bytes(os.path.join(self.path, VECTORS_FILE), matrix.tobytes())
+        _append_bytes(os.path.join(self.path, ROWS_FILE), rows.tobytes())
+
+        if self._index is not None and self._indexed_rows == start:
+            for offset, entry_id in enumerate(rows["entry_id"].tolist()):
+                self._index[entry_id] = start + offset
+            self._indexed_rows = start + len(rows)
+        return start + len(rows) - 1
+
+    # --- Lectura ---
+
+    def __len__(self) -> int:
+        vectors_size = os.path.getsize(os.path.join(self.path, VECTORS_FILE))
+        rows_size = os.path.getsize(os.path.join(self.path, ROWS_FILE))
+        return min(vectors_size // (VECTOR_DTYPE.itemsize * self.dim), rows_size // ROW_DTYPE.itemsize)
+
+    def vectors(self) -> np.ndarray:
+        """Matriz ``(filas, dim)`` mapeada en memoria (solo lectura, sin copia)."""
+        rows = len(self)
+        if rows == 0:
+            return np.empty((0, self.dim), dtype=VECTOR_DTYPE)
+        if self._mmap is None or self._mmap.shape[0] != rows:
+            self._mmap = np.memmap(
+                os.path.join(self.path, VECTORS_FILE),
+                dtype=VECTOR_DTYPE,
+                mode="r",
+                shape=(rows, self.dim),
+            )
+        return self._mmap
+
+    def iter_blocks(self, block_rows: int = DEFAULT_BLOCK_ROWS) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        Recorre el almacén en bloques ``(fila inicial, entry_ids, vectores)`` de
+        hasta ``block_rows`` filas, leídos de los archivos en búferes reutilizados.
+
+        A diferencia de recorrer el memmap (o de cargar ``ids()``), las páginas
+        leídas no quedan mapeadas en el proceso: la memoria usada es la de un
+        bloque, sea cual sea el tamaño del almacén. Cada bloque solo es válido
+        hasta pedir el siguiente.
+        """
+        rows = len(self)
+        if rows == 0:
+            return
+        vectors = np.empty((min(block_rows, rows), self.dim), dtype=VECTOR_DTYPE)
+        metadata = np.empty(min(block_rows, rows), dtype=ROW_DTYPE)
+        with open(os.path.join(self.path, VECTORS_FILE), "rb", buffering=0) as vectors_file, \
+                open(os.path.join(self.path, ROWS_FILE), "rb", buffering=0) as rows_file:
+            for start in range(0, rows, block_rows):
+                count = min(block_rows, rows - start)
+                self._read_block(vectors_file, vectors[:count])
+                self._read_block(rows_file, metadata[:count])
+                yield start, metadata["entry_id"][:count], vectors[:count]
+
+    def _read_block(self, f, block: np.ndarray) -> None:
+        view = memoryview(block).cast("B")
+        filled = 0
+        while filled < len(view):
+            read = f.readinto(view[filled:])
+            if not read:
+                raise EOFError(f"Los archivos de '{self.path}' terminaron antes de lo esperado")
+            filled += read
+
+    def rows(self) -> np.ndarray:
+        """Metadatos (``ROW_DTYPE``) de cada fila, incluidas las filas reemplazadas."""
+        return np.fromfile(os.path.join(self.path, ROWS_FILE), dtype=ROW_DTYPE, count=len(self))
+
+    def ids(self) -> np.ndarray:
+        """``entry_id`` de cada fila, incluidas las filas reemplazadas."""
+        return self.rows()["entry_id"]
+
+    def index(self) -> Dict[int, int]:
+        """Índice ``entry_id -> fila vigente`` (la última escrita para cada id)."""
+        rows = len(self)
+        if self._index is None or self._indexed_rows != rows:
+            ids = self.ids()
+            self._index = {entry_id: row for row, entry_id in enumerate(ids.tolist())}
+            self._indexed_rows = rows
+        return self._index
+
+    def live_rows(self) -> np.ndarray:
+        """Números de fila vigentes, ordenados."""
+        return np.fromiter(sorted(self.index().values()), dtype=np.int64)
+
+    def get(self, entry_id: int) -> Optional[np.ndarray]:
+        row = self.index().get(int(entry_id))
+        if row is None:
+            return None
+        return np.array(self.vectors()[row])
+
+    def __contains__(self, entry_id: int) -> bool:
+        return int(entry_id) in self.index()
+
+    def _truncate_to(self, rows: int) -> None:
+        for name, size in ((VECTORS_FILE, rows * VECTOR_DTYPE.itemsize * self.dim), (ROWS_FILE, rows * ROW_DTYPE.itemsize)):
+            file_path = os.path.join(self.path, name)
+            if os.path.getsize(file_path) > size:
+                with open(file_path, "r+b") as f:
+                    f.truncate(size)
+
+
+def _append_bytes(file_path: str, data: bytes) -> None:
+    with open(file_path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_json_atomic(file_path: str, data: dict) -> None:
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
@@ -0,0 +1,64 @@
+""" Cliente del proveedor de embeddings (Gemini)
+"""
+import os
+from typing import List, Optional
+
+import google.generativeai as genai
+import numpy as np
+from dotenv import load_dotenv
+
+from app.embeddings._matrix_store import VECTOR_DTYPE
+
+# Límite de textos por llamada a batchEmbedContents
+MAX_BATCH_SIZE = 100
+
+
+def configure_gemini() -> None:
+    """
+    Configura la librería de Gemini con ``GEMINI_API_KEY``.
+
+    Si ``GEMINI_API_ENDPOINT`` está definida (p. ej. ``localhost:8089``), las
+    llamadas van por REST a ese endpoint. Sirve para usar un servidor falso
+    local en pruebas de carga sin consumir cuota.
+    """
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("No se encontró la variable de entorno GEMINI_API_KEY.")
+    api_endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    if api_endpoint:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": api_endpoint})
+    else:
+        genai.configure(api_key=api_key)
+
+
+class GeminiEmbeddingProvider:
+    """Genera embeddings con ``genai.embed_content`` usando su forma por lotes."""
+
+    def __init__(self, model: str, output_dimensionality: Optional[int] = None):
+        self.model = model
+        self.output_dimensionality = output_dimensionality
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        """
+        Devuelve una matriz ``(len(texts), dim)`` en float32.
+        Con más de un texto se hace una sola llamada batch (máx. ``MAX_BATCH_SIZE``).
+        """
+        if not texts:
+            raise ValueError("No se recibieron textos para generar embeddings")
+        if len(texts) > MAX_BATCH_SIZE:
+            raise ValueError(f"Un lote admite como máximo {MAX_BATCH_SIZE} textos, se recibieron {len(texts)}")
+        kwargs = {}
+        if self.output_dimensionality:
+            kwargs["output_dimensionality"] = self.output_dimensionality
+        result = genai.embed_content(
+            model=self.model,
+            content=texts if len(texts) > 1 else texts[0],
+            task_type=task_type,
+            **kwargs,
+        )
+        embedding = result["embedding"]
+        matrix = np.asarray(embedding if len(texts) > 1 else [embedding], dtype=VECTOR_DTYPE)
+        if matrix.shape[0] != len(texts):
+            raise ValueError(f"El proveedor devolvió {matrix.shape[0]} embeddings para {len(texts)} textos")
+        return matrix
@@ -0,0 +1,157 @@
+""" Almacenamiento cuantizado de embeddings (float16 / int8) y búsqueda con re-puntuación exacta
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._matrix_store import VECTOR_DTYPE
+from app.embeddings._scoring import top_k
+
+QUANTIZATION_MODES = ("float32", "float16", "int8")
+
+# Filas por bloque al cuantizar: evita materializar la matriz float32 completa
+_QUANTIZE_CHUNK_ROWS = 512
+
+# Bytes del bloque float32 al puntuar: cabe en la caché L2 y se reutiliza en
+# cada bloque, así la conversión no escribe ni relee memoria principal
+_SCORE_BLOCK_BYTES = 768 * 1024
+
+
+class QuantizedMatrix:
+    """
+    Matriz de embeddings en una representación compacta residente en memoria.
+
+    - ``float32``: sin cuantizar (referencia).
+    - ``float16``: la mitad de memoria; error relativo ~1e-3.
+    - ``int8``: un cuarto de memoria. Cuantización escalar simétrica por vector:
+      ``x ≈ q * scale`` con ``scale = max(|x|) / 127`` guardado por fila.
+
+    La ganancia es de memoria, no de latencia: numpy no tiene productos en
+    float16 ni int8 acelerados por BLAS, así que puntuar convierte cada bloque
+    a float32. Con los vectores float32 en RAM la pasada int8 cuesta
+    aproximadamente lo mismo que la exacta y la float16 bastante más (ver
+    ``benchmarks/quantization_recall.py``).
+    """
+
+    def __init__(self, mode: str, data: np.ndarray, scales: Optional[np.ndarray] = None):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Modo de cuantización no soportado: {mode}")
+        self.mode = mode
+        self.data = data
+        self.scales = scales
+
+    @classmethod
+    def from_float32(cls, matrix: np.ndarray, mode: str) -> "QuantizedMatrix":
+        """Cuantiza ``matrix`` por bloques (sirve también para matrices mapeadas en memoria)."""
+        rows, dim = matrix.shape
+        if mode == "float32":
+            return cls(mode, np.ascontiguousarray(matrix, dtype=VECTOR_DTYPE))
+        if mode == "float16":
+            data = np.empty((rows, dim), dtype=np.float16)
+            for start in range(0, rows, _QUANTIZE_CHUNK_ROWS):
+                data[start:start + _QUANTIZE_CHUNK_ROWS] = matrix[start:start + _QUANTIZE_CHUNK_ROWS]
+            return cls(mode, data)
+        if mode == "int8":
+            data = np.empty((rows, dim), dtype=np.int8)
+            scales = np.empty(rows, dtype=VECTOR_DTYPE)
+            for start in range(0, rows, _QUANTIZE_CHUNK_ROWS):
+                chunk = np.asarray(matrix[start:start + _QUANTIZE_CHUNK_ROWS], dtype=VECTOR_DTYPE)
+                chunk_scales = np.abs(chunk).max(axis=1) / 127.0
+                chunk_scales[chunk_scales == 0] = 1.0
+                data[start:start + len(chunk)] = np.clip(np.rint(chunk / chunk_scales[:, None]), -127, 127)
+                scales[start:start + len(chunk)] = chunk_scales
+            return cls(mode, data, scales)
+        raise ValueError(f"Modo de cuantización no soportado: {mode}")
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Productos punto aproximados de cada fila con ``query`` (float32)."""
+        query = np.asarray(query, dtype=VECTOR_DTYPE)
+        if self.mode == "float32":
+            return self.data @ query
+        rows, dim = self.data.shape
+        block_rows = max(1, _SCORE_BLOCK_BYTES // (dim * VECTOR_DTYPE.itemsize))
+        block = np.empty((min(block_rows, rows), dim), dtype=VECTOR_DTYPE)
+        scores = np.empty(rows, dtype=VECTOR_DTYPE)
+        for start in range(0, rows, block_rows):
+            codes = self.data[start:start + block_rows]
+            converted = block[:len(codes)]
+            np.copyto(converted, codes)
+            np.matmul(converted, query, out=scores[start:start + len(codes)])
+        # En int8 se puntúan los códigos enteros (exactos en float32) y la escala se aplica una vez por fila
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    # --- Persistencia junto al snapshot ---
+
+    def save(self, directory: str) -> None:
+        _save_npy_atomic(os.path.join(directory, f"quantized-{self.mode}.npy"), self.data)
+        if self.scales is not None:
+            _save_npy_atomic(os.path.join(directory, f"quantized-{self.mode}-scales.npy"), self.scales)
+
+    @classmethod
+    def load(cls, directory: str, mode: str, rows: int) -> Optional["QuantizedMatrix"]:
+        """Carga la versión cuantizada guardada, o ``None`` si no existe o está desactualizada."""
+        data_path = os.path.join(directory, f"quantized-{mode}.npy")
+        if not os.path.exists(data_path):
+            return None
+        data = np.load(data_path)
+        scales = None
+        if mode == "int8":
+            scales_path = os.path.join(directory, f"quantized-{mode}-scales.npy")
+            if not os.path.exists(scales_path):
+                return None
+            scales = np.load(scales_path)
+        if data.shape[0] != rows:
+            return None
+        return cls(mode, data, scales)
+
+
+def quantized_top_k(
+    quantized: QuantizedMatrix,
+    full_vectors: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    rescore_factor: int = 4,
+    invalid_rows: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Búsqueda en dos fases: una primera pasada sobre ``quantized`` selecciona
+    ``k * rescore_factor`` candidatos y solo esos se re-puntúan en precisión
+    completa leyendo sus filas de ``full_vectors`` (p. ej. el memmap float32):
+    solo la copia cuantizada tiene que estar residente.
+
+    Args:
+        invalid_rows: Máscara booleana de filas a excluir (reemplazadas o borradas).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Filas y puntuaciones exactas, de mayor a menor.
+    """
+    query = np.asarray(query, dtype=VECTOR_DTYPE)
+    approximate = quantized.scores(query)
+    if invalid_rows is not None:
+        approximate[invalid_rows] = -np.inf
+    if quantized.mode == "float32":
+        rows, scores = top_k(approximate, k)
+        keep = np.isfinite(scores)
+        return rows[keep], scores[keep]
+
+    candidates, candidate_scores = top_k(approximate, k * rescore_factor)
+    candidates = np.sort(candidates[np.isfinite(candidate_scores)])
+    exact = np.asarray(full_vectors[candidates], dtype=VECTOR_DTYPE) @ query
+    order, scores = top_k(exact, k)
+    return candidates[order], scores
+
+
+def _save_npy_atomic(path: str, array: np.ndarray) -> None:
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
@@ -0,0 +1,99 @@
+""" Caché de embeddings de consultas (RETRIEVAL_QUERY) para el tráfico de búsqueda
+"""
+import os
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.embeddings._cache import normalize_text
+from app.utils.cache import LRUCache, SingleFlight
+
+DEFAULT_QUERY_CACHE_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_ENTRIES", "20000"))
+DEFAULT_QUERY_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", str(24 * 60 * 60)))
+
+
+def query_key(text: str) -> str:
+    """Consultas que solo difieren en mayúsculas o espacios comparten embedding."""
+    return normalize_text(text).casefold()
+
+
+class QueryEmbeddingCache:
+    """
+    Caché acotada (LRU + TTL) de embeddings de consultas de un modelo.
+
+    Las consultas concurrentes idénticas comparten una sola llamada al
+    proveedor (``SingleFlight``). ``stats()`` expone la tasa de aciertos y el
+    tiempo ahorrado, estimado con la latencia media de las llamadas reales.
+    """
+
+    def __init__(self, provider, max_entries: int = DEFAULT_QUERY_CACHE_ENTRIES, ttl_seconds: float = DEFAULT_QUERY_CACHE_TTL):
+        self.provider = provider
+        self.model = provider.model
+        self.cache = LRUCache(max_entries, ttl_seconds)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+
+    def embed(self, query: str) -> np.ndarray:
+        key = query_key(query)
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector
+        return self._flight.do(key, lambda: self._embed_upstream(key, query))
+
+    def embed_many(self, queries: List[str]) -> np.ndarray:
+        """
+        Embeddings de un lote de consultas, ``(len(queries), dim)``. Las que no
+        están en caché se piden al proveedor en una sola llamada por lotes.
+        """
+        keys = [query_key(query) for query in queries]
+        vectors = {}
+        for key in dict.fromkeys(keys):
+            vector = self.cache.get(key)
+            if vector is not None:
+                vectors[key] = vector
+        pending = {}
+        for key, query in zip(keys, queries):
+            if key not in vectors and key not in pending:
+                pending[key] = query
+        if pending:
+            start = time.perf_counter()
+            matrix = self.provider.embed(list(pending.values()), task_type="RETRIEVAL_QUERY")
+            with self._lock:
+                self.upstream_calls += 1
+                self.upstream_seconds += time.perf_counter() - start
+            for key, vector in zip(pending, matrix):
+                vectors[key] = vector
+                self.cache.set(key, vector)
+        return np.stack([vectors[key] for key in keys])
+
+    def _embed_upstream(self, key: str, query: str) -> np.ndarray:
+        start = time.perf_counter()
+        vector = self.provider.embed([query], task_type="RETRIEVAL_QUERY")[0]
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += time.perf_counter() - start
+        self.cache.set(key, vector)
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        cache = self.cache.stats()
+        requests = cache["hits"] + cache["misses"]
+        average_latency = self.upstream_seconds / self.upstream_calls if self.upstream_calls else 0.0
+        # Cada acierto y cada consulta que se sumó a otra en vuelo evitó una llamada
+        avoided = cache["hits"] + self._flight.shared
+        return {
+            "model": self.model,
+            "entries": cache["entries"],
+            "hits": cache["hits"],
+            "misses": cache["misses"],
+            "expired": cache["expired"],
+            "single_flight_shared": self._flight.shared,
+            "hit_rate": avoided / requests if requests else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "avg_upstream_ms": 1000 * average_latency,
+            "saved_seconds": avoided * average_latency,
+        }
@@ -0,0 +1,185 @@
+""" Reconstrucción incremental de una generación de embeddings desde la base de datos
+"""
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List
+
+import numpy as np
+
+from app.embeddings._bulk import embed_texts_bulk
+from app.embeddings._generations import Generation
+from app.embeddings._matrix_store import _write_json_atomic
+from app.embeddings._texts import text_hash
+
+CHECKPOINT_FILE = 'rebuild.checkpoint.json'
+
+# Durante el proceso se compacta cada shard cuyo log supere este tamaño, para
+# que el log pendiente (y la memoria de quien lo lea) no crezca con el corpus
+DEFAULT_COMPACT_EVERY_BYTES = 256 * 1024 * 1024
+
+# Páginas de filas ordenadas por id a partir de un id (keyset). Cada fila
+# expone ``id`` y ``business_id``; el resto lo leen los constructores de texto y metadatos.
+PageIterator = Callable[[int, int], Iterable[List[Any]]]
+
+
+def checkpoint_path(generation: Generation) -> str:
+    return os.path.join(generation.store.root, CHECKPOINT_FILE)
+
+
+def load_checkpoint(generation: Generation) -> int:
+    """Devuelve el último id procesado por una ejecución interrumpida (0 si no hay)."""
+    if not os.path.exists(checkpoint_path(generation)):
+        return 0
+    with open(checkpoint_path(generation), 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("model") != generation.model:
+        return 0
+    return int(checkpoint["last_entry_id"])
+
+
+def save_checkpoint(generation: Generation, last_id: int):
+    _write_json_atomic(checkpoint_path(generation), {"model": generation.model, "last_entry_id": last_id})
+
+
+def rebuild_generation(
+    generation: Generation,
+    provider,
+    iter_pages: PageIterator,
+    build_text: Callable[[Any], str],
+    build_metadata: Callable[[Any], Any],
+    batch_size: int = 100,
+    max_concurrency: int = 4,
+    requests_per_minute: float = 1500,
+    page_size: int = 1000,
+    restart: bool = False,
+    compact_every_bytes: int = DEFAULT_COMPACT_EVERY_BYTES,
+    label: str = "entradas",
+) -> Dict[str, int]:
+    """
+    Sincroniza una generación con la base de datos, página a página:
+
+    - embebe solo las filas nuevas o cuyo texto (o modelo) cambió;
+    - actualiza sin volver a embeber los vectores cuyos metadatos cambiaron;
+    - borra los vectores de filas eliminadas o que cambiaron de negocio.
+
+    Guarda un checkpoint tras cada página para reanudar una ejecución
+    interrumpida y termina consolidando el log de cada shard. Devuelve los
+    totales (``rows``, ``embedded``, ``deleted``, ``failed``, ``metadata``).
+    """
+    store = generation.store
+    # Si una ejecución anterior se interrumpió, su log se consolida primero
+    store.compact_all()
+    # id -> (business_id, text_hash, model) de todo lo guardado, en todos los shards,
+    # y aparte los metadatos de filtro de cada vector
+    stored = {}
+    stored_metadata = {}
+    for business_id, fingerprints in store.iter_fingerprints():
+        for record_id, (stored_hash, stored_model, metadata) in fingerprints.items():
+            stored[record_id] = (business_id, stored_hash, stored_model)
+            stored_metadata[record_id] = metadata
+    # Ids guardados, ordenados: se recorren junto con las páginas para detectar borrados
+    stored_ids = np.sort(np.fromiter(stored.keys(), dtype=np.int64, count=len(stored)))
+
+    resume_after = 0 if restart else load_checkpoint(generation)
+    if resume_after:
+        print(f"Reanudando desde el checkpoint: id > {resume_after}")
+
+    totals = {"rows": 0, "embedded": 0, "deleted": 0, "failed": 0, "metadata": 0}
+    last_id = resume_after
+
+    print(f"Recorriendo la base de datos en páginas de {page_size} {label}...")
+    for page in iter_pages(resume_after, page_size):
+        page_last_id = page[-1].id
+        to_embed = []
+        page_rows = {}
+        # Vectores a borrar por negocio: filas eliminadas o que cambiaron de negocio
+        stale = {}
+        # Vectores válidos cuyos metadatos de filtro cambiaron (o se guardaron sin ellos)
+        metadata_updates = {}
+        for row in page:
+            text_to_embed = build_text(row)
+            row_hash = text_hash(text_to_embed)
+            metadata = build_metadata(row)
+            page_rows[row.id] = (row.business_id, row_hash, metadata)
+            previous = stored.get(row.id)
+            if previous is not None and previous[0] != row.business_id:
+                stale.setdefault(previous[0], []).append(row.id)
+            # Un vector sigue siendo válido si se generó con el mismo modelo a partir del mismo texto
+            if previous != (row.business_id, row_hash, generation.model):
+                to_embed.append((row.id, text_to_embed))
+            elif stored_metadata.get(row.id) != metadata:
+                metadata_updates.setdefault(row.business_id, []).append(row.id)
+
+        # Ids guardados dentro del rango de esta página que ya no existen en la base
+        in_range = stored_ids[
+            np.searchsorted(stored_ids, last_id, side="right"):np.searchsorted(stored_ids, page_last_id, side="right")
+        ]
+        deleted_ids = [int(record_id) for record_id in in_range if int(record_id) not in page_rows]
+        for record_id in deleted_ids:
+            stale.setdefault(stored[record_id][0], []).append(record_id)
+        for business_id, record_ids in stale.items():
+            store.delete_many(business_id, record_ids)
+        for business_id, record_ids in metadata_updates.items():
+            store.update_metadata(business_id, record_ids, [page_rows[record_id][2] for record_id in record_ids])
+            totals["metadata"] += len(record_ids)
+
+        def save_batch(record_ids, matrix):
+            # Cada lote terminado va directo al log del shard de cada negocio
+            rows_by_business = {}
+            for position, record_id in enumerate(record_ids):
+                rows_by_business.setdefault(page_rows[record_id][0], []).append(position)
+            for business_id, positions in rows_by_business.items():
+                store.replace_many(
+                    business_id,
+                    [record_ids[position] for position in positions],
+                    matrix[positions],
+                    [page_rows[record_ids[position]][1] for position in positions],
+                    [generation.model] * len(positions),
+                    [page_rows[record_ids[position]][2] for position in positions],
+                )
+
+        # Solo los textos que cambiaron van al modelo, varios por llamada
+        if to_embed:
+            report = embed_texts_bulk(
+                provider,
+                to_embed,
+                save_batch,
+                batch_size=batch_size,
+                max_concurrency=max_concurrency,
+                requests_per_minute=requests_per_minute,
+            )
+            totals["embedded"] += report.entries
+            totals["failed"] += len(report.failed_entry_ids)
+            if report.failed_entry_ids:
+                print(f"    ERROR: no se pudieron procesar {len(report.failed_entry_ids)} {label}: {report.failed_entry_ids}")
+            print(
+                f"  -> Página hasta id {page_last_id}: {report.entries} embeddings "
+                f"({report.entries_per_second:.1f} {label}/s, {report.retries} reintentos)."
+            )
+
+        totals["rows"] += len(page)
+        totals["deleted"] += len(deleted_ids)
+        last_id = page_last_id
+        save_checkpoint(generation, last_id)
+
+        store.compact_if_needed(compact_every_bytes)
+
+    # Ids guardados posteriores a la última fila de la base: también se borraron
+    trailing_ids = [int(record_id) for record_id in stored_ids[np.searchsorted(stored_ids, last_id, side="right"):]]
+    for record_id in trailing_ids:
+        store.delete(stored[record_id][0], record_id)
+    totals["deleted"] += len(trailing_ids)
+
+    # Consolidar el log de cada shard en un snapshot nuevo
+    store.close()
+    store.compact_all()
+    if os.path.exists(checkpoint_path(generation)):
+        os.remove(checkpoint_path(generation))
+
+    print(
+        f"\nProceso completado. {label.capitalize()}: {totals['rows']}; embeddings generados: {totals['embedded']}; "
+        f"eliminados: {totals['deleted']}; fallidos: {totals['failed']}; "
+        f"con metadatos de filtro actualizados: {totals['metadata']}."
+    )
+    print(f"Caché de embeddings: {provider.stats()}")
+    return totals
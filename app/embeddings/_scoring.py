@@ -0,0 +1,88 @@
+""" Utilidades de puntuación para búsqueda por similitud
+"""
+import heapq
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Índices y puntuaciones de los ``k`` mayores valores, de mayor a menor.
+    Usa ``argpartition`` (O(n)) y solo ordena los ``k`` seleccionados.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(scores.shape[0])
+    order = candidates[np.argsort(scores[candidates])[::-1]]
+    return order, scores[order]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ``top_k`` de cada fila de una matriz ``(consultas, candidatos)`` a la vez:
+    un solo ``argpartition`` por eje y un orden de ``k`` columnas por fila.
+    """
+    rows, columns = scores.shape
+    k = min(k, columns)
+    if k <= 0:
+        return np.empty((rows, 0), dtype=np.int64), np.empty((rows, 0), dtype=scores.dtype)
+    if k < columns:
+        candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+    else:
+        candidates = np.broadcast_to(np.arange(columns), (rows, columns))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def blocked_top_k(
+    blocks: Iterable[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]],
+    query: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ``top_k`` exacto sobre una matriz recorrida por bloques ``(ids, bloque, excluidas)``,
+    donde ``excluidas`` es una máscara de filas del bloque a omitir (o ``None``).
+
+    Cada bloque se puntúa entero y sus ``k`` mejores filas compiten con las
+    acumuladas en un heap de tamaño ``k``: la memoria es un bloque de
+    puntuaciones más ``k`` candidatos. Devuelve los ids y las puntuaciones,
+    de mayor a menor.
+    """
+    heap: List[Tuple[float, int]] = []
+    for ids, block, excluded in blocks:
+        scores = block @ query
+        if excluded is not None:
+            scores[excluded] = -np.inf
+        rows, best = top_k(scores, k)
+        for row, score in zip(rows.tolist(), best.tolist()):
+            if score == -np.inf:
+                break
+            if len(heap) < k:
+                heapq.heappush(heap, (score, int(ids[row])))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, int(ids[row])))
+            else:
+                # Las puntuaciones del bloque vienen ordenadas: las siguientes tampoco entran
+                break
+    heap.sort(reverse=True)
+    return (
+        np.fromiter((entry_id for _, entry_id in heap), dtype=np.int64, count=len(heap)),
+        np.fromiter((score for score, _ in heap), dtype=np.float32, count=len(heap)),
+    )
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Normaliza cada fila a norma L2 = 1 (las filas nulas quedan igual). Con
+    vectores normalizados, el producto punto es la similitud coseno.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
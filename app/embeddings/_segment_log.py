@@ -0,0 +1,279 @@
+""" Log de segmentos append-only para escrituras concurrentes de embeddings
+"""
+import fcntl
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._filters import EntryMetadata
+from app.embeddings._matrix_store import MODEL_NAME_SIZE, TEXT_HASH_SIZE, VECTOR_DTYPE
+
+# Tipos de registro
+OP_ADD = 1
+OP_REPLACE = 2
+OP_TOMBSTONE = 3
+
+SEGMENT_PREFIX = "seg-"
+SEGMENT_SUFFIX = ".log"
+SEALED_SUFFIX = ".sealed"
+LOG_LOCK_FILE = "log.lock"
+
+# Cabecera: magic, op, seq, entry_id, hash del texto, modelo, longitud del payload
+_MAGIC = 0x454D4233  # "EMB3": la cabecera sigue con la longitud de los metadatos
+_MAGIC_V2 = 0x454D4232  # "EMB2": registros sin metadatos, se siguen leyendo
+_HEADER = struct.Struct(f"<IBqq{TEXT_HASH_SIZE}s{MODEL_NAME_SIZE}sI")
+_METADATA_LENGTH = struct.Struct("<I")
+_CRC = struct.Struct("<I")
+
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class LogRecord:
+    op: int
+    seq: int
+    entry_id: int
+    vector: Optional[np.ndarray]
+    text_hash: bytes = b""
+    model: str = ""
+    # Categorías y content_type de la entrada (None en registros escritos sin ellos)
+    metadata: Optional[EntryMetadata] = None
+    # Ubicación del vector dentro del segmento, para leerlo más tarde sin cargarlo
+    segment_path: str = ""
+    vector_offset: int = 0
+    vector_length: int = 0
+
+
+def encode_record(
+    op: int,
+    seq: int,
+    entry_id: int,
+    vector: Optional[np.ndarray],
+    text_hash: bytes = b"",
+    model: str = "",
+    metadata: Optional[EntryMetadata] = None,
+) -> bytes:
+    payload = b"" if vector is None else np.ascontiguousarray(vector, dtype=VECTOR_DTYPE).tobytes()
+    encoded_metadata = b"" if metadata is None else metadata.encode()
+    body = (
+        _HEADER.pack(_MAGIC, op, seq, entry_id, text_hash, model.encode("ascii"), len(payload))
+        + _METADATA_LENGTH.pack(len(encoded_metadata))
+        + payload
+        + encoded_metadata
+    )
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def read_records(path: str, start: int = 0, end: Optional[int] = None, load_vectors: bool = True) -> Tuple[List[LogRecord], int]:
+    """
+    Lee los registros completos de un segmento entre ``start`` y ``end``.
+
+    Devuelve la lista de registros y el offset donde termina el último registro
+    completo. Un registro a medio escribir o corrupto detiene la lectura. Se lee
+    registro a registro; con ``load_vectors=False`` los vectores no se guardan en
+    memoria y se recuperan después con ``read_vector``.
+    """
+    records: List[LogRecord] = []
+    pos = start
+    with open(path, "rb") as f:
+        f.seek(start)
+        while end is None or pos + _HEADER.size <= end:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            magic, op, seq, entry_id, text_hash, model, length = _HEADER.unpack(header)
+            if magic not in (_MAGIC, _MAGIC_V2):
+                break
+            if magic == _MAGIC:
+                extra = f.read(_METADATA_LENGTH.size)
+                if len(extra) < _METADATA_LENGTH.size:
+                    break
+                metadata_length = _METADATA_LENGTH.unpack(extra)[0]
+            else:
+                extra, metadata_length = b"", 0
+            vector_offset = pos + _HEADER.size + len(extra)
+            record_end = vector_offset + length + metadata_length + _CRC.size
+            if end is not None and record_end > end:
+                break
+            payload = f.read(length)
+            encoded_metadata = f.read(metadata_length)
+            crc_bytes = f.read(_CRC.size)
+            if len(payload) < length or len(encoded_metadata) < metadata_length or len(crc_bytes) < _CRC.size:
+                break
+            crc = zlib.crc32(encoded_metadata, zlib.crc32(payload, zlib.crc32(extra, zlib.crc32(header))))
+            if _CRC.unpack(crc_bytes)[0] != crc:
+                break
+            vector = None
+            if length and load_vectors:
+                vector = np.frombuffer(payload, dtype=VECTOR_DTYPE)
+            records.append(LogRecord(
+                op, seq, entry_id, vector,
+                text_hash.rstrip(b"\0"), model.rstrip(b"\0").decode("ascii"),
+                EntryMetadata.decode(encoded_metadata) if metadata_length else None,
+                path, vector_offset, length,
+            ))
+            pos = record_end
+    return records, pos
+
+
+def read_vector(record: LogRecord) -> np.ndarray:
+    """Lee del segmento el vector de un registro leído con ``load_vectors=False``."""
+    with open(record.segment_path, "rb") as f:
+        f.seek(record.vector_offset)
+        return np.frombuffer(f.read(record.vector_length), dtype=VECTOR_DTYPE)
+
+
+_SEQ = struct.Struct("<q")
+
+
+@contextmanager
+def log_lock(log_dir: str) -> Iterator[int]:
+    """
+    Bloqueo exclusivo entre procesos para escribir registros o fijar offsets.
+    Devuelve el descriptor del archivo de bloqueo, que también guarda el último seq.
+    """
+    fd = os.open(os.path.join(log_dir, LOG_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield fd
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def next_seqs(lock_fd: int, count: int) -> int:
+    """
+    Reserva ``count`` números de secuencia consecutivos y devuelve el primero.
+    Debe llamarse con ``log_lock`` tomado: los seq crecen estrictamente entre
+    todos los procesos aunque el reloj retroceda.
+    """
+    data = os.pread(lock_fd, _SEQ.size, 0)
+    last_seq = _SEQ.unpack(data)[0] if len(data) == _SEQ.size else 0
+    first_seq = max(time.time_ns(), last_seq + 1)
+    os.pwrite(lock_fd, _SEQ.pack(first_seq + count - 1), 0)
+    return first_seq
+
+
+def list_segments(log_dir: str) -> List[str]:
+    return sorted(
+        name for name in os.listdir(log_dir)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def segment_is_sealed(log_dir: str, name: str) -> bool:
+    """
+    Un segmento está sellado si su escritor lo rotó (marca ``.sealed``) o si
+    ya nadie tiene su ``flock``: el escritor lo mantiene mientras el segmento
+    está abierto y el sistema lo libera si el proceso muere. No se usa el PID:
+    el almacén puede compartirse entre contenedores o máquinas, cada uno con
+    su propio espacio de PIDs. Debe llamarse con ``log_lock`` tomado.
+    """
+    if os.path.exists(os.path.join(log_dir, name + SEALED_SUFFIX)):
+        return True
+    try:
+        fd = os.open(os.path.join(log_dir, name), os.O_RDONLY)
+    except FileNotFoundError:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    finally:
+        # Cerrar el descriptor libera también el bloqueo de prueba
+        os.close(fd)
+    return True
+
+
+class SegmentWriter:
+    """
+    Escritor de un proceso. Cada proceso añade a su propio segmento con
+    ``O_APPEND``; el bloqueo ``log.lock`` solo se mantiene durante la escritura
+    de los registros, así que la latencia no depende del tamaño del almacén.
+    Mientras el segmento está abierto, el escritor tiene su ``flock``: así la
+    compactación sabe que sigue vivo (ver ``segment_is_sealed``).
+    """
+
+    def __init__(self, log_dir: str, segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES, fsync: bool = False):
+        self.log_dir = log_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._name: Optional[str] = None
+        self._pid: Optional[int] = None
+        self._size = 0
+
+    def append(
+        self,
+        op: int,
+        entry_id: int,
+        vector: Optional[np.ndarray] = None,
+        text_hash: bytes = b"",
+        model: str = "",
+        metadata: Optional[EntryMetadata] = None,
+    ) -> int:
+        """Escribe un registro y devuelve su número de secuencia."""
+        return self.append_many([(op, entry_id, vector, text_hash, model, metadata)])
+
+    def append_many(self, records: List[Tuple[int, int, Optional[np.ndarray], bytes, str, Optional[EntryMetadata]]]) -> int:
+        """
+        Escribe varios registros ``(op, entry_id, vector, text_hash, model, metadata)``
+        con una sola escritura y un solo bloqueo. Devuelve el seq del último.
+        """
+        with self._lock:
+            with log_lock(self.log_dir) as lock_fd:
+                # El segmento se crea y se bloquea dentro de log.lock: la compactación
+                # decide qué segmentos están sellados con ese mismo bloqueo
+                self._ensure_segment()
+                # El seq se toma dentro del bloqueo: el orden de los seq coincide
+                # con el orden real de escritura entre todos los procesos.
+                first_seq = next_seqs(lock_fd, len(records))
+                data = b"".join(
+                    encode_record(op, first_seq + offset, int(entry_id), vector, text_hash, model, metadata)
+                    for offset, (op, entry_id, vector, text_hash, model, metadata) in enumerate(records)
+                )
+                written = os.write(self._fd, data)
+                if self.fsync:
+                    os.fsync(self._fd)
+            self._size += written
+            if written != len(data):
+                name = self._name
+                self._seal()
+                raise OSError(f"Escritura incompleta en el segmento '{name}'")
+            if self._size >= self.segment_max_bytes:
+                self._seal()
+            return first_seq + len(records) - 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                self._seal()
+
+    def _ensure_segment(self) -> None:
+        # Tras un fork el hijo no debe escribir en el segmento del padre
+        if self._fd is not None and self._pid == os.getpid():
+            return
+        if self._fd is not None:
+            # Copia heredada del descriptor del padre: se cierra sin LOCK_UN,
+            # que liberaría también el bloqueo del padre
+            os.close(self._fd)
+        self._pid = os.getpid()
+        self._name = f"{SEGMENT_PREFIX}{self._pid}-{time.time_ns()}{SEGMENT_SUFFIX}"
+        self._fd = os.open(os.path.join(self.log_dir, self._name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._size = 0
+
+    def _seal(self) -> None:
+        # La marca va antes de cerrar: cerrar el descriptor libera el flock
+        open(os.path.join(self.log_dir, self._name + SEALED_SUFFIX), "wb").close()
+        os.close(self._fd)
+        self._fd = None
+        self._name = None
@@ -0,0 +1,274 @@
+""" Almacén de embeddings particionado por negocio (business_id)
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._ann import DEFAULT_NPROBE
+from app.embeddings._filters import EntryMetadata, SearchFilter
+from app.embeddings._matrix_store import DEFAULT_BLOCK_ROWS, VECTOR_DTYPE
+from app.embeddings._store import (
+    CURRENT_FILE,
+    EmbeddingStore,
+    compact_store,
+    initialize_store,
+    store_log_bytes,
+)
+
+SHARD_PREFIX = "business-"
+
+
+class ShardedEmbeddingStore:
+    """
+    Conjunto de almacenes ``EmbeddingStore`` independientes, uno por negocio::
+
+        <root>/business-12/   -> snapshot + log con los vectores del negocio 12
+        <root>/business-40/   -> ...
+
+    Una consulta de un negocio solo abre y recorre su propio shard. Los shards
+    se abren bajo demanda y se mantienen en un LRU de ``max_open_shards``; los
+    que llevan más de ``idle_seconds`` sin uso también se cierran, así la
+    memoria solo la ocupan los negocios activos.
+    """
+
+    def __init__(self, root: str, dim: int, max_open_shards: int = 256, idle_seconds: float = 15 * 60):
+        self.root = root
+        self.dim = dim
+        self.max_open_shards = max_open_shards
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # business_id -> (almacén, último uso)
+        self._open: "OrderedDict[int, Tuple[EmbeddingStore, float]]" = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+
+    # --- Shards ---
+
+    def shard_path(self, business_id: int) -> str:
+        return os.path.join(self.root, f"{SHARD_PREFIX}{int(business_id)}")
+
+    def has_shard(self, business_id: int) -> bool:
+        return os.path.exists(os.path.join(self.shard_path(business_id), CURRENT_FILE))
+
+    def business_ids(self) -> List[int]:
+        """Negocios con shard en disco (abiertos o no)."""
+        ids = []
+        for name in os.listdir(self.root):
+            if name.startswith(SHARD_PREFIX) and os.path.exists(os.path.join(self.root, name, CURRENT_FILE)):
+                ids.append(int(name[len(SHARD_PREFIX):]))
+        return sorted(ids)
+
+    def shard(self, business_id: int, create: bool = False) -> Optional[EmbeddingStore]:
+        """
+        Devuelve el shard del negocio, abriéndolo si hace falta y trayendo las
+        escrituras recientes de otros procesos. Sin ``create``, devuelve ``None``
+        si el negocio todavía no tiene vectores.
+        """
+        business_id = int(business_id)
+        with self._lock:
+            opened = self._open.get(business_id)
+            if opened is not None:
+                store = opened[0]
+                self._open[business_id] = (store, time.monotonic())
+                self._open.move_to_end(business_id)
+            else:
+                if not self.has_shard(business_id):
+                    if not create:
+                        return None
+                    initialize_store(self.shard_path(business_id), self.dim)
+                store = EmbeddingStore(self.shard_path(business_id))
+                self._open[business_id] = (store, time.monotonic())
+                self._evict_locked()
+        store.refresh()
+        return store
+
+    def evict(self, business_id: int) -> None:
+        """Cierra el shard de un negocio y libera su memoria."""
+        with self._lock:
+            opened = self._open.pop(int(business_id), None)
+        if opened is not None:
+            opened[0].close()
+
+    def evict_idle(self) -> None:
+        with self._lock:
+            self._evict_locked(force_idle=True)
+
+    def open_business_ids(self) -> List[int]:
+        return list(self._open.keys())
+
+    def _evict_locked(self, force_idle: bool = False) -> None:
+        now = time.monotonic()
+        while len(self._open) > self.max_open_shards:
+            _, (store, _) = self._open.popitem(last=False)
+            store.close()
+        if force_idle:
+            for business_id, (store, last_used) in list(self._open.items()):
+                if now - last_used > self.idle_seconds:
+                    del self._open[business_id]
+                    store.close()
+
+    # --- Escritura ---
+
+    def add(
+        self,
+        business_id: int,
+        entry_id: int,
+        vector: Iterable[float],
+        text_hash: bytes = b"",
+        model: str = "",
+        metadata: Optional[EntryMetadata] = None,
+    ) -> int:
+        return self.shard(business_id, create=True).add(entry_id, vector, text_hash, model, metadata)
+
+    def replace_many(
+        self,
+        business_id: int,
+        entry_ids: List[int],
+        vectors: np.ndarray,
+        text_hashes: List[bytes],
+        models: List[str],
+        metadata: Optional[List[Optional[EntryMetadata]]] = None,
+    ) -> int:
+        return self.shard(business_id, create=True).replace_many(entry_ids, vectors, text_hashes, models, metadata)
+
+    def update_metadata(self, business_id: int, entry_ids: List[int], metadata: List[EntryMetadata]) -> Optional[int]:
+        store = self.shard(business_id)
+        return store.update_metadata(entry_ids, metadata) if store is not None else None
+
+    def delete(self, business_id: int, entry_id: int) -> Optional[int]:
+        store = self.shard(business_id)
+        return store.delete(entry_id) if store is not None else None
+
+    def delete_many(self, business_id: int, entry_ids: List[int]) -> Optional[int]:
+        store = self.shard(business_id)
+        return store.delete_many(entry_ids) if store is not None else None
+
+    # --- Lectura ---
+
+    def search(
+        self,
+        business_id: int,
+        query: Iterable[float],
+        k: int = 10,
+        quantization: str = "float32",
+        rescore_factor: int = 4,
+        index: str = "exact",
+        nprobe: int = DEFAULT_NPROBE,
+        filters: Optional[SearchFilter] = None,
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Búsqueda limitada a los vectores de un negocio (ver ``EmbeddingStore.search``)."""
+        store = self.shard(business_id)
+        if store is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return store.search(query, k, quantization, rescore_factor, index, nprobe, filters, block_rows)
+
+    def search_many(
+        self,
+        business_id: int,
+        queries: np.ndarray,
+        k: int = 10,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Búsqueda por lotes en los vectores de un negocio (ver ``EmbeddingStore.search_many``)."""
+        store = self.shard(business_id)
+        if store is None:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(len(queries))]
+        return store.search_many(queries, k, filters)
+
+    def score(self, business_id: int, entry_ids: Iterable[int], query: Iterable[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Puntúa solo las entradas indicadas de un negocio (ver ``EmbeddingStore.score``)."""
+        store = self.shard(business_id)
+        if store is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return store.score(entry_ids, query)
+
+    def metadata(self, business_id: int, entry_ids: Iterable[int]) -> List[Optional[EntryMetadata]]:
+        """Metadatos de filtro de entradas de un negocio (ver ``EmbeddingStore.metadata``)."""
+        store = self.shard(business_id)
+        entry_ids = list(entry_ids)
+        return store.metadata(entry_ids) if store is not None else [None] * len(entry_ids)
+
+    def version(self, business_id: int) -> Optional[Tuple[str, int]]:
+        """Versión del shard de un negocio (ver ``EmbeddingStore.version``), o ``None`` si no tiene."""
+        store = self.shard(business_id)
+        return store.version() if store is not None else None
+
+    def iter_fingerprints(self) -> Iterator[Tuple[int, Dict[int, Tuple[bytes, str, Optional[EntryMetadata]]]]]:
+        """``(business_id, {entry_id: (text_hash, model, metadata)})`` de cada shard, sin dejarlos abiertos."""
+        for business_id in self.business_ids():
+            store = EmbeddingStore(self.shard_path(business_id))
+            yield business_id, store.fingerprints()
+
+    # --- Mantenimiento ---
+
+    def close(self) -> None:
+        with self._lock:
+            for store, _ in self._open.values():
+                store.close()
+
+    def compact_if_needed(self, min_log_bytes: int, max_tombstone_ratio: Optional[float] = None) -> bool:
+        """
+        Compacta cada shard cuyo log supere ``min_log_bytes`` o, con
+        ``max_tombstone_ratio``, cuyo índice IVF tenga demasiados tombstones;
+        cierra los shards inactivos. Los tombstones solo se miran en los shards
+        abiertos: los cerrados no reciben búsquedas y se revisan al reabrirse.
+        """
+        compacted = False
+        for business_id in self.business_ids():
+            path = self.shard_path(business_id)
+            with self._lock:
+                opened = self._open.get(business_id)
+            needed = store_log_bytes(path) >= min_log_bytes
+            if not needed and max_tombstone_ratio is not None and opened is not None:
+                needed = opened[0].needs_ann_rebuild(max_tombstone_ratio)
+            if needed and compact_store(path):
+                compacted = True
+                if opened is not None:
+                    opened[0].refresh()
+        self.evict_idle()
+        return compacted
+
+    def compact_all(self) -> None:
+        for business_id in self.business_ids():
+            compact_store(self.shard_path(business_id))
+
+
+def convert_json_to_sharded_store(json_path: str, root: str, business_of: Dict[int, int], model: str = "") -> Tuple[ShardedEmbeddingStore, List[int]]:
+    """
+    Convierte un archivo ``{entry_id: [floats]}`` (formato antiguo) en un almacén
+    particionado. El JSON no guarda el negocio de cada entrada, así que se recibe
+    en ``business_of``; las entradas sin negocio conocido (p. ej. borradas) se omiten.
+    El JSON tampoco guarda el hash del texto: la próxima reconstrucción incremental
+    volverá a generar estos vectores (la caché de embeddings evita repetir llamadas
+    cuando el texto coincide).
+
+    Returns:
+        Tuple[ShardedEmbeddingStore, List[int]]: El almacén y los entry_id omitidos.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data: Dict[str, list] = json.load(f)
+    if not data:
+        raise ValueError(f"El archivo '{json_path}' no contiene embeddings")
+
+    dim = len(next(iter(data.values())))
+    store = ShardedEmbeddingStore(root, dim)
+    by_business: Dict[int, List[int]] = {}
+    skipped: List[int] = []
+    for key in data:
+        entry_id = int(key)
+        if entry_id in business_of:
+            by_business.setdefault(business_of[entry_id], []).append(entry_id)
+        else:
+            skipped.append(entry_id)
+
+    for business_id, entry_ids in by_business.items():
+        vectors = np.asarray([data[str(entry_id)] for entry_id in entry_ids], dtype=VECTOR_DTYPE)
+        store.replace_many(business_id, entry_ids, vectors, [b""] * len(entry_ids), [model] * len(entry_ids))
+    store.close()
+    store.compact_all()
+    return store, skipped
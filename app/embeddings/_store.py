@@ -0,0 +1,807 @@
+""" Almacén de embeddings: snapshot compactado + log de segmentos append-only
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._ann import DEFAULT_MAX_TOMBSTONE_RATIO, DEFAULT_NPROBE, IVFIndex, build_ann_index
+from app.embeddings._filters import EntryMetadata, FilterColumns, SearchFilter
+from app.embeddings._matrix_store import DEFAULT_BLOCK_ROWS, VECTOR_DTYPE, EmbeddingMatrixStore, _write_json_atomic, make_rows
+from app.embeddings._quantization import QuantizedMatrix, quantized_top_k
+from app.embeddings._scoring import blocked_top_k, normalize_rows, top_k, top_k_rows
+from app.embeddings._segment_log import (
+    OP_ADD,
+    OP_REPLACE,
+    OP_TOMBSTONE,
+    SEALED_SUFFIX,
+    LogRecord,
+    SegmentWriter,
+    list_segments,
+    log_lock,
+    read_records,
+    read_vector,
+    segment_is_sealed,
+)
+
+CURRENT_FILE = "CURRENT"
+LOG_DIR = "log"
+COMPACT_LOCK_FILE = "compact.lock"
+SNAPSHOT_PREFIX = "snapshot-"
+
+# Filas copiadas por bloque al compactar, para no cargar todo el snapshot en memoria
+_COMPACTION_CHUNK_ROWS = 4096
+
+# Estado de una entrada en el log: (seq, vector, text_hash, model, metadata). vector None = tombstone
+OverlayEntry = Tuple[int, Optional[np.ndarray], bytes, str, Optional[EntryMetadata]]
+
+
+class EmbeddingStore:
+    """
+    Almacén de embeddings seguro para varios procesos escritores.
+
+    Estructura del directorio::
+
+        CURRENT            -> {"snapshot": "snapshot-000003", "offsets": {segmento: offset}}
+        snapshot-000003/   -> EmbeddingMatrixStore con una fila por entry_id vigente
+        log/seg-*.log      -> registros add / replace / tombstone de cada proceso
+
+    Las escrituras solo añaden un registro al segmento del proceso, por lo que
+    su costo es constante. Los vectores se guardan con norma 1. Los lectores
+    ven el snapshot más los registros del log posteriores a los offsets de
+    ``CURRENT``. ``compact()`` fusiona todo en un snapshot nuevo y lo publica
+    reemplazando ``CURRENT`` de forma atómica.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.log_dir = os.path.join(root, LOG_DIR)
+        self._lock = threading.RLock()
+        self._writer = SegmentWriter(self.log_dir)
+        self._current: Optional[dict] = None
+        self._snapshot: Optional[EmbeddingMatrixStore] = None
+        self._tail_offsets: Dict[str, int] = {}
+        self._overlay: Dict[int, OverlayEntry] = {}
+        self._live: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._view: Optional[Tuple[np.ndarray, Optional[np.ndarray], np.ndarray, np.ndarray, List[Optional[EntryMetadata]]]] = None
+        self._overlay_view: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, List[Optional[EntryMetadata]]]] = None
+        self._quantized: Dict[str, QuantizedMatrix] = {}
+        self._filters: Optional[FilterColumns] = None
+        self._ann: Optional[IVFIndex] = None
+        self._ann_loaded = False
+        # Lista IVF de las filas del log: entry_id -> (seq, lista), y la vista alineada con ``_view``
+        self._ann_assignments: Dict[int, Tuple[int, int]] = {}
+        self._overlay_lists: Optional[np.ndarray] = None
+        self.refresh()
+
+    # --- Apertura / creación ---
+
+    @classmethod
+    def open_or_create(cls, root: str, dim: int) -> "EmbeddingStore":
+        initialize_store(root, dim)
+        store = cls(root)
+        if store.dim != dim:
+            raise ValueError(f"El almacén '{root}' tiene dimensión {store.dim}, se recibió {dim}")
+        return store
+
+    @property
+    def dim(self) -> int:
+        return self._snapshot.dim
+
+    # --- Escritura ---
+
+    def add(self, entry_id: int, vector: Iterable[float], text_hash: bytes = b"", model: str = "", metadata: Optional[EntryMetadata] = None) -> int:
+        return self._writer.append(OP_ADD, entry_id, self._check_vector(vector), text_hash, model, metadata)
+
+    def replace(self, entry_id: int, vector: Iterable[float], text_hash: bytes = b"", model: str = "", metadata: Optional[EntryMetadata] = None) -> int:
+        return self._writer.append(OP_REPLACE, entry_id, self._check_vector(vector), text_hash, model, metadata)
+
+    def replace_many(
+        self,
+        entry_ids: List[int],
+        vectors: np.ndarray,
+        text_hashes: List[bytes],
+        models: List[str],
+        metadata: Optional[List[Optional[EntryMetadata]]] = None,
+    ) -> int:
+        """Escribe varios reemplazos con una sola escritura al log."""
+        matrix = self._check_matrix(vectors)
+        metadata = metadata if metadata is not None else [None] * len(entry_ids)
+        return self._writer.append_many([
+            (OP_REPLACE, entry_id, vector, text_hash, model, entry_metadata)
+            for entry_id, vector, text_hash, model, entry_metadata in zip(entry_ids, matrix, text_hashes, models, metadata)
+        ])
+
+    def update_metadata(self, entry_ids: List[int], metadata: List[EntryMetadata]) -> Optional[int]:
+        """
+        Reescribe los metadatos de filtro de entradas que ya tienen vector, sin
+        volver a embeberlas (p. ej. cambió su content_type). Las que no tienen
+        vector se omiten; devuelve el seq del último registro o ``None``.
+        """
+        records = []
+        with self._lock:
+            index = self._snapshot.index()
+            rows = self._snapshot.rows() if any(int(entry_id) not in self._overlay for entry_id in entry_ids) else None
+            vectors = self._snapshot.vectors()
+            for entry_id, entry_metadata in zip(entry_ids, metadata):
+                entry_id = int(entry_id)
+                if entry_id in self._overlay:
+                    _, vector, text_hash, model, _ = self._overlay[entry_id]
+                    if vector is None:
+                        continue
+                elif entry_id in index:
+                    row = index[entry_id]
+                    vector = np.array(vectors[row])
+                    text_hash, model = bytes(rows["text_hash"][row]), rows["model"][row].decode("ascii")
+                else:
+                    continue
+                records.append((OP_REPLACE, entry_id, vector, text_hash, model, entry_metadata))
+        return self._writer.append_many(records) if records else None
+
+    def delete(self, entry_id: int) -> int:
+        return self._writer.append(OP_TOMBSTONE, entry_id)
+
+    def delete_many(self, entry_ids: List[int]) -> int:
+        return self._writer.append_many([(OP_TOMBSTONE, entry_id, None, b"", "", None) for entry_id in entry_ids])
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def _check_vector(self, vector: Iterable[float]) -> np.ndarray:
+        return self._check_matrix(np.asarray(vector, dtype=VECTOR_DTYPE).reshape(1, -1))[0]
+
+    def _check_matrix(self, vectors: np.ndarray) -> np.ndarray:
+        # Se guardan normalizados: la búsqueda es un producto punto (= coseno) sin más cálculos
+        matrix = np.asarray(vectors, dtype=VECTOR_DTYPE)
+        if matrix.ndim != 2 or matrix.shape[1] != self.dim:
+            raise ValueError(f"Se esperaban vectores de dimensión {self.dim}, se recibió {matrix.shape}")
+        return normalize_rows(matrix)
+
+    # --- Lectura ---
+
+    def refresh(self) -> None:
+        """Incorpora registros nuevos del log y detecta compactaciones de otros procesos."""
+        with self._lock:
+            current = _read_current(self.root)
+            if self._current is None or current["snapshot"] != self._current["snapshot"]:
+                self._current = current
+                self._snapshot = EmbeddingMatrixStore.open(os.path.join(self.root, current["snapshot"]))
+                self._tail_offsets = dict(current["offsets"])
+                self._overlay = {}
+                self._live = None
+                self._view = None
+                self._overlay_view = None
+                self._quantized = {}
+                self._filters = None
+                self._ann = None
+                self._ann_loaded = False
+                self._ann_assignments = {}
+                self._overlay_lists = None
+
+            records: List[LogRecord] = []
+            for name in list_segments(self.log_dir):
+                start = self._tail_offsets.get(name, 0)
+                new_records, end = read_records(os.path.join(self.log_dir, name), start)
+                self._tail_offsets[name] = end
+                records.extend(new_records)
+            if records:
+                _apply_records(self._overlay, records)
+                self._live = None
+                self._view = None
+                self._overlay_view = None
+                self._overlay_lists = None
+
+    def version(self) -> Tuple[str, int]:
+        """
+        Identifica el contenido visible tras el último ``refresh``: cambia con
+        cada registro nuevo leído del log y con cada compactación.
+        """
+        with self._lock:
+            return self._current["snapshot"], sum(self._tail_offsets.values())
+
+    def get(self, entry_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            entry_id = int(entry_id)
+            if entry_id in self._overlay:
+                vector = self._overlay[entry_id][1]
+                return None if vector is None else np.array(vector)
+            return self._snapshot.get(entry_id)
+
+    def __contains__(self, entry_id: int) -> bool:
+        return self.get(entry_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.live()[0])
+
+    def fingerprints(self) -> Dict[int, Tuple[bytes, str, Optional[EntryMetadata]]]:
+        """``entry_id -> (text_hash, model, metadata)`` de cada entrada vigente."""
+        with self._lock:
+            rows = self._snapshot.rows()
+            columns = self._filter_columns()
+            fingerprints = {
+                int(rows["entry_id"][row]): (bytes(rows["text_hash"][row]), rows["model"][row].decode("ascii"), columns.metadata(row))
+                for row in self._snapshot.live_rows()
+            }
+            for entry_id, (_, vector, text_hash, model, metadata) in self._overlay.items():
+                if vector is None:
+                    fingerprints.pop(entry_id, None)
+                else:
+                    fingerprints[entry_id] = (text_hash, model, metadata)
+            return fingerprints
+
+    def metadata(self, entry_ids: Iterable[int]) -> List[Optional[EntryMetadata]]:
+        """Metadatos de filtro de cada entrada, en el orden recibido (``None`` si no tiene)."""
+        with self._lock:
+            index = self._snapshot.index()
+            columns = None
+            result = []
+            for entry_id in entry_ids:
+                entry_id = int(entry_id)
+                if entry_id in self._overlay:
+                    result.append(self._overlay[entry_id][4])
+                elif entry_id in index:
+                    columns = columns or self._filter_columns()
+                    result.append(columns.metadata(index[entry_id]))
+                else:
+                    result.append(None)
+            return result
+
+    def live(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve ``(entry_ids, matriz)`` con una fila por entrada vigente.
+
+        Si no hay registros pendientes en el log se devuelve directamente la
+        matriz mapeada del snapshot, sin copias.
+        """
+        with self._lock:
+            if self._live is None:
+                self._live = _merge_live(self._snapshot, self._overlay)
+            return self._live
+
+    def search(
+        self,
+        query: Iterable[float],
+        k: int = 10,
+        quantization: str = "float32",
+        rescore_factor: int = 4,
+        index: str = "exact",
+        nprobe: int = DEFAULT_NPROBE,
+        filters: Optional[SearchFilter] = None,
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Búsqueda por producto punto: devuelve ``(entry_ids, puntuaciones)``.
+
+        El snapshot se recorre sin copiarlo: las filas reemplazadas o borradas se
+        excluyen con una máscara y las del log se puntúan aparte. Con
+        ``quantization`` en ``"float16"`` o ``"int8"`` la primera pasada usa la
+        copia cuantizada del snapshot y solo los ``k * rescore_factor`` mejores
+        candidatos se re-puntúan con los vectores float32 (ver ``quantized_top_k``).
+        Reduce la memoria residente, no la latencia (ver ``QuantizedMatrix``).
+
+        Con ``index="ivf"`` el snapshot se recorre con su índice IVF, visitando
+        ``nprobe`` listas; si el snapshot no tiene índice (shards pequeños) la
+        búsqueda es exacta. El índice se mantiene en línea: las filas borradas o
+        reemplazadas quedan como tombstones que se descartan al recorrer las
+        listas, y las del log se asignan a su lista al leerlas, así una entrada
+        nueva se encuentra en cuanto se lee su registro. La compactación
+        reconstruye el índice (ver ``needs_ann_rebuild``).
+
+        Con ``index="blocked"`` la búsqueda es exacta en float32 pero el snapshot
+        se lee del archivo en bloques de ``block_rows`` filas, ids y vectores a
+        la par, y las filas que el log reemplazó o borró se excluyen en cada
+        bloque (ver ``blocked_top_k``): la memoria queda acotada a un bloque más
+        ``k`` candidatos y el log pendiente, para shards que no caben
+        cómodamente en RAM.
+
+        Con ``filters`` la búsqueda es exacta y solo sobre las filas que lo
+        cumplen (ver ``_filtered_candidates``): el costo es proporcional a las
+        filas que pasan el filtro y siempre se devuelven ``k`` resultados si
+        hay ``k`` filas que lo cumplan.
+        """
+        query = np.asarray(query, dtype=VECTOR_DTYPE).reshape(-1)
+        if filters is not None:
+            ids, matrix = self._filtered_candidates(filters)
+            rows, scores = top_k(matrix @ query, k)
+            return ids[rows], scores
+        if index == "blocked":
+            return self._blocked_search(query, k, block_rows)
+        with self._lock:
+            snapshot_ids, invalid_rows, overlay_ids, overlay_matrix, _ = self._search_view()
+            vectors = self._snapshot.vectors()
+            ann = self._ann_index() if index == "ivf" and len(snapshot_ids) else None
+            overlay_lists = self._overlay_ann_lists(ann, overlay_ids, overlay_matrix) if ann is not None else None
+            quantized = self._quantized_snapshot(quantization) if len(snapshot_ids) and ann is None else None
+
+        candidate_ids = []
+        candidate_scores = []
+        if ann is not None:
+            lists = ann.probe(query, nprobe)
+            rows, scores = ann.search(vectors, query, k, nprobe, invalid_rows, lists)
+            candidate_ids.append(snapshot_ids[rows])
+            candidate_scores.append(scores)
+            # Del log solo se puntúan las filas de las listas visitadas
+            overlay_rows = np.flatnonzero(np.isin(overlay_lists, lists))
+            overlay_ids, overlay_matrix = overlay_ids[overlay_rows], overlay_matrix[overlay_rows]
+        elif len(snapshot_ids):
+            rows, scores = quantized_top_k(quantized, vectors, query, k, rescore_factor, invalid_rows)
+            candidate_ids.append(snapshot_ids[rows])
+            candidate_scores.append(scores)
+        return _merge_candidates(candidate_ids, candidate_scores, overlay_ids, overlay_matrix, query, k)
+
+    def _blocked_search(self, query: np.ndarray, k: int, block_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        ``search(index="blocked")``: los ids y vectores del snapshot se leen por
+        bloques y las filas que el log reemplazó o borró se excluyen bloque a
+        bloque. Como el snapshot tiene una fila por entry_id, no hace falta su
+        índice ``entry_id -> fila`` ni una máscara del tamaño del snapshot.
+        """
+        with self._lock:
+            superseded_ids, overlay_ids, overlay_matrix, _ = self._log_view()
+            snapshot = self._snapshot
+
+        def blocks():
+            for _, entry_ids, block in snapshot.iter_blocks(block_rows):
+                yield entry_ids, block, np.isin(entry_ids, superseded_ids) if len(superseded_ids) else None
+
+        ids, scores = blocked_top_k(blocks(), query, k)
+        return _merge_candidates([ids], [scores], overlay_ids, overlay_matrix, query, k)
+
+    def search_many(self, queries: np.ndarray, k: int = 10, filters: Optional[SearchFilter] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Búsqueda exacta de varias consultas a la vez: ``(entry_ids, puntuaciones)``
+        por consulta, en el mismo orden.
+
+        Todas las consultas se puntúan con un único producto matriz-matriz
+        (vectores x consultas), así cada fila del snapshot se lee una sola vez
+        para todo el lote, y el top-k se selecciona por filas de forma vectorizada.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=VECTOR_DTYPE))
+        if filters is not None:
+            ids, matrix = self._filtered_candidates(filters)
+            columns, best = top_k_rows(queries @ matrix.T, k)
+            return [(ids[row_columns], row_scores) for row_columns, row_scores in zip(columns, best)]
+        with self._lock:
+            snapshot_ids, invalid_rows, overlay_ids, overlay_matrix, _ = self._search_view()
+            vectors = self._snapshot.vectors()
+
+        ids = np.concatenate([snapshot_ids, overlay_ids])
+        scores = np.empty((len(queries), len(ids)), dtype=VECTOR_DTYPE)
+        if len(snapshot_ids):
+            scores[:, :len(snapshot_ids)] = queries @ np.asarray(vectors, dtype=VECTOR_DTYPE).T
+            if invalid_rows is not None:
+                scores[:, :len(snapshot_ids)][:, invalid_rows] = -np.inf
+        if len(overlay_ids):
+            scores[:, len(snapshot_ids):] = queries @ overlay_matrix.T
+        columns, best = top_k_rows(scores, k)
+
+        results = []
+        for row_columns, row_scores in zip(columns, best):
+            # Con menos de k filas vigentes quedan filas excluidas (-inf) al final
+            valid = np.isfinite(row_scores)
+            results.append((ids[row_columns[valid]], row_scores[valid]))
+        return results
+
+    def score(self, entry_ids: Iterable[int], query: Iterable[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Puntúa solo las entradas indicadas (p. ej. candidatas de un pre-filtro).
+        Devuelve ``(entry_ids, puntuaciones)`` en el orden recibido, sin las que
+        no tienen vector.
+        """
+        query = np.asarray(query, dtype=VECTOR_DTYPE).reshape(-1)
+        with self._lock:
+            index = self._snapshot.index()
+            vectors = self._snapshot.vectors()
+            found_ids, snapshot_rows, overlay_vectors = [], [], []
+            for entry_id in entry_ids:
+                entry_id = int(entry_id)
+                if entry_id in self._overlay:
+                    vector = self._overlay[entry_id][1]
+                    if vector is not None:
+                        found_ids.append(entry_id)
+                        snapshot_rows.append(-1)
+                        overlay_vectors.append(vector)
+                elif entry_id in index:
+                    found_ids.append(entry_id)
+                    snapshot_rows.append(index[entry_id])
+        if not found_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=VECTOR_DTYPE)
+
+        snapshot_rows = np.asarray(snapshot_rows, dtype=np.int64)
+        scores = np.empty(len(found_ids), dtype=VECTOR_DTYPE)
+        in_snapshot = snapshot_rows >= 0
+        if in_snapshot.any():
+            scores[in_snapshot] = np.asarray(vectors[snapshot_rows[in_snapshot]], dtype=VECTOR_DTYPE) @ query
+        if overlay_vectors:
+            scores[~in_snapshot] = np.stack(overlay_vectors) @ query
+        return np.asarray(found_ids, dtype=np.int64), scores
+
+    def _filtered_candidates(self, filters: SearchFilter) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        ``(entry_ids, matriz)`` de las filas vigentes que cumplen ``filters``.
+
+        En el snapshot el filtro es una máscara vectorizada sobre sus columnas
+        de metadatos y solo se leen los vectores de las filas que pasan; las
+        filas del log (pocas) se comprueban una a una.
+        """
+        with self._lock:
+            snapshot_ids, invalid_rows, overlay_ids, overlay_matrix, overlay_metadata = self._search_view()
+            vectors = self._snapshot.vectors()
+            allowed = self._filter_columns().mask(filters)
+        if invalid_rows is not None:
+            allowed &= ~invalid_rows
+        rows = np.flatnonzero(allowed)
+        overlay_rows = np.fromiter(
+            (position for position, metadata in enumerate(overlay_metadata) if filters.matches(metadata)),
+            dtype=np.int64,
+        )
+        ids = np.concatenate([snapshot_ids[rows], overlay_ids[overlay_rows]])
+        matrix = np.concatenate([np.asarray(vectors[rows], dtype=VECTOR_DTYPE), overlay_matrix[overlay_rows]])
+        return ids, matrix
+
+    def _search_view(self) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray, np.ndarray, List[Optional[EntryMetadata]]]:
+        """``(ids del snapshot, máscara de filas no vigentes, ids del log, matriz del log, metadatos del log)``."""
+        if self._view is None:
+            _, overlay_ids, overlay_matrix, overlay_metadata = self._log_view()
+            snapshot_ids = self._snapshot.ids()
+            index = self._snapshot.index()
+            invalid_rows = None
+            if self._overlay or len(index) != len(snapshot_ids):
+                invalid_rows = np.ones(len(snapshot_ids), dtype=bool)
+                live_rows = [row for entry_id, row in index.items() if entry_id not in self._overlay]
+                invalid_rows[np.asarray(live_rows, dtype=np.int64)] = False
+            self._view = (snapshot_ids, invalid_rows, overlay_ids, overlay_matrix, overlay_metadata)
+        return self._view
+
+    def _log_view(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Optional[EntryMetadata]]]:
+        """
+        Parte de la vista que solo depende del log: ``(ids con registro en el log,
+        ids con vector en el log, su matriz, sus metadatos)``. Su tamaño es el del
+        log pendiente, no el del snapshot.
+        """
+        if self._overlay_view is None:
+            superseded_ids = np.sort(np.fromiter(self._overlay.keys(), dtype=np.int64, count=len(self._overlay)))
+            upserts = [(entry_id, entry[1], entry[4]) for entry_id, entry in self._overlay.items() if entry[1] is not None]
+            overlay_ids = np.asarray([entry_id for entry_id, _, _ in upserts], dtype=np.int64)
+            overlay_matrix = (
+                np.stack([vector for _, vector, _ in upserts]).astype(VECTOR_DTYPE, copy=False)
+                if upserts else np.empty((0, self.dim), dtype=VECTOR_DTYPE)
+            )
+            overlay_metadata = [metadata for _, _, metadata in upserts]
+            self._overlay_view = (superseded_ids, overlay_ids, overlay_matrix, overlay_metadata)
+        return self._overlay_view
+
+    def _filter_columns(self) -> FilterColumns:
+        """Columnas de metadatos del snapshot vigente, escritas al compactar."""
+        if self._filters is None:
+            self._filters = FilterColumns.load(self._snapshot.path, len(self._snapshot))
+        return self._filters
+
+    def _ann_index(self) -> Optional[IVFIndex]:
+        """Índice IVF del snapshot vigente, construido al compactar (``None`` si no tiene)."""
+        if not self._ann_loaded:
+            self._ann = IVFIndex.load(self._snapshot.path, len(self._snapshot))
+            self._ann_loaded = True
+        return self._ann
+
+    def _overlay_ann_lists(self, ann: IVFIndex, overlay_ids: np.ndarray, overlay_matrix: np.ndarray) -> np.ndarray:
+        """
+        Lista IVF de cada fila del log, alineada con ``overlay_ids``. Cada
+        registro se asigna a su centroide una sola vez: al llegar registros
+        nuevos solo se asignan los que cambiaron.
+        """
+        if self._overlay_lists is None:
+            lists = np.empty(len(overlay_ids), dtype=np.int32)
+            seqs = [self._overlay[entry_id][0] for entry_id in overlay_ids.tolist()]
+            pending = []
+            for position, (entry_id, seq) in enumerate(zip(overlay_ids.tolist(), seqs)):
+                assigned = self._ann_assignments.get(entry_id)
+                if assigned is not None and assigned[0] == seq:
+                    lists[position] = assigned[1]
+                else:
+                    pending.append(position)
+            if pending:
+                pending = np.asarray(pending, dtype=np.int64)
+                lists[pending] = ann.assign(overlay_matrix[pending])
+                for position in pending.tolist():
+                    self._ann_assignments[int(overlay_ids[position])] = (seqs[position], int(lists[position]))
+            self._overlay_lists = lists
+        return self._overlay_lists
+
+    def tombstone_ratio(self) -> float:
+        """
+        Fracción de filas del snapshot borradas o reemplazadas por registros
+        del log. El índice IVF las sigue recorriendo (y descartando) hasta que
+        una compactación lo reconstruye.
+        """
+        with self._lock:
+            _, invalid_rows, _, _, _ = self._search_view()
+            rows = len(self._snapshot)
+        if invalid_rows is None or rows == 0:
+            return 0.0
+        return float(np.count_nonzero(invalid_rows)) / rows
+
+    def needs_ann_rebuild(self, max_tombstone_ratio: float = DEFAULT_MAX_TOMBSTONE_RATIO) -> bool:
+        """El snapshot tiene índice IVF y sus tombstones superan ``max_tombstone_ratio``."""
+        self.refresh()
+        with self._lock:
+            if self._ann_index() is None:
+                return False
+        return self.tombstone_ratio() >= max_tombstone_ratio
+
+    def _quantized_snapshot(self, mode: str) -> QuantizedMatrix:
+        """
+        Copia cuantizada del snapshot vigente, residente en memoria. Se guarda
+        junto al snapshot (que no cambia tras publicarse) para no recalcularla
+        en cada proceso; la compactación la descarta junto con el snapshot.
+        """
+        quantized = self._quantized.get(mode)
+        if quantized is not None:
+            return quantized
+        vectors = self._snapshot.vectors()
+        if mode == "float32":
+            quantized = QuantizedMatrix(mode, vectors)
+        else:
+            quantized = QuantizedMatrix.load(self._snapshot.path, mode, len(vectors))
+            if quantized is None:
+                quantized = QuantizedMatrix.from_float32(vectors, mode)
+                try:
+                    quantized.save(self._snapshot.path)
+                except OSError as e:
+                    print(f"ADVERTENCIA: No se pudo guardar la copia {mode} de '{self._snapshot.path}': {e}")
+        self._quantized[mode] = quantized
+        return quantized
+
+    def log_bytes(self) -> int:
+        """Bytes del log aún no incorporados a un snapshot."""
+        return store_log_bytes(self.root)
+
+    # --- Compactación ---
+
+    def compact(self) -> bool:
+        """
+        Fusiona el snapshot vigente y el log en un snapshot nuevo (ver ``compact_store``)
+        y recarga el estado de esta instancia.
+        """
+        compacted = compact_store(self.root)
+        if compacted:
+            self.refresh()
+        return compacted
+
+    def compact_if_needed(self, min_log_bytes: int, max_tombstone_ratio: Optional[float] = None) -> bool:
+        """
+        Compacta si el log supera ``min_log_bytes`` o, con ``max_tombstone_ratio``,
+        si el índice IVF tiene demasiados tombstones (la compactación lo reconstruye).
+        """
+        if self.log_bytes() >= min_log_bytes:
+            return self.compact()
+        if max_tombstone_ratio is not None and self.needs_ann_rebuild(max_tombstone_ratio):
+            return self.compact()
+        return False
+
+
+class BackgroundCompactor:
+    """
+    Hilo que compacta el almacén cuando el log supera ``min_log_bytes`` o
+    cuando los tombstones de un índice IVF superan ``max_tombstone_ratio``.
+    Puede arrancarse en cada worker: ``compact.lock`` evita compactaciones simultáneas.
+    ``store`` es cualquier objeto con ``compact_if_needed(min_log_bytes, max_tombstone_ratio)`` y ``root``.
+    """
+
+    def __init__(
+        self,
+        store,
+        interval_seconds: float = 30.0,
+        min_log_bytes: int = 1024 * 1024,
+        max_tombstone_ratio: Optional[float] = DEFAULT_MAX_TOMBSTONE_RATIO,
+    ):
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.min_log_bytes = min_log_bytes
+        self.max_tombstone_ratio = max_tombstone_ratio
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="embedding-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.store.compact_if_needed(self.min_log_bytes, self.max_tombstone_ratio)
+            except Exception as e:
+                print(f"ERROR: Falló la compactación del almacén '{self.store.root}': {e}")
+
+
+def store_log_bytes(root: str) -> int:
+    """Bytes del log de ``root`` aún no incorporados a un snapshot."""
+    total = 0
+    log_dir = os.path.join(root, LOG_DIR)
+    offsets = _read_current(root)["offsets"]
+    for name in list_segments(log_dir):
+        total += max(0, os.path.getsize(os.path.join(log_dir, name)) - offsets.get(name, 0))
+    return total
+
+
+def compact_store(root: str) -> bool:
+    """
+    Fusiona el snapshot vigente y el log en un snapshot nuevo.
+
+    Solo un proceso compacta a la vez (``compact.lock``); si otro ya lo está
+    haciendo, devuelve ``False`` sin esperar. Los escritores no se bloquean:
+    los registros escritos durante la compactación quedan después de los
+    offsets publicados y se aplican sobre el snapshot nuevo.
+    """
+    lock_fd = os.open(os.path.join(root, COMPACT_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        _compact_locked(root)
+        return True
+    finally:
+        os.close(lock_fd)
+
+
+def _compact_locked(root: str) -> None:
+    log_dir = os.path.join(root, LOG_DIR)
+    current = _read_current(root)
+    snapshot = EmbeddingMatrixStore.open(os.path.join(root, current["snapshot"]))
+
+    # 1. Fijar hasta dónde llega cada segmento (en el mismo bloqueo que usan los escritores)
+    with log_lock(log_dir):
+        segments = []
+        for name in list_segments(log_dir):
+            sealed = segment_is_sealed(log_dir, name)
+            size = os.path.getsize(os.path.join(log_dir, name))
+            segments.append((name, sealed, size))
+
+    # 2. Leer los registros pendientes hasta esos límites. Los vectores se quedan
+    # en disco: solo se guarda el último registro de cada entrada y su ubicación.
+    latest: Dict[int, LogRecord] = {}
+    new_offsets: Dict[str, int] = {}
+    consumed: List[str] = []
+    for name, sealed, size in segments:
+        start = current["offsets"].get(name, 0)
+        new_records, end = read_records(os.path.join(log_dir, name), start, size, load_vectors=False)
+        for record in new_records:
+            previous = latest.get(record.entry_id)
+            if previous is None or previous.seq < record.seq:
+                latest[record.entry_id] = record
+        if sealed:
+            consumed.append(name)
+        else:
+            new_offsets[name] = end
+
+    # 3. Escribir el snapshot nuevo por bloques
+    snapshot_number = int(current["snapshot"][len(SNAPSHOT_PREFIX):]) + 1
+    snapshot_name = f"{SNAPSHOT_PREFIX}{snapshot_number:06d}"
+    snapshot_path = os.path.join(root, snapshot_name)
+    if os.path.exists(snapshot_path):
+        shutil.rmtree(snapshot_path)
+    new_snapshot = EmbeddingMatrixStore.create(snapshot_path, snapshot.dim)
+
+    index = snapshot.index()
+    kept_rows = np.fromiter(
+        sorted(row for entry_id, row in index.items() if entry_id not in latest),
+        dtype=np.int64,
+    )
+    all_rows = snapshot.rows()
+    vectors = snapshot.vectors()
+    # Metadatos de filtro: los de las filas conservadas y, a continuación, los de los registros nuevos
+    filter_columns = FilterColumns.load(snapshot.path, len(snapshot)).take(kept_rows)
+    for chunk_start in range(0, len(kept_rows), _COMPACTION_CHUNK_ROWS):
+        rows = kept_rows[chunk_start:chunk_start + _COMPACTION_CHUNK_ROWS]
+        new_snapshot.append_many(all_rows[rows], vectors[rows])
+    upserts = [record for record in latest.values() if record.op != OP_TOMBSTONE]
+    for chunk_start in range(0, len(upserts), _COMPACTION_CHUNK_ROWS):
+        chunk = upserts[chunk_start:chunk_start + _COMPACTION_CHUNK_ROWS]
+        new_snapshot.append_many(
+            make_rows(
+                [record.entry_id for record in chunk],
+                [record.text_hash for record in chunk],
+                [record.model for record in chunk],
+            ),
+            np.stack([read_vector(record) for record in chunk]),
+        )
+    filter_columns.extend([record.metadata for record in upserts]).save(snapshot_path)
+
+    # El índice IVF se construye antes de publicar, así ningún worker lo construye al arrancar
+    try:
+        build_ann_index(snapshot_path, new_snapshot.vectors())
+    except Exception as e:
+        print(f"ADVERTENCIA: No se pudo construir el índice IVF de '{snapshot_path}': {e}")
+
+    # 4. Publicar el snapshot de forma atómica
+    _write_json_atomic(
+        os.path.join(root, CURRENT_FILE),
+        {"snapshot": snapshot_name, "offsets": new_offsets},
+    )
+
+    # 5. Limpiar segmentos consumidos y snapshots antiguos. Se conserva el
+    # snapshot anterior para los lectores que aún no vieron el CURRENT nuevo.
+    for name in consumed:
+        for path in (os.path.join(log_dir, name), os.path.join(log_dir, name + SEALED_SUFFIX)):
+            if os.path.exists(path):
+                os.remove(path)
+    for name in os.listdir(root):
+        if name.startswith(SNAPSHOT_PREFIX) and name not in (snapshot_name, current["snapshot"]):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def initialize_store(root: str, dim: int) -> None:
+    """Crea la estructura de un almacén vacío si todavía no existe."""
+    os.makedirs(os.path.join(root, LOG_DIR), exist_ok=True)
+    if os.path.exists(os.path.join(root, CURRENT_FILE)):
+        return
+    snapshot_name = f"{SNAPSHOT_PREFIX}{0:06d}"
+    snapshot_path = os.path.join(root, snapshot_name)
+    if not os.path.exists(os.path.join(snapshot_path, "meta.json")):
+        EmbeddingMatrixStore.create(snapshot_path, dim)
+    _write_json_atomic(os.path.join(root, CURRENT_FILE), {"snapshot": snapshot_name, "offsets": {}})
+
+
+def _read_current(root: str) -> dict:
+    with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _apply_records(overlay: Dict[int, OverlayEntry], records: List[LogRecord]) -> None:
+    for record in sorted(records, key=lambda r: r.seq):
+        previous = overlay.get(record.entry_id)
+        if previous is not None and previous[0] > record.seq:
+            continue
+        vector = None if record.op == OP_TOMBSTONE else record.vector
+        overlay[record.entry_id] = (record.seq, vector, record.text_hash, record.model, record.metadata)
+
+
+def _merge_candidates(
+    candidate_ids: List[np.ndarray],
+    candidate_scores: List[np.ndarray],
+    overlay_ids: np.ndarray,
+    overlay_matrix: np.ndarray,
+    query: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Suma los candidatos del log a los del snapshot y devuelve los ``k`` mejores."""
+    if len(overlay_ids):
+        rows, scores = top_k(overlay_matrix @ query, k)
+        candidate_ids = candidate_ids + [overlay_ids[rows]]
+        candidate_scores = candidate_scores + [scores]
+    if not candidate_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=VECTOR_DTYPE)
+    ids = np.concatenate(candidate_ids)
+    rows, scores = top_k(np.concatenate(candidate_scores), k)
+    return ids[rows], scores
+
+
+def _merge_live(snapshot: EmbeddingMatrixStore, overlay: Dict[int, OverlayEntry]) -> Tuple[np.ndarray, np.ndarray]:
+    index = snapshot.index()
+    vectors = snapshot.vectors()
+    if not overlay and len(index) == len(snapshot):
+        return snapshot.ids(), vectors
+
+    rows = np.fromiter(
+        sorted(row for entry_id, row in index.items() if entry_id not in overlay),
+        dtype=np.int64,
+    )
+    ids = [snapshot.ids()[rows]]
+    matrices = [vectors[rows]]
+    upserts = [(entry_id, entry[1]) for entry_id, entry in overlay.items() if entry[1] is not None]
+    if upserts:
+        ids.append(np.asarray([entry_id for entry_id, _ in upserts], dtype=np.int64))
+        matrices.append(np.stack([vector for _, vector in upserts]))
+    return np.concatenate(ids), np.concatenate(matrices).astype(VECTOR_DTYPE, copy=False)
@@ -0,0 +1,21 @@
+""" Texto que se embebe para cada entrada y su hash de contenido
+"""
+import hashlib
+
+from app.embeddings._matrix_store import TEXT_HASH_SIZE
+
+
+def build_entry_text(title: str, content: str) -> str:
+    """Texto exacto que se envía al modelo de embeddings para una entrada."""
+    return f"Título: {title}\nContenido: {content}"
+
+
+def build_item_text(name: str, description: str) -> str:
+    """Texto que se envía al modelo de embeddings para un item del catálogo."""
+    return f"Producto: {name}\nDescripción: {description}"
+
+
+def text_hash(text: str) -> bytes:
+    """Hash del texto embebido; si no cambia, el vector guardado sigue siendo válido."""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=TEXT_HASH_SIZE // 2)
+    return digest.hexdigest().encode("ascii")
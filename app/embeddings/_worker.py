@@ -0,0 +1,292 @@
+""" Worker en segundo plano que genera los embeddings de las entradas nuevas
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from app.embeddings._filters import EntryMetadata
+from app.embeddings._provider import MAX_BATCH_SIZE
+from app.embeddings._texts import build_entry_text, text_hash
+
+DEFAULT_QUEUE_PATH = os.getenv("EMBEDDING_QUEUE_PATH", "embedding_queue.sqlite3")
+
+
+@dataclass
+class EmbeddingJob:
+    entry_id: int
+    business_id: int
+    title: str
+    content: str
+    attempts: int = 0
+    version: int = 0
+    # Categorías y content_type que se guardan junto al vector para filtrar búsquedas
+    metadata: Optional[EntryMetadata] = None
+
+    @classmethod
+    def from_row(cls, row) -> "EmbeddingJob":
+        *fields, metadata = row
+        return cls(*fields, metadata=EntryMetadata.decode(metadata) if metadata else None)
+
+
+class PendingEmbeddings:
+    """
+    Conjunto persistente (SQLite) de entradas pendientes de embedding.
+
+    Es la fuente de verdad del worker: un trabajo solo se borra cuando su vector
+    quedó escrito en el almacén, así que un reinicio no pierde trabajo. Cada
+    fila tiene un ``next_attempt``: mientras no venza, la fila está reservada
+    por el proceso que la encoló (o esperando su próximo reintento), y así
+    varios workers de uvicorn no procesan la misma entrada a la vez.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                "entry_id INTEGER PRIMARY KEY, business_id INTEGER NOT NULL, title TEXT NOT NULL, "
+                "content TEXT NOT NULL, attempts INTEGER NOT NULL, next_attempt REAL NOT NULL, "
+                "version INTEGER NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS pending_next_attempt ON pending (next_attempt)")
+            # Colas creadas antes de guardar metadatos con cada trabajo
+            columns = [row[1] for row in db.execute("PRAGMA table_info(pending)")]
+            if "metadata" not in columns:
+                db.execute("ALTER TABLE pending ADD COLUMN metadata BLOB")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def put(self, job: EmbeddingJob, lease_seconds: float) -> EmbeddingJob:
+        """Guarda (o reemplaza) el trabajo de una entrada; devuelve el trabajo con su versión."""
+        db = self._connection()
+        with db:
+            row = db.execute("SELECT version FROM pending WHERE entry_id = ?", (job.entry_id,)).fetchone()
+            job.version = (row[0] + 1) if row else 1
+            job.attempts = 0
+            db.execute(
+                "INSERT OR REPLACE INTO pending "
+                "(entry_id, business_id, title, content, attempts, next_attempt, version, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.entry_id, job.business_id, job.title, job.content, 0, time.time() + lease_seconds, job.version,
+                    job.metadata.encode() if job.metadata is not None else None,
+                ),
+            )
+        return job
+
+    def get_many(self, entry_ids: List[int]) -> Dict[int, EmbeddingJob]:
+        """Versión vigente de cada trabajo (una entrada actualizada trae su texto más reciente)."""
+        if not entry_ids:
+            return {}
+        placeholders = ",".join("?" * len(entry_ids))
+        rows = self._connection().execute(
+            "SELECT entry_id, business_id, title, content, attempts, version, metadata "
+            f"FROM pending WHERE entry_id IN ({placeholders})",
+            entry_ids,
+        )
+        return {row[0]: EmbeddingJob.from_row(row) for row in rows}
+
+    def claim_due(self, limit: int, lease_seconds: float, max_attempts: int) -> List[EmbeddingJob]:
+        """Reserva hasta ``limit`` trabajos vencidos (encolados por procesos caídos o por reintentar)."""
+        db = self._connection()
+        now = time.time()
+        with db:
+            rows = db.execute(
+                "SELECT entry_id, business_id, title, content, attempts, version, metadata FROM pending "
+                "WHERE next_attempt <= ? AND attempts < ? ORDER BY next_attempt LIMIT ?",
+                (now, max_attempts, limit),
+            ).fetchall()
+            db.executemany(
+                "UPDATE pending SET next_attempt = ? WHERE entry_id = ?",
+                [(now + lease_seconds, row[0]) for row in rows],
+            )
+        return [EmbeddingJob.from_row(row) for row in rows]
+
+    def done(self, jobs: List[EmbeddingJob]) -> None:
+        """Borra los trabajos terminados, salvo los que se volvieron a encolar mientras tanto."""
+        db = self._connection()
+        with db:
+            db.executemany(
+                "DELETE FROM pending WHERE entry_id = ? AND version = ?",
+                [(job.entry_id, job.version) for job in jobs],
+            )
+
+    def discard(self, entry_ids: List[int]) -> None:
+        """Borra los trabajos de entradas que ya no existen."""
+        db = self._connection()
+        with db:
+            db.executemany("DELETE FROM pending WHERE entry_id = ?", [(int(entry_id),) for entry_id in entry_ids])
+
+    def failed(self, jobs: List[EmbeddingJob], retry_at: float) -> None:
+        db = self._connection()
+        with db:
+            db.executemany(
+                "UPDATE pending SET attempts = attempts + 1, next_attempt = ? WHERE entry_id = ? AND version = ?",
+                [(retry_at, job.entry_id, job.version) for job in jobs],
+            )
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+
+class EmbeddingWorker:
+    """
+    Hilo que genera embeddings fuera del ciclo de la petición HTTP.
+
+    ``submit()`` guarda el trabajo en ``PendingEmbeddings`` y avisa al hilo por
+    una cola acotada; si la cola está llena, el trabajo igualmente queda
+    guardado y se recoge cuando vence su reserva. El hilo junta hasta
+    ``batch_size`` entradas (esperando como mucho ``max_wait_seconds``), las
+    embebe en una sola llamada por generación del almacén (la activa y la que
+    se esté rellenando) y las escribe agrupadas por negocio. Los lotes fallidos
+    se reintentan con espera exponencial hasta ``max_attempts`` veces; después
+    quedan en el archivo para revisarlos.
+
+    El mismo worker sirve a otras colecciones (p. ej. los items del catálogo):
+    cada una tiene su almacén, su archivo de pendientes y su ``text_builder``.
+    """
+
+    def __init__(
+        self,
+        store,
+        provider_for,
+        pending_path: str = DEFAULT_QUEUE_PATH,
+        max_queue: int = 1000,
+        batch_size: int = 32,
+        max_wait_seconds: float = 0.5,
+        max_attempts: int = 5,
+        backoff_seconds: float = 2.0,
+        lease_seconds: float = 60.0,
+        text_builder: Callable[[str, str], str] = build_entry_text,
+        name: str = "embedding-worker",
+    ):
+        # store: GenerationalEmbeddingStore; provider_for(generation) -> proveedor de su modelo
+        self.store = store
+        self.provider_for = provider_for
+        self.pending = PendingEmbeddings(pending_path)
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_wait_seconds = max_wait_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.text_builder = text_builder
+        self.name = name
+        self._queue: "queue.Queue[int]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.processed = 0
+        self.failures = 0
+
+    def submit(self, entry_id: int, business_id: int, title: str, content: str, metadata: Optional[EntryMetadata] = None) -> None:
+        """Encola una entrada. Vuelve en cuanto el trabajo está guardado en disco."""
+        self.pending.put(EmbeddingJob(entry_id, business_id, title, content, metadata=metadata), self.lease_seconds)
+        try:
+            self._queue.put_nowait(entry_id)
+        except queue.Full:
+            print(f"ADVERTENCIA: Cola de embeddings llena; la entrada {entry_id} se procesará al vencer su reserva.")
+
+    def cancel(self, entry_ids: List[int]) -> None:
+        """
+        Descarta los trabajos pendientes de entradas borradas. Un lote que ya
+        está en proceso puede escribir su vector igualmente: las búsquedas
+        omiten los resultados que ya no existen en la base de datos.
+        """
+        self.pending.discard(entry_ids)
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Detiene el hilo tras el lote en curso; lo no procesado sigue guardado para el próximo arranque."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                jobs = self._next_batch()
+                if jobs:
+                    self._process(jobs)
+            except Exception as e:
+                print(f"ERROR: Falló el worker de embeddings: {e}")
+                self._stop.wait(self.backoff_seconds)
+
+    def _next_batch(self) -> List[EmbeddingJob]:
+        # Los trabajos vencidos (de reinicios anteriores, reintentos o reservas
+        # caducadas) se recogen en cada vuelta, con hasta la mitad del lote: el
+        # trabajo nuevo continuo no los deja esperando, ni ellos al nuevo
+        jobs = {
+            job.entry_id: job
+            for job in self.pending.claim_due(max(1, self.batch_size // 2), self.lease_seconds, self.max_attempts)
+        }
+        entry_ids: List[int] = []
+        deadline = time.monotonic() + (0 if jobs else self.max_wait_seconds)
+        while len(jobs) + len(entry_ids) < self.batch_size:
+            try:
+                entry_ids.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        if entry_ids:
+            # Las entradas ya procesadas (o encoladas dos veces) no están o se repiten
+            jobs.update(self.pending.get_many(list(dict.fromkeys(entry_ids))))
+        elif len(jobs) < self.batch_size:
+            # Sin trabajo nuevo: el resto del lote también sale de los vencidos
+            for job in self.pending.claim_due(self.batch_size - len(jobs), self.lease_seconds, self.max_attempts):
+                jobs.setdefault(job.entry_id, job)
+        return list(jobs.values())
+
+    def _process(self, jobs: List[EmbeddingJob]) -> None:
+        texts = [self.text_builder(job.title, job.content) for job in jobs]
+        hashes = [text_hash(text) for text in texts]
+        by_business: Dict[int, List[int]] = {}
+        for position, job in enumerate(jobs):
+            by_business.setdefault(job.business_id, []).append(position)
+        try:
+            for generation in self.store.write_generations():
+                matrix = self.provider_for(generation).embed(texts, task_type="RETRIEVAL_DOCUMENT")
+                for business_id, positions in by_business.items():
+                    generation.store.replace_many(
+                        business_id,
+                        [jobs[p].entry_id for p in positions],
+                        matrix[positions],
+                        [hashes[p] for p in positions],
+                        [generation.model] * len(positions),
+                        [jobs[p].metadata for p in positions],
+                    )
+        except Exception as e:
+            self.failures += len(jobs)
+            attempts = min(job.attempts for job in jobs)
+            retry_at = time.time() + self.backoff_seconds * (2 ** attempts)
+            self.pending.failed(jobs, retry_at)
+            print(f"ERROR: No se pudieron generar {len(jobs)} embeddings (intento {attempts + 1}): {e}")
+            return
+        self.pending.done(jobs)
+        self.processed += len(jobs)
+        print(f"-> {len(jobs)} embeddings generados y guardados en segundo plano.")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "pending": len(self.pending),
+            "processed": self.processed,
+            "failures": self.failures,
+        }
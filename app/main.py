@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
@@ -11,10 +13,38 @@ from app.routers import (
     tone,
     knowledge_entry,
 )
+from embeding import create_compactor, get_embedding_worker, get_item_embedding_worker, get_item_embeddings_store
+from app.utils.agent_improved import get_enhancement_agent
+from app.data._db_config import async_engine
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El agente de mejora (cliente del modelo e instrucciones fijas) se crea una sola vez
+    get_enhancement_agent()
+    # Compacta en segundo plano el log del almacén de embeddings
+    compactor = create_compactor()
+    compactor.start()
+    item_compactor = create_compactor(get_item_embeddings_store())
+    item_compactor.start()
+    # Genera los embeddings de las entradas y los items nuevos fuera de la petición
+    embedding_worker = get_embedding_worker()
+    embedding_worker.start()
+    item_embedding_worker = get_item_embedding_worker()
+    item_embedding_worker.start()
+    yield
+    item_embedding_worker.stop()
+    embedding_worker.stop()
+    item_compactor.stop()
+    compactor.stop()
+    # Cierra las conexiones del pool async dentro del event loop que las abrió
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="My API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
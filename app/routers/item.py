@@ -7,8 +7,8 @@ from app.schemas._error import ErrorType, raise_app_error
 from app.data._db_config import get_db
 
 from utils._user_validation import get_current_user
-from app.schemas._item import ItemBase, ItemResponse, DeleteItemResponse
-from app.service._item_crud import create_item_service, delete_item_service, update_item_service, get_item_service
+from app.schemas._item import ItemBase, ItemResponse, ItemSearchResult, DeleteItemResponse, ItemCategorySuggestionRequest, CategorySuggestion
+from app.service._item_crud import create_item_service, delete_item_service, update_item_service, get_item_service, search_items_service, suggest_item_categories_service
 
 
 
@@ -128,6 +128,84 @@ async def get_item(
             details=str(ex)
         )
 
+@router.get(
+    "/search",
+    response_model=List[ItemSearchResult],
+    summary="Semantic search over the Items of a business",
+    response_description="Items ranked by similarity to the query",
+    status_code=status.HTTP_200_OK
+)
+def search_items(
+    business_id: int,
+    q: str = Query(..., min_length=1, max_length=2000),
+    k: int = Query(10, ge=1, le=100),
+    category: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user)
+) -> List[ItemSearchResult]:
+    """
+    Endpoint to search the Items of a business by meaning (name and description).
+
+    Args:
+        business_id (int): ID of the business whose Items are searched.
+        q (str): Free-text query.
+        k (int): Maximum number of Items to return.
+        category (List[int], optional): Only Items in any of these categories.
+        db (Session): SQLAlchemy database session dependency.
+        user_id (str): ID of the authenticated user (extracted from the token).
+
+    Returns:
+        List[ItemSearchResult]: Items with their category IDs and similarity score, best first.
+    """
+    try:
+        return search_items_service(db, business_id, q, k, category)
+    except HTTPException as http_ex:
+        raise http_ex
+    except Exception as ex:
+        raise_app_error(
+            error_code="SearchItemsFailed",
+            message="An unexpected error occurred while searching Items.",
+            error_type=ErrorType.HANDLER,
+            details=str(ex)
+        )
+
+@router.post(
+    "/category-suggestions",
+    response_model=List[CategorySuggestion],
+    summary="Suggest categories for a draft Item",
+    response_description="Category IDs of the most similar Items, best first",
+    status_code=status.HTTP_200_OK
+)
+def suggest_item_categories(
+    data: ItemCategorySuggestionRequest,
+    user_id: str = Depends(get_current_user)
+) -> List[CategorySuggestion]:
+    """
+    Endpoint to suggest categories for an Item before creating it.
+
+    The draft name and description are embedded and compared with the Items
+    already indexed for the business; their categories are ranked by
+    similarity-weighted votes. No LLM is called.
+
+    Args:
+        data (ItemCategorySuggestionRequest): Business ID, draft name and description, and how many suggestions to return.
+        user_id (str): ID of the authenticated user (extracted from the token).
+
+    Returns:
+        List[CategorySuggestion]: Suggested category IDs with their score and number of votes.
+    """
+    try:
+        return suggest_item_categories_service(data)
+    except HTTPException as http_ex:
+        raise http_ex
+    except Exception as ex:
+        raise_app_error(
+            error_code="SuggestItemCategoriesFailed",
+            message="An unexpected error occurred while suggesting Item categories.",
+            error_type=ErrorType.HANDLER,
+            details=str(ex)
+        )
+
 @router.delete(
     "/{item_id}",
     status_code=status.HTTP_200_OK,
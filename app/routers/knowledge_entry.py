@@ -1,19 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.data._db_config import get_db
+from app.data._db_config import get_async_db, get_db
 from app.schemas._error import ErrorType, raise_app_error
-from app.schemas._knowledge_entry import KnowledgeEntryCreate, KnowledgeEntryImproved, KnowledgeEntryResponse, KnowledgeEntryUpdate
-from app.service._knowledge_entry_crud import create_knowledge_entry_service, create_knowledge_entry_service2, update_knowledge_entry_service
+from app.schemas._knowledge_entry import KnowledgeEntryCreate, KnowledgeEntryImproved, KnowledgeEntryResponse, KnowledgeEntrySearchResult, KnowledgeEntryBatchSearch, KnowledgeEntryBatchSearchResult, KnowledgeEntryUpdate
+from app.service._knowledge_entry_crud import create_knowledge_entry_service_async, search_knowledge_entries_batch_service, search_knowledge_entries_service, search_metrics_service, update_knowledge_entry_service
 
 
 
 router = APIRouter()
 
 @router.post("/", response_model=KnowledgeEntryImproved, status_code=status.HTTP_201_CREATED)
-def create_knowledge_entry_handler(data: KnowledgeEntryCreate, db: Session = Depends(get_db)):
+async def create_knowledge_entry_handler(data: KnowledgeEntryCreate, db: AsyncSession = Depends(get_async_db)):
+    # Ruta async: mientras espera al agente de IA y a la BD no ocupa ningún hilo
     try:
-        return create_knowledge_entry_service2(db, data)
+        return await create_knowledge_entry_service_async(db, data)
     except Exception as ex:
         raise_app_error(
             error_code="CreateEntryFailed",
@@ -23,6 +27,56 @@ def create_knowledge_entry_handler(data: KnowledgeEntryCreate, db: Session = Dep
         )
 
 
+@router.get("/search", response_model=List[KnowledgeEntrySearchResult])
+def search_knowledge_entries_handler(
+    business_id: int,
+    q: str = Query(..., min_length=1, max_length=2000),
+    k: int = Query(10, ge=1, le=100),
+    mode: str = Query("vector", pattern="^(vector|lexical|hybrid|prefilter)$"),
+    category: Optional[List[str]] = Query(None),
+    content_type: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    if (category or content_type is not None) and mode != "vector":
+        raise_app_error(
+            error_code="InvalidSearchFilters",
+            message="Category and content_type filters are only supported in 'vector' mode.",
+            error_type=ErrorType.VALIDATION,
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        return search_knowledge_entries_service(db, business_id, q, k, mode, category, content_type)
+    except HTTPException as http_ex:
+        raise http_ex
+    except Exception as ex:
+        raise_app_error(
+            error_code="SearchEntriesFailed",
+            message="An unexpected error occurred while searching entries.",
+            error_type=ErrorType.HANDLER,
+            details=str(ex)
+        )
+
+
+@router.post("/search/batch", response_model=List[KnowledgeEntryBatchSearchResult])
+def search_knowledge_entries_batch_handler(data: KnowledgeEntryBatchSearch, db: Session = Depends(get_db)):
+    try:
+        return search_knowledge_entries_batch_service(db, data)
+    except HTTPException as http_ex:
+        raise http_ex
+    except Exception as ex:
+        raise_app_error(
+            error_code="SearchEntriesFailed",
+            message="An unexpected error occurred while searching entries.",
+            error_type=ErrorType.HANDLER,
+            details=str(ex)
+        )
+
+
+@router.get("/search/metrics")
+def search_metrics_handler():
+    return search_metrics_service()
+
+
 @router.put("/{entry_id}", response_model=KnowledgeEntryResponse)
 def update_knowledge_entry_handler(entry_id: int, data: KnowledgeEntryUpdate, db: Session = Depends(get_db)):
     try:
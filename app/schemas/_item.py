@@ -1,5 +1,5 @@
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class ItemBase(BaseModel):
@@ -19,6 +19,25 @@ class ItemResponse(ItemBase):
     created_at: datetime
     updated_at: datetime
     
+class ItemSearchResult(ItemResponse):
+    score: float
+
+
+class ItemCategorySuggestionRequest(BaseModel):
+    business_id: int
+    item_name: str = Field(..., min_length=1, max_length=500)
+    item_description: str = Field("", max_length=5000)
+    limit: int = Field(3, ge=1, le=20)
+
+
+class CategorySuggestion(BaseModel):
+    category_id: int
+    # Fracción del peso (similitud) de los vecinos que votó por esta categoría
+    score: float
+    # Vecinos que tienen la categoría
+    votes: int
+
+
 class DeleteItemResponse(BaseModel):
     message: str
     id: int
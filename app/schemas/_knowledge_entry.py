@@ -31,6 +31,25 @@ class KnowledgeEntryResponse(KnowledgeEntryBase):
     created_at: datetime
     updated_at: datetime
     model_config = ConfigDict(from_attributes=True)
+
+
+class KnowledgeEntrySearchResult(KnowledgeEntryImproved):
+    score: float = Field(description="Puntuación según el modo: coseno (vector, prefilter), BM25 (lexical) o RRF (hybrid).")
+
+
+class KnowledgeEntryBatchSearch(BaseModel):
+    business_id: int
+    # Hasta 64 consultas: todas caben en una sola llamada por lotes de embeddings
+    queries: List[str] = Field(min_length=1, max_length=64)
+    k: int = Field(10, ge=1, le=100)
+    # Filtros opcionales: alguna de las categorías y el content_type indicados
+    categories: Optional[List[str]] = None
+    content_type: Optional[str] = None
+
+
+class KnowledgeEntryBatchSearchResult(BaseModel):
+    query: str
+    results: List[KnowledgeEntrySearchResult]
     
     
 class ImprovedEntryData(BaseModel):
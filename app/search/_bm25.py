@@ -0,0 +1,251 @@
+""" Índice léxico BM25 en memoria de las entradas de conocimiento, uno por negocio
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._scoring import top_k
+from app.search._versions import KnowledgeVersions, get_knowledge_versions
+
+# Palabras y códigos con guiones, puntos o barras (SKUs como "ABC-123" o "v2.5")
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_TOKEN_SEPARATOR = re.compile(r"[-./]")
+# Marcas diacríticas que deja NFKD al separar "á" en "a" + tilde
+_COMBINING = re.compile(r"[\u0300-\u036f]")
+# El título mejorado pesa el doble que el contenido
+TITLE_WEIGHT = 2
+
+# (entry_id, improved_title, improved_content, categories)
+EntryTexts = Tuple[int, Optional[str], Optional[str], Optional[List[str]]]
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Minúsculas sin tildes. Un código compuesto produce el código completo y
+    sus partes: ``"ABC-123"`` -> ``["abc-123", "abc", "123"]``.
+    """
+    if not text:
+        return []
+    text = text.lower()
+    if not text.isascii():
+        text = _COMBINING.sub("", unicodedata.normalize("NFKD", text))
+    tokens = []
+    for token in _TOKEN.findall(text):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _TOKEN_SEPARATOR.split(token) if part)
+    return tokens
+
+
+def entry_terms(title: Optional[str], content: Optional[str], categories: Optional[List[str]]) -> Counter:
+    terms = Counter()
+    for token in tokenize(title):
+        terms[token] += TITLE_WEIGHT
+    terms.update(tokenize(content))
+    for category in categories or []:
+        terms.update(tokenize(category))
+    return terms
+
+
+class BM25Index:
+    """
+    Índice invertido con puntuación BM25.
+
+    Cada entrada ocupa una posición fija (``slot``) en arreglos densos. Las
+    listas de cada término se mantienen en diccionarios (baratos de modificar)
+    y se compilan a arreglos numpy la primera vez que una consulta las usa,
+    así la puntuación de un término es una operación vectorizada aunque
+    aparezca en miles de entradas.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self._compiled: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._doc_terms: Dict[int, Counter] = {}
+        self._slots: Dict[int, int] = {}
+        self._free_slots: List[int] = []
+        self._slot_ids = np.zeros(1024, dtype=np.int64)
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._used_slots = 0
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, entry_id: int, title: Optional[str], content: Optional[str], categories: Optional[List[str]]) -> None:
+        """Indexa una entrada; si ya estaba, reemplaza sus términos."""
+        entry_id = int(entry_id)
+        self.remove(entry_id)
+        slot = self._free_slots.pop() if self._free_slots else self._new_slot()
+        terms = entry_terms(title, content, categories)
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[slot] = frequency
+            self._compiled.pop(term, None)
+        length = sum(terms.values())
+        self._slots[entry_id] = slot
+        self._doc_terms[entry_id] = terms
+        self._slot_ids[slot] = entry_id
+        self._lengths[slot] = length
+        self.total_length += length
+
+    def remove(self, entry_id: int) -> None:
+        entry_id = int(entry_id)
+        terms = self._doc_terms.pop(entry_id, None)
+        if terms is None:
+            return
+        slot = self._slots.pop(entry_id)
+        for term in terms:
+            posting = self.postings[term]
+            del posting[slot]
+            self._compiled.pop(term, None)
+            if not posting:
+                del self.postings[term]
+        self.total_length -= int(self._lengths[slot])
+        self._lengths[slot] = 0
+        self._free_slots.append(slot)
+
+    def _new_slot(self) -> int:
+        if self._used_slots == len(self._slot_ids):
+            self._slot_ids = np.concatenate([self._slot_ids, np.zeros_like(self._slot_ids)])
+            self._lengths = np.concatenate([self._lengths, np.zeros_like(self._lengths)])
+        self._used_slots += 1
+        return self._used_slots - 1
+
+    def _posting_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        compiled = self._compiled.get(term)
+        if compiled is None:
+            posting = self.postings.get(term)
+            if not posting:
+                return None
+            compiled = (
+                np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float32, count=len(posting)),
+            )
+            self._compiled[term] = compiled
+        return compiled
+
+    def scores(self, query: str) -> np.ndarray:
+        """Puntuación BM25 de cada slot (0 en las entradas sin términos de la consulta)."""
+        scores = np.zeros(self._used_slots, dtype=np.float32)
+        documents = len(self._slots)
+        if not documents:
+            return scores
+        average_length = self.total_length / documents
+        for term in set(tokenize(query)):
+            arrays = self._posting_arrays(term)
+            if arrays is None:
+                continue
+            slots, frequencies = arrays
+            idf = math.log(1 + (documents - len(slots) + 0.5) / (len(slots) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[slots] / average_length)
+            # Cada slot aparece una sola vez por término: la suma indexada es segura
+            scores[slots] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+        return scores
+
+    def search(self, query: str, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """``(entry_ids, puntuaciones BM25)`` de las ``k`` mejores entradas, de mayor a menor."""
+        scores = self.scores(query)
+        slots, best = top_k(scores, k)
+        matched = best > 0
+        return self._slot_ids[slots[matched]], best[matched]
+
+
+class LexicalIndex:
+    """
+    Índices BM25 de los negocios consultados, en un LRU de ``max_businesses``.
+
+    El índice de un negocio se construye desde la base de datos la primera vez
+    y después se actualiza entrada por entrada con ``entry_saved``. Cada índice
+    recuerda la versión del negocio (``KnowledgeVersions``) que refleja: si otro
+    proceso cambió el negocio, las versiones no coinciden y se reconstruye.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[int], Iterable[EntryTexts]],
+        versions: KnowledgeVersions,
+        max_businesses: int = 256,
+    ):
+        self.loader = loader
+        self.versions = versions
+        self.max_businesses = max_businesses
+        self._lock = threading.Lock()
+        # business_id -> (índice, versión que refleja)
+        self._indexes: "OrderedDict[int, Tuple[BM25Index, int]]" = OrderedDict()
+
+    def business_index(self, business_id: int) -> BM25Index:
+        business_id = int(business_id)
+        version = self.versions.get(business_id)
+        with self._lock:
+            cached = self._indexes.get(business_id)
+            if cached is not None and cached[1] == version:
+                self._indexes.move_to_end(business_id)
+                return cached[0]
+        # Se lee la versión antes de cargar: un cambio durante la carga provoca otra recarga
+        index = BM25Index()
+        for entry_id, title, content, categories in self.loader(business_id):
+            index.add(entry_id, title, content, categories)
+        with self._lock:
+            self._indexes[business_id] = (index, version)
+            self._indexes.move_to_end(business_id)
+            while len(self._indexes) > self.max_businesses:
+                self._indexes.popitem(last=False)
+        return index
+
+    def search(self, business_id: int, query: str, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        index = self.business_index(business_id)
+        # entry_saved modifica los índices bajo el mismo bloqueo
+        with self._lock:
+            return index.search(query, k)
+
+    def entry_saved(self, business_id: int, entry_id: int, title: Optional[str], content: Optional[str], categories: Optional[List[str]]) -> int:
+        """
+        Registra el alta o edición de una entrada: incrementa la versión del
+        negocio y actualiza su índice en memoria si estaba al día. Devuelve la
+        versión nueva.
+        """
+        business_id = int(business_id)
+        version = self.versions.bump(business_id)
+        with self._lock:
+            cached = self._indexes.get(business_id)
+            if cached is not None:
+                index, indexed_version = cached
+                if indexed_version == version - 1:
+                    index.add(entry_id, title, content, categories)
+                    self._indexes[business_id] = (index, version)
+                else:
+                    # Se perdió algún cambio de otro proceso: se reconstruye en la próxima consulta
+                    del self._indexes[business_id]
+        return version
+
+
+def _load_business_entries(business_id: int) -> List[EntryTexts]:
+    # Importación diferida: la capa de datos importa este módulo
+    from app.data._db_config import SessionLocal
+    from app.data._knowledge_entry_crud import get_knowledge_entry_texts
+
+    db = SessionLocal()
+    try:
+        return get_knowledge_entry_texts(db, business_id)
+    finally:
+        db.close()
+
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    """Índice léxico compartido por todas las peticiones de este proceso."""
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex(_load_business_entries, get_knowledge_versions())
+        return _lexical_index
@@ -0,0 +1,25 @@
+""" Fusión de rankings de distintas búsquedas
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Constante habitual de RRF: amortigua la diferencia entre los primeros puestos
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, rrf_k: int = RRF_K) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Combina listas de ``entry_ids`` ordenadas de mejor a peor sumando
+    ``1 / (rrf_k + posición)`` de cada lista. Solo usa posiciones, así que
+    mezcla puntuaciones de escalas distintas (BM25 y coseno) sin normalizarlas.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for position, entry_id in enumerate(ranking.tolist(), start=1):
+            scores[entry_id] = scores.get(entry_id, 0.0) + 1.0 / (rrf_k + position)
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return (
+        np.fromiter((entry_id for entry_id, _ in best), dtype=np.int64, count=len(best)),
+        np.fromiter((score for _, score in best), dtype=np.float32, count=len(best)),
+    )
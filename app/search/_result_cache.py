@@ -0,0 +1,96 @@
+""" Caché de resultados top-k de búsqueda, invalidada por versión del negocio
+"""
+import os
+import threading
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._filters import SearchFilter
+from app.embeddings._query_cache import query_key
+from app.search._versions import KnowledgeVersions, get_knowledge_versions
+from app.utils.cache import LRUCache, SingleFlight
+
+DEFAULT_RESULT_CACHE_ENTRIES = int(os.getenv("SEARCH_RESULT_CACHE_ENTRIES", "10000"))
+
+SearchResult = Tuple[np.ndarray, np.ndarray]
+
+
+class SearchResultCache:
+    """
+    Resultados ``(entry_ids, puntuaciones)`` de búsquedas recientes.
+
+    La clave es ``(business_id, consulta, k, modo, filtros)`` más la versión del
+    negocio en ``KnowledgeVersions`` (sube con cada alta o edición) y el estado
+    de su shard de embeddings (cambia cuando el worker guarda un vector). Un
+    cambio produce claves nuevas y las antiguas salen por LRU: no hay que
+    invalidar nada a mano. Un acierto no embebe la consulta ni puntúa vectores.
+    """
+
+    def __init__(
+        self,
+        versions: KnowledgeVersions,
+        store_state: Callable[[int], Hashable],
+        max_entries: int = DEFAULT_RESULT_CACHE_ENTRIES,
+    ):
+        self.versions = versions
+        self.store_state = store_state
+        self.cache = LRUCache(max_entries)
+        self._flight = SingleFlight()
+
+    def key(self, business_id: int, query: str, k: int, mode: str, filters: Optional[SearchFilter]) -> tuple:
+        # Las versiones se leen antes de buscar: una escritura durante la búsqueda cambia la clave siguiente
+        business_id = int(business_id)
+        return (
+            business_id, query_key(query), int(k), mode, filters,
+            self.versions.get(business_id), self.store_state(business_id),
+        )
+
+    def get_or_search(
+        self,
+        business_id: int,
+        query: str,
+        k: int,
+        mode: str,
+        filters: Optional[SearchFilter],
+        search: Callable[[], SearchResult],
+    ) -> SearchResult:
+        """Resultado en caché o, si no está, el de ``search()`` (una sola vez para búsquedas concurrentes iguales)."""
+        key = self.key(business_id, query, k, mode, filters)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        return self._flight.do(key, lambda: self._search(key, search))
+
+    def _search(self, key: tuple, search: Callable[[], SearchResult]) -> SearchResult:
+        entry_ids, scores = search()
+        # Los arreglos se comparten entre peticiones: se marcan como solo lectura
+        entry_ids.flags.writeable = False
+        scores.flags.writeable = False
+        self.cache.set(key, (entry_ids, scores))
+        return entry_ids, scores
+
+    def stats(self) -> Dict[str, float]:
+        stats = self.cache.stats()
+        requests = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "single_flight_shared": self._flight.shared,
+            "hit_rate": (stats["hits"] + self._flight.shared) / requests if requests else 0.0,
+        }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_search_result_cache() -> SearchResultCache:
+    """Caché de resultados compartida por todas las peticiones de este proceso."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            # Importación diferida: embeding configura el cliente de Gemini al importarse
+            from embeding import search_state
+
+            _result_cache = SearchResultCache(get_knowledge_versions(), search_state)
+        return _result_cache
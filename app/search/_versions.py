@@ -0,0 +1,59 @@
+""" Versión de la base de conocimiento de cada negocio, compartida entre procesos
+"""
+import os
+import sqlite3
+import threading
+
+DEFAULT_VERSIONS_PATH = os.getenv("SEARCH_STATE_PATH", "search_state.sqlite3")
+
+
+class KnowledgeVersions:
+    """
+    Contador por negocio (SQLite) que se incrementa con cada alta o edición de
+    una entrada. Los índices y cachés en memoria de cada worker comparan su
+    versión con la de aquí para saber si otro proceso cambió el negocio.
+    """
+
+    def __init__(self, path: str = DEFAULT_VERSIONS_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS versions (business_id INTEGER PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, business_id: int) -> int:
+        row = self._connection().execute("SELECT version FROM versions WHERE business_id = ?", (int(business_id),)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, business_id: int) -> int:
+        """Incrementa la versión del negocio y devuelve la nueva."""
+        db = self._connection()
+        with db:
+            db.execute(
+                "INSERT INTO versions VALUES (?, 1) ON CONFLICT(business_id) DO UPDATE SET version = version + 1",
+                (int(business_id),),
+            )
+            return db.execute("SELECT version FROM versions WHERE business_id = ?", (int(business_id),)).fetchone()[0]
+
+
+_versions = None
+_versions_lock = threading.Lock()
+
+
+def get_knowledge_versions() -> KnowledgeVersions:
+    global _versions
+    with _versions_lock:
+        if _versions is None:
+            _versions = KnowledgeVersions()
+        return _versions
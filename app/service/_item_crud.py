@@ -1,11 +1,15 @@
-from typing import List
+from typing import List, Optional
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
 from app.models.sql_alchemy_models import Item 
-from app.data._item_crud import create_item_data, delete_item_data,update_item_data,get_item_data, create_item_categories
-from app.schemas._item import ItemBase, ItemNotFoundError, ItemResponse, DeleteItemResponse
+from app.data._item_crud import create_item_data, delete_item_data,update_item_data,get_item_data, create_item_categories, get_item_business_id, get_items_by_ids
+from app.schemas._item import ItemBase, ItemNotFoundError, ItemResponse, ItemSearchResult, DeleteItemResponse, ItemCategorySuggestionRequest, CategorySuggestion
 from app.schemas._error import ErrorType, raise_app_error
+from embeding import delete_item_embedding, enqueue_item_embedding, nearest_items, search_item_ids
+
+# Items vecinos que votan en las sugerencias de categorías
+SUGGESTION_NEIGHBORS = 20
 
 
 def generate_item_slug(name: str, user_id: str, business_id: int) -> str:
@@ -45,6 +49,7 @@ def create_item_service(
 
         record: Item = create_item_data(db_Item, db)
         item_categories=create_item_categories(item_create.categories, record.item_id, db)
+        _index_item(record.item_id, record.business_id, record.item_name, record.item_description, item_categories)
         
         return ItemResponse(
             business_id=record.business_id,
@@ -80,6 +85,8 @@ def update_item_service(
             item_data=item_update,
             item_id=item_id
         )
+        category_ids = [ic.category_id for ic in record.categories]
+        _index_item(record.item_id, record.business_id, record.item_name, record.item_description, category_ids)
 
         return ItemResponse(
             business_id=record.business_id,
@@ -90,7 +97,7 @@ def update_item_service(
             price=record.price,
             price_discount=record.price_discount,
             is_visible=record.is_visible,
-            categories=[ic.category_id for ic in record.categories],  # ← Extrae los IDs
+            categories=category_ids,
             created_at=record.created_at,
             updated_at=record.updated_at
         )
@@ -174,7 +181,12 @@ def delete_item_service(
         db (Session): The database session.
     """
     try:
+        business_id = get_item_business_id(item_id, db)
         response = delete_item_data(item_id, db)
+        try:
+            delete_item_embedding(item_id, business_id)
+        except Exception as e:
+            print(f"ADVERTENCIA: El item {item_id} se borró, pero no se pudo borrar su embedding: {e}")
         return response
         
     except ItemNotFoundError:
@@ -187,4 +199,88 @@ def delete_item_service(
             message="Failed to delete Item in service layer.",
             error_type=ErrorType.SERVICE,
             details=str(e)
-        )
\ No newline at end of file
+        )
+
+
+def search_items_service(db: Session, business_id: int, query: str, k: int = 10, category_ids: Optional[List[int]] = None) -> List[ItemSearchResult]:
+    """
+    Búsqueda semántica de items de un negocio por nombre y descripción. Los
+    items se traen con una sola consulta a la BD (con sus categorías),
+    conservando el orden del ranking.
+    """
+    try:
+        item_ids, scores = search_item_ids(business_id, query, k, category_ids)
+    except Exception as e:
+        raise_app_error(
+            error_code="ItemSearchError",
+            message="Failed to search Items in service layer.",
+            error_type=ErrorType.SERVICE,
+            details=str(e)
+        )
+
+    items = {item.item_id: item for item in get_items_by_ids(business_id, item_ids.tolist(), db)}
+    results = []
+    for item_id, score in zip(item_ids.tolist(), scores.tolist()):
+        # Un vector puede sobrevivir unos segundos a su item borrado: se omite
+        item = items.get(item_id)
+        if item is not None:
+            results.append(ItemSearchResult(
+                business_id=item.business_id,
+                item_id=item.item_id,
+                item_slug=item.item_slug,
+                item_name=item.item_name,
+                item_description=item.item_description,
+                price=float(item.price) if item.price else None,
+                price_discount=float(item.price_discount) if item.price_discount else None,
+                is_visible=item.is_visible,
+                categories=[ic.category_id for ic in item.categories],
+                created_at=item.created_at,
+                updated_at=item.updated_at,
+                score=score,
+            ))
+    return results
+
+
+def suggest_item_categories_service(data: ItemCategorySuggestionRequest) -> List[CategorySuggestion]:
+    """
+    Sugiere categorías para un item nuevo sin llamar a un LLM: cada uno de los
+    items más parecidos del negocio vota por sus categorías con un peso igual
+    a su similitud. Las categorías salen del índice vectorial, sin consultar
+    la BD; un negocio sin items indexados no recibe sugerencias.
+    """
+    try:
+        item_ids, scores, metadata = nearest_items(data.business_id, data.item_name, data.item_description, SUGGESTION_NEIGHBORS)
+    except Exception as e:
+        raise_app_error(
+            error_code="ItemSuggestionError",
+            message="Failed to suggest Item categories in service layer.",
+            error_type=ErrorType.SERVICE,
+            details=str(e)
+        )
+
+    weights = {}
+    votes = {}
+    total = 0.0
+    for score, item_metadata in zip(scores.tolist(), metadata):
+        # Los vecinos sin parecido (similitud <= 0) no votan
+        if item_metadata is None or score <= 0:
+            continue
+        total += score
+        for category in item_metadata.categories:
+            category_id = int(category)
+            weights[category_id] = weights.get(category_id, 0.0) + score
+            votes[category_id] = votes.get(category_id, 0) + 1
+    ranked = sorted(weights, key=lambda category_id: (-weights[category_id], category_id))[:data.limit]
+    return [
+        CategorySuggestion(category_id=category_id, score=weights[category_id] / total, votes=votes[category_id])
+        for category_id in ranked
+    ]
+
+
+def _index_item(item_id: int, business_id: int, item_name: str, item_description: str, category_ids: List[int]) -> None:
+    """Encola el embedding del item; un fallo aquí no deshace la escritura."""
+    try:
+        enqueue_item_embedding(item_id, business_id, item_name, item_description, category_ids)
+    except Exception as e:
+        # La próxima ejecución de generar_embeddings_items.py lo generará
+        print(f"ADVERTENCIA: El item {item_id} se guardó, pero no se pudo encolar su embedding: {e}")
@@ -1,9 +1,18 @@
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.schemas._error import ErrorType, raise_app_error
-from app.schemas._knowledge_entry import KnowledgeEntryCreate, KnowledgeEntryDBModel, KnowledgeEntryUpdate, KnowledgeEntryResponse, KnowledgeEntryImproved
-from app.data._knowledge_entry_crud import create_knowledge_entry, update_knowledge_entry
-from app.utils.agent_improved import create_enhanced_entry_agent
-from embeding import add_embedding_to_store
+from typing import List, Optional
+
+import numpy as np
+from app.schemas._knowledge_entry import KnowledgeEntryCreate, KnowledgeEntryDBModel, KnowledgeEntryUpdate, KnowledgeEntryResponse, KnowledgeEntryImproved, KnowledgeEntrySearchResult, KnowledgeEntryBatchSearch, KnowledgeEntryBatchSearchResult
+from app.data._knowledge_entry_crud import create_knowledge_entry, create_knowledge_entry_async, get_knowledge_entries_by_ids, update_knowledge_entry
+from app.utils.agent_improved import create_enhanced_entry_agent, create_enhanced_entry_agent_async
+from app.search._bm25 import get_lexical_index
+from app.search._fusion import reciprocal_rank_fusion
+from app.search._result_cache import get_search_result_cache
+from app.embeddings._filters import SearchFilter
+from embeding import enqueue_embedding, query_cache_stats, score_entry_ids, search_entry_ids, search_entry_ids_batch, update_embedding_metadata
 
 def create_knowledge_entry_service(db: Session, data: KnowledgeEntryCreate) -> KnowledgeEntryImproved:
     """
@@ -40,17 +49,17 @@ def create_knowledge_entry_service(db: Session, data: KnowledgeEntryCreate) -> K
             details=str(e)
         )
 
-def create_knowledge_entry_service2(db: Session, data: KnowledgeEntryCreate) -> KnowledgeEntryImproved:
+async def create_knowledge_entry_service_async(db: AsyncSession, data: KnowledgeEntryCreate) -> KnowledgeEntryImproved:
     """
     Servicio para crear una nueva entrada, enriqueciéndola con el agente de IA
-    y generando su embedding de forma inmediata.
+    y encolando la generación de su embedding en el worker de segundo plano.
+    El agente y la BD se esperan sin ocupar un hilo, así que muchas altas
+    lentas concurrentes no agotan el threadpool del resto de rutas.
     """
     print("Recibida nueva entrada. Enviando al agente de IA para mejorarla...")
     try:
-        # 1. Llamamos al agente de IA para mejorar el título y contenido
-        enhanced_data = create_enhanced_entry_agent(data.title, data.content)
+        enhanced_data = await create_enhanced_entry_agent_async(data.title, data.content)
 
-        # 2. Preparamos el objeto completo para la base de datos
         new_data_for_db = KnowledgeEntryDBModel(
             business_id=data.business_id,
             title=data.title,
@@ -62,36 +71,152 @@ def create_knowledge_entry_service2(db: Session, data: KnowledgeEntryCreate) ->
             categories=enhanced_data.categories
         )
 
-        # 3. Guardamos la entrada en la base de datos para obtener su ID
-        entry = create_knowledge_entry(db, new_data_for_db)
+        entry = await create_knowledge_entry_async(db, new_data_for_db)
         print(f"Entrada creada en la base de datos con ID: {entry.entry_id}")
 
-        # 4. ¡NUEVO PASO! Generamos y guardamos el embedding para esta nueva entrada
-        # Lo hacemos en un try/except para que un fallo aquí no impida la creación del entry
+        # La cola de embeddings es un SQLite local: se escribe en un hilo, sin esperar a la red
         try:
-            add_embedding_to_store(
+            await asyncio.to_thread(
+                enqueue_embedding,
                 entry_id=entry.entry_id,
+                business_id=entry.business_id,
                 improved_title=entry.improved_title,
-                improved_content=entry.improved_content
+                improved_content=entry.improved_content,
+                categories=entry.categories,
+                content_type=entry.content_type
             )
         except Exception as e:
-            # En una aplicación real, aquí podrías loggear este error específico
-            # para regenerar el embedding más tarde.
-            print(f"ADVERTENCIA: La entrada {entry.entry_id} se creó, pero falló la generación de su embedding: {e}")
-
+            print(f"ADVERTENCIA: La entrada {entry.entry_id} se creó, pero no se pudo encolar su embedding: {e}")
 
-        # 5. Validamos y devolvemos el modelo de respuesta final
         return KnowledgeEntryImproved.model_validate(entry)
 
     except Exception as e:
-        # Tu manejador de errores existente
         raise_app_error(
             error_code="EntryServiceError",
             message="Failed to create Entry in service layer.",
-            error_type="SERVICE", # Asumo que tienes un Enum o similar
+            error_type=ErrorType.SERVICE,
             details=str(e)
         )
 
 def update_knowledge_entry_service(db: Session, entry_id: int, data: KnowledgeEntryUpdate) -> KnowledgeEntryResponse:
     entry = update_knowledge_entry(db, entry_id, data)
+    # El vector guarda el content_type para filtrar búsquedas: se actualiza sin volver a embeber
+    try:
+        update_embedding_metadata(entry.entry_id, entry.business_id, entry.categories, entry.content_type)
+    except Exception as e:
+        print(f"ADVERTENCIA: No se pudieron actualizar los metadatos del embedding de la entrada {entry.entry_id}: {e}")
     return KnowledgeEntryResponse.model_validate(entry)
+
+
+SEARCH_MODES = ("vector", "lexical", "hybrid", "prefilter")
+# Candidatos que aporta cada lado a la fusión híbrida, por cada resultado pedido
+HYBRID_CANDIDATES_FACTOR = 4
+# Candidatos léxicos que se puntúan con vectores en el modo "prefilter"
+PREFILTER_CANDIDATES = 200
+
+
+def search_entry_ids_by_mode(business_id: int, query: str, k: int, mode: str, filters: Optional[SearchFilter] = None):
+    """
+    ``(entry_ids, puntuaciones)`` según el modo de búsqueda:
+
+    - ``vector``: similitud coseno con el embedding de la consulta. Admite
+      ``filters`` (categorías y content_type), aplicados antes de puntuar.
+    - ``lexical``: BM25 sobre título y contenido mejorados y categorías (nombres exactos, SKUs).
+    - ``hybrid``: fusión RRF de ambos rankings.
+    - ``prefilter``: BM25 elige los candidatos y solo esos se puntúan con vectores.
+    """
+    if filters is not None and mode != "vector":
+        raise ValueError(f"Los filtros solo se admiten en el modo 'vector', se recibió '{mode}'")
+    if mode == "vector":
+        return search_entry_ids(business_id, query, k, filters)
+    if mode == "lexical":
+        return get_lexical_index().search(business_id, query, k)
+    if mode == "hybrid":
+        depth = k * HYBRID_CANDIDATES_FACTOR
+        vector_ids, _ = search_entry_ids(business_id, query, depth)
+        lexical_ids, _ = get_lexical_index().search(business_id, query, depth)
+        return reciprocal_rank_fusion([vector_ids, lexical_ids], k)
+    if mode == "prefilter":
+        candidate_ids, _ = get_lexical_index().search(business_id, query, max(PREFILTER_CANDIDATES, k))
+        entry_ids, scores = score_entry_ids(business_id, query, candidate_ids.tolist())
+        order = np.argsort(scores)[::-1][:k]
+        return entry_ids[order], scores[order]
+    raise ValueError(f"Modo de búsqueda no soportado: {mode}")
+
+
+def search_knowledge_entries_service(
+    db: Session,
+    business_id: int,
+    query: str,
+    k: int = 10,
+    mode: str = "vector",
+    categories: Optional[List[str]] = None,
+    content_type: Optional[str] = None,
+) -> List[KnowledgeEntrySearchResult]:
+    """
+    Búsqueda de entradas de un negocio (ver ``search_entry_ids_by_mode``). Las
+    entradas se traen con una sola consulta a la BD, conservando el orden.
+    Los rankings se guardan en la caché de resultados hasta que el negocio cambia.
+    """
+    try:
+        filters = SearchFilter.of(categories, content_type)
+        entry_ids, scores = get_search_result_cache().get_or_search(
+            business_id, query, k, mode, filters,
+            lambda: search_entry_ids_by_mode(business_id, query, k, mode, filters),
+        )
+    except Exception as e:
+        raise_app_error(
+            error_code="EntrySearchError",
+            message="Failed to search Entries in service layer.",
+            error_type=ErrorType.SERVICE,
+            details=str(e)
+        )
+
+    entries = {entry.entry_id: entry for entry in get_knowledge_entries_by_ids(db, business_id, entry_ids.tolist())}
+    return _search_results(entries, entry_ids, scores)
+
+
+def search_knowledge_entries_batch_service(db: Session, data: KnowledgeEntryBatchSearch) -> List[KnowledgeEntryBatchSearchResult]:
+    """
+    Búsqueda vectorial de varias consultas de un negocio: un solo lote de
+    embeddings, un producto matriz-matriz y una sola consulta a la BD para
+    traer las entradas de todos los resultados.
+    """
+    try:
+        filters = SearchFilter.of(data.categories, data.content_type)
+        rankings = search_entry_ids_batch(data.business_id, data.queries, data.k, filters)
+    except Exception as e:
+        raise_app_error(
+            error_code="EntrySearchError",
+            message="Failed to search Entries in service layer.",
+            error_type=ErrorType.SERVICE,
+            details=str(e)
+        )
+
+    all_ids = list({entry_id for entry_ids, _ in rankings for entry_id in entry_ids.tolist()})
+    entries = {entry.entry_id: entry for entry in get_knowledge_entries_by_ids(db, data.business_id, all_ids)}
+    return [
+        KnowledgeEntryBatchSearchResult(query=query, results=_search_results(entries, entry_ids, scores))
+        for query, (entry_ids, scores) in zip(data.queries, rankings)
+    ]
+
+
+def _search_results(entries: dict, entry_ids: np.ndarray, scores: np.ndarray) -> List[KnowledgeEntrySearchResult]:
+    results = []
+    for entry_id, score in zip(entry_ids.tolist(), scores.tolist()):
+        # Un vector puede sobrevivir unos segundos a su entrada borrada: se omite
+        entry = entries.get(entry_id)
+        if entry is not None:
+            results.append(KnowledgeEntrySearchResult.model_validate({
+                **KnowledgeEntryImproved.model_validate(entry).model_dump(),
+                "score": score,
+            }))
+    return results
+
+
+def search_metrics_service() -> dict:
+    """Métricas de la búsqueda: aciertos de la caché de resultados y de la de embeddings de consultas."""
+    return {
+        "search_result_cache": get_search_result_cache().stats(),
+        "query_embedding_cache": query_cache_stats(),
+    }
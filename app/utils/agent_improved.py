@@ -1,11 +1,17 @@
 import google.generativeai as genai
 
 from app.schemas._knowledge_entry import ImprovedEntryData
+import asyncio
+import hashlib
+import json
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from typing import List
+import threading
+from typing import Dict, List, Optional
+
+from app.utils.cache import AsyncSingleFlight, DiskCache, LRUCache, SingleFlight
 
 # --- PASO CLAVE: Cargar las variables de entorno desde el archivo .env ---
 # Esto debe ejecutarse antes de que intentes usar la variable de entorno.
@@ -105,47 +111,168 @@ AVAILABLE_ICONS =[
     "TruckIcon"
 ]
 
+# Modelo del agente: debe soportar salida estructurada (response_schema)
+AGENT_MODEL = os.getenv("ENHANCEMENT_AGENT_MODEL", "gemini-2.5-flash")
+
+# Instrucciones fijas del agente, incluida la lista de íconos. Van como
+# system_instruction del modelo, no en cada prompt.
+SYSTEM_INSTRUCTION_TEMPLATE = """Eres un experto editor de contenido y clasificador. Tu tarea es analizar el título y contenido proporcionados para mejorarlos y estructurarlos.
+
+Sigue estas instrucciones al pie de la letra:
+1.  **Mejora el Título**: Crea un nuevo título que sea más claro, descriptivo y atractivo que el original.
+2.  **Mejora el Contenido**: Reescribe o formatea el contenido para que sea más fácil de leer, corrigiendo errores gramaticales y mejorando la estructura. Puedes usar Markdown simple como negritas o listas si es necesario.
+3.  **Selecciona un Ícono**: De la siguiente lista de íconos disponibles, escoge UNO y solo UNO que mejor represente el tema del contenido: [{icons}].
+4.  **Genera Categorías con Emojis**: Basándote en el contenido, genera una lista de 2 a 5 categorías relevantes. Cada categoría DEBE tener el formato "emoji Nombre de Categoría". Por ejemplo: ["🤖 Tecnología", "💡 Productividad"]."""
+
+# Lo único que cambia por petición: el título y el contenido originales
+_PROMPT_PARTS = ('Título Original:\n"', '"\n\nContenido Original:\n"', '"')
+
+# Caché de respuestas del agente (vacío desactiva el nivel en disco)
+DEFAULT_CACHE_PATH = os.getenv("ENHANCEMENT_CACHE_PATH", "enhancement_cache.sqlite3")
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv("ENHANCEMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_CACHE_ENTRIES = int(os.getenv("ENHANCEMENT_CACHE_ENTRIES", "2000"))
+
+
+def prompt_version(model_name: str, system_instruction: str) -> str:
+    """
+    Huella de todo lo que, además del título y el contenido, determina la
+    respuesta: modelo, instrucciones (con los íconos), plantilla del prompt y
+    esquema de salida. Si algo cambia, cambian las claves de la caché.
+    """
+    parts = [model_name, system_instruction, *_PROMPT_PARTS, json.dumps(ImprovedEntryData.model_json_schema(), sort_keys=True)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class EnhancementAgent:
+    """
+    Agente que mejora una entrada (título, contenido, ícono y categorías).
+
+    Se crea una sola vez: el cliente del modelo, su configuración de salida
+    estructurada y la ``system_instruction`` con las reglas y los íconos se
+    reutilizan en todas las peticiones, que solo envían el título y el contenido.
+
+    Las respuestas se guardan en dos niveles, LRU en memoria y SQLite en disco
+    (compartido entre procesos y reinicios), con la clave
+    ``(modelo, versión del prompt, sha256(título, contenido))``: reenviar la
+    misma entrada (doble clic, reintentos, importaciones) no vuelve a llamar al
+    modelo, y peticiones iguales simultáneas comparten una sola llamada.
+    """
+
+    def __init__(
+        self,
+        model_name: str = AGENT_MODEL,
+        icons: List[str] = AVAILABLE_ICONS,
+        memory_entries: int = DEFAULT_CACHE_ENTRIES,
+        disk_path: Optional[str] = DEFAULT_CACHE_PATH,
+        disk_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ):
+        self.model_name = model_name
+        self.system_instruction = SYSTEM_INSTRUCTION_TEMPLATE.format(icons=", ".join(icons))
+        self.prompt_version = prompt_version(model_name, self.system_instruction)
+        self.memory = LRUCache(memory_entries)
+        self.disk = DiskCache(disk_path, disk_max_bytes) if disk_path else None
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+        self.model_calls = 0
+        self.model = genai.GenerativeModel(
+            model_name=model_name,
+            system_instruction=self.system_instruction,
+            generation_config=genai.types.GenerationConfig(
+                response_mime_type="application/json", # Forzamos la salida JSON
+                response_schema=ImprovedEntryData,
+            ),
+        )
+
+    @staticmethod
+    def build_prompt(title: str, content: str) -> str:
+        """Prompt de una petición: solo los datos originales de la entrada."""
+        before_title, between, after_content = _PROMPT_PARTS
+        return f"{before_title}{title}{between}{content}{after_content}"
+
+    def cache_key(self, title: str, content: str) -> str:
+        # El separador evita que ("ab", "c") y ("a", "bc") compartan clave
+        digest = hashlib.sha256(f"{title}\0{content}".encode("utf-8")).hexdigest()
+        return f"{self.model_name}|{self.prompt_version}|{digest}"
+
+    def enhance(self, title: str, content: str) -> ImprovedEntryData:
+        key = self.cache_key(title, content)
+        enhanced = self.memory.get(key)
+        if enhanced is None:
+            enhanced = self._flight.do(key, lambda: self._load_or_generate(key, title, content))
+        # Copia: quien llama puede modificar el resultado sin tocar la caché
+        return enhanced.model_copy(deep=True)
+
+    def _load_or_generate(self, key: str, title: str, content: str) -> ImprovedEntryData:
+        cached = self.disk.get(key) if self.disk is not None else None
+        if cached is not None:
+            enhanced = ImprovedEntryData.model_validate_json(cached)
+        else:
+            response = self.model.generate_content(self.build_prompt(title, content))
+            enhanced = self._parse_response(response)
+            if self.disk is not None:
+                self.disk.set(key, enhanced.model_dump_json().encode("utf-8"))
+        self.memory.set(key, enhanced)
+        return enhanced
+
+    async def enhance_async(self, title: str, content: str) -> ImprovedEntryData:
+        """
+        Igual que ``enhance``, pero sin ocupar un hilo mientras se espera al
+        modelo: usa el cliente async de Gemini. Solo las lecturas y escrituras
+        de la caché en disco (locales y breves) pasan por un hilo.
+        """
+        key = self.cache_key(title, content)
+        enhanced = self.memory.get(key)
+        if enhanced is None:
+            enhanced = await self._async_flight.do(key, lambda: self._load_or_generate_async(key, title, content))
+        return enhanced.model_copy(deep=True)
+
+    async def _load_or_generate_async(self, key: str, title: str, content: str) -> ImprovedEntryData:
+        cached = await asyncio.to_thread(self.disk.get, key) if self.disk is not None else None
+        if cached is not None:
+            enhanced = ImprovedEntryData.model_validate_json(cached)
+        else:
+            response = await self.model.generate_content_async(self.build_prompt(title, content))
+            enhanced = self._parse_response(response)
+            if self.disk is not None:
+                await asyncio.to_thread(self.disk.set, key, enhanced.model_dump_json().encode("utf-8"))
+        self.memory.set(key, enhanced)
+        return enhanced
+
+    def _parse_response(self, response) -> ImprovedEntryData:
+        self.model_calls += 1
+        return ImprovedEntryData.model_validate_json(response.text)
+
+    def stats(self) -> Dict[str, Optional[dict]]:
+        """Aciertos y fallos de cada nivel de la caché y llamadas reales al modelo."""
+        return {
+            "prompt_version": self.prompt_version,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "model_calls": self.model_calls,
+        }
+
+
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def get_enhancement_agent() -> EnhancementAgent:
+    """Agente compartido por todas las peticiones; la aplicación lo crea al arrancar."""
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            _agent = EnhancementAgent()
+        return _agent
+
+
 def create_enhanced_entry_agent(title: str, content: str) -> ImprovedEntryData:
     """
     Este es el agente de IA.
     Toma un título y contenido, y devuelve una estructura de datos mejorada.
     """
-    # Configura el modelo de Gemini
-    # Asegúrate de usar un modelo que soporte la salida estructurada, como gemini-2.5-flash
-    model = genai.GenerativeModel(
-        model_name='gemini-2.5-flash',
-        generation_config={"response_mime_type": "application/json"} # Forzamos la salida JSON
-    )
-
-    # Convertimos la lista de íconos a un string para el prompt
-    icons_list_str = ", ".join(AVAILABLE_ICONS)
-
-    # Creamos el prompt detallado para el modelo
-    prompt = f"""
-    Eres un experto editor de contenido y clasificador. Tu tarea es analizar el título y contenido proporcionados para mejorarlos y estructurarlos.
-
-    Sigue estas instrucciones al pie de la letra:
-    1.  **Mejora el Título**: Crea un nuevo título que sea más claro, descriptivo y atractivo que el original.
-    2.  **Mejora el Contenido**: Reescribe o formatea el contenido para que sea más fácil de leer, corrigiendo errores gramaticales y mejorando la estructura. Puedes usar Markdown simple como negritas o listas si es necesario.
-    3.  **Selecciona un Ícono**: De la siguiente lista de íconos disponibles, escoge UNO y solo UNO que mejor represente el tema del contenido: [{icons_list_str}].
-    4.  **Genera Categorías con Emojis**: Basándote en el contenido, genera una lista de 2 a 5 categorías relevantes. Cada categoría DEBE tener el formato "emoji Nombre de Categoría". Por ejemplo: ["🤖 Tecnología", "💡 Productividad"].
-
-    Título Original:
-    "{title}"
-
-    Contenido Original:
-    "{content}"
-    """
+    return get_enhancement_agent().enhance(title, content)
 
-    # Hacemos la llamada al API pidiendo la salida estructurada
-    # La librería se encargará de convertir el prompt y el esquema Pydantic
-    # en la instrucción correcta para el modelo.
-    response = model.generate_content(
-        prompt,
-        generation_config=genai.types.GenerationConfig(
-             response_schema=ImprovedEntryData, # ¡La magia sucede aquí!
-        )
-    )
-    
-    # La librería ya devuelve el objeto Pydantic parseado
-    return ImprovedEntryData.model_validate_json(response.text)
\ No newline at end of file
+
+async def create_enhanced_entry_agent_async(title: str, content: str) -> ImprovedEntryData:
+    """Versión async de ``create_enhanced_entry_agent`` para las rutas async."""
+    return await get_enhancement_agent().enhance_async(title, content)
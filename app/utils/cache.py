@@ -0,0 +1,239 @@
+""" Cachés reutilizables: LRU en memoria y caché persistente en disco (SQLite)
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """
+    LRU en memoria, segura entre hilos, con contadores de aciertos y fallos.
+    Con ``ttl_seconds``, las entradas también caducan pasado ese tiempo.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # clave -> (valor, instante de caducidad o None)
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] is not None and item[1] <= time.monotonic():
+                del self._data[key]
+                self.expired += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses, "expired": self.expired}
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: la primera ejecuta la
+    función y las demás esperan y reciben su resultado (o su excepción).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, "_Call"] = {}
+        self.shared = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class AsyncSingleFlight:
+    """
+    Versión de ``SingleFlight`` para corrutinas de un mismo event loop: la
+    primera llamada crea una tarea y las demás con la misma clave la esperan,
+    sin ocupar hilos. Cancelar a quien espera no cancela la tarea compartida.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, "asyncio.Future"] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+
+class DiskCache:
+    """
+    Caché clave -> bytes persistente en un archivo SQLite, compartible entre
+    procesos. Cuando el tamaño total supera ``max_bytes`` se eliminan las
+    entradas usadas hace más tiempo hasta bajar al 90 % del límite.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # Una conexión por hilo; WAL permite lectores concurrentes de varios procesos
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[bytes]:
+        db = self._connection()
+        row = db.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        with db:
+            db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return row[0]
+
+    def get_many(self, keys: list) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        db = self._connection()
+        found: Dict[str, bytes] = {}
+        # SQLite limita la cantidad de parámetros por consulta
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for key, value in db.execute(f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk):
+                found[key] = value
+            if found:
+                with db:
+                    db.execute(
+                        f"UPDATE cache SET accessed = ? WHERE key IN ({placeholders})",
+                        [time.time(), *chunk],
+                    )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+        db = self._connection()
+        now = time.time()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                [(key, value, len(value), now) for key, value in items.items()],
+            )
+        with self._lock:
+            if self._size is None:
+                self._size = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            else:
+                self._size += sum(len(value) for value in items.values())
+            if self._size > self.max_bytes:
+                self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        # El tamaño local es aproximado si otros procesos escriben; se recalcula aquí
+        target = int(self.max_bytes * 0.9)
+        with db:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            while total > target:
+                rows = db.execute("SELECT key, size FROM cache ORDER BY accessed LIMIT 256").fetchall()
+                if not rows:
+                    break
+                # Se lee por tandas pero solo se borra lo necesario para bajar del objetivo
+                evicted = []
+                for key, size in rows:
+                    if total <= target:
+                        break
+                    evicted.append((key,))
+                    total -= size
+                db.executemany("DELETE FROM cache WHERE key = ?", evicted)
+        self._size = total
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        size = self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        return {"entries": len(self), "bytes": size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,150 @@
+""" Micro-benchmark del agente de mejora: costo local por petición y tamaño del prompt
+
+Compara la forma anterior de ``create_enhanced_entry_agent`` (un
+``GenerativeModel`` nuevo, la lista de íconos unida y el prompt completo
+formateado en cada llamada) con ``EnhancementAgent``, que se crea una vez y
+por petición solo arma el prompt con el título y el contenido, y mide el
+costo de un acierto en la caché de respuestas (memoria y disco). No llama a la
+API salvo con ``--count-tokens``, que usa ``count_tokens`` para medir los
+tokens reales de cada prompt.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.agent_runtime
+    python -m benchmarks.agent_runtime --iterations 2000 --count-tokens --output agente.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import google.generativeai as genai
+
+from app.schemas._knowledge_entry import ImprovedEntryData
+from app.utils.agent_improved import AGENT_MODEL, AVAILABLE_ICONS, EnhancementAgent
+
+SAMPLE_TITLE = "Horario de atención"
+SAMPLE_CONTENT = "abrimos de lunes a viernes de 9 a 18hs, sabados medio dia. feriados cerrado salvo aviso"
+SAMPLE_RESPONSE = ImprovedEntryData(
+    improved_title="Horario de Atención",
+    improved_content="- **Lunes a viernes:** 9:00 a 18:00\n- **Sábados:** medio día\n- **Feriados:** cerrado, salvo aviso",
+    icon="CalendarIcon",
+    categories=["🕒 Horarios", "🏪 Atención al Cliente"],
+)
+
+
+def legacy_request(title: str, content: str):
+    """Trabajo local que hacía cada petición antes de ``EnhancementAgent`` (copia de referencia)."""
+    model = genai.GenerativeModel(
+        model_name=AGENT_MODEL,
+        generation_config={"response_mime_type": "application/json"},
+    )
+    icons_list_str = ", ".join(AVAILABLE_ICONS)
+    prompt = f"""
+    Eres un experto editor de contenido y clasificador. Tu tarea es analizar el título y contenido proporcionados para mejorarlos y estructurarlos.
+
+    Sigue estas instrucciones al pie de la letra:
+    1.  **Mejora el Título**: Crea un nuevo título que sea más claro, descriptivo y atractivo que el original.
+    2.  **Mejora el Contenido**: Reescribe o formatea el contenido para que sea más fácil de leer, corrigiendo errores gramaticales y mejorando la estructura. Puedes usar Markdown simple como negritas o listas si es necesario.
+    3.  **Selecciona un Ícono**: De la siguiente lista de íconos disponibles, escoge UNO y solo UNO que mejor represente el tema del contenido: [{icons_list_str}].
+    4.  **Genera Categorías con Emojis**: Basándote en el contenido, genera una lista de 2 a 5 categorías relevantes. Cada categoría DEBE tener el formato "emoji Nombre de Categoría". Por ejemplo: ["🤖 Tecnología", "💡 Productividad"].
+
+    Título Original:
+    "{title}"
+
+    Contenido Original:
+    "{content}"
+    """
+    config = genai.types.GenerationConfig(response_schema=ImprovedEntryData)
+    return model, prompt, config
+
+
+def timed(function, iterations: int) -> float:
+    """Microsegundos por llamada."""
+    function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return 1e6 * (time.perf_counter() - start) / iterations
+
+
+def cache_hit_timings(iterations: int) -> dict:
+    """Microsegundos de un acierto en memoria y de uno en disco (sin llamar al modelo)."""
+    with tempfile.TemporaryDirectory() as root:
+        agent = EnhancementAgent(disk_path=os.path.join(root, "enhancement_cache.sqlite3"))
+        agent.disk.set(agent.cache_key(SAMPLE_TITLE, SAMPLE_CONTENT), SAMPLE_RESPONSE.model_dump_json().encode("utf-8"))
+
+        def disk_hit():
+            agent.memory.clear()
+            agent.enhance(SAMPLE_TITLE, SAMPLE_CONTENT)
+
+        timings = {
+            "disk_hit_us": timed(disk_hit, iterations),
+            "memory_hit_us": timed(lambda: agent.enhance(SAMPLE_TITLE, SAMPLE_CONTENT), iterations),
+        }
+        assert agent.model_calls == 0
+        return timings
+
+
+def run(iterations: int, count_tokens: bool) -> dict:
+    start = time.perf_counter()
+    agent = EnhancementAgent(disk_path=None)
+    startup_us = 1e6 * (time.perf_counter() - start)
+
+    _, legacy_prompt, _ = legacy_request(SAMPLE_TITLE, SAMPLE_CONTENT)
+    prompt = agent.build_prompt(SAMPLE_TITLE, SAMPLE_CONTENT)
+    report = {
+        "iterations": iterations,
+        "agent_startup_us": startup_us,
+        "legacy_us_per_request": timed(lambda: legacy_request(SAMPLE_TITLE, SAMPLE_CONTENT), iterations),
+        "agent_us_per_request": timed(lambda: agent.build_prompt(SAMPLE_TITLE, SAMPLE_CONTENT), iterations),
+        "legacy_prompt_chars": len(legacy_prompt),
+        "agent_prompt_chars": len(prompt),
+        "system_instruction_chars": len(agent.system_instruction),
+        **cache_hit_timings(iterations),
+    }
+    if count_tokens:
+        legacy_model = genai.GenerativeModel(model_name=AGENT_MODEL)
+        report["legacy_prompt_tokens"] = legacy_model.count_tokens(legacy_prompt).total_tokens
+        report["agent_prompt_tokens"] = legacy_model.count_tokens(prompt).total_tokens
+        # Con la system_instruction incluida: lo que se factura como entrada en cada llamada
+        report["agent_request_tokens"] = agent.model.count_tokens(prompt).total_tokens
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"Creación del agente (una vez al arrancar): {report['agent_startup_us']:.0f} µs")
+    print(f"{'':<28}{'µs/petición':>13}{'prompt (chars)':>16}{'prompt (tokens)':>17}")
+    print(
+        f"{'antes (modelo por petición)':<28}{report['legacy_us_per_request']:>13.1f}"
+        f"{report['legacy_prompt_chars']:>16}{report.get('legacy_prompt_tokens', '-'):>17}"
+    )
+    print(
+        f"{'EnhancementAgent':<28}{report['agent_us_per_request']:>13.1f}"
+        f"{report['agent_prompt_chars']:>16}{report.get('agent_prompt_tokens', '-'):>17}"
+    )
+    print(f"system_instruction: {report['system_instruction_chars']} caracteres, fija y al inicio de cada petición")
+    print(
+        f"Acierto en la caché de respuestas: {report['memory_hit_us']:.1f} µs en memoria, "
+        f"{report['disk_hit_us']:.1f} µs en disco (sin llamar al modelo)"
+    )
+    if "agent_request_tokens" in report:
+        print(f"Tokens de entrada por petición con la system_instruction: {report['agent_request_tokens']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--count-tokens", action="store_true", help="Cuenta tokens reales con la API (requiere GEMINI_API_KEY)")
+    parser.add_argument("--output", help="Guarda los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    report = run(args.iterations, args.count_tokens)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
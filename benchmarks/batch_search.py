@@ -0,0 +1,89 @@
+""" Benchmark de la búsqueda por lotes: coste por consulta según el tamaño del lote
+
+Compara N llamadas a ``EmbeddingStore.search`` (exacta) con una llamada a
+``search_many`` (producto matriz-matriz) sobre el mismo shard. Solo mide la
+puntuación: la llamada de embeddings también baja de N a 1 por lote.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.batch_search
+    python -m benchmarks.batch_search --rows 100000 --batch-sizes 1 8 64
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from app.embeddings._store import EmbeddingStore
+from benchmarks.quantization_recall import make_queries, synthetic_corpus
+
+K = 10
+
+
+def timed(function, repeats: int) -> float:
+    """Mejor tiempo de ``repeats`` ejecuciones, en segundos."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(rows: int, dim: int, batch_sizes, repeats: int, seed: int) -> dict:
+    matrix = synthetic_corpus(rows, dim, clusters=max(1, rows // 200), seed=seed)
+    queries = make_queries(matrix, max(batch_sizes), seed)
+    with tempfile.TemporaryDirectory() as root:
+        store = EmbeddingStore.open_or_create(root, dim)
+        store.replace_many(list(range(rows)), matrix, [b""] * rows, [""] * rows)
+        store.close()
+        store.compact()
+        store.refresh()
+
+        # Los resultados por lotes deben coincidir con los individuales
+        for query, (ids, _) in zip(queries[:4], store.search_many(queries[:4], K)):
+            assert ids.tolist() == store.search(query, K)[0].tolist()
+
+        curve = []
+        for batch_size in batch_sizes:
+            batch = queries[:batch_size]
+            loop_seconds = timed(lambda: [store.search(query, K) for query in batch], repeats)
+            batch_seconds = timed(lambda: store.search_many(batch, K), repeats)
+            curve.append({
+                "batch_size": batch_size,
+                "loop_ms_per_query": 1000 * loop_seconds / batch_size,
+                "batch_ms_per_query": 1000 * batch_seconds / batch_size,
+                "speedup": loop_seconds / batch_seconds,
+            })
+        store.close()
+    return {"rows": rows, "dim": dim, "k": K, "curve": curve}
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['rows']} vectores x {report['dim']} dimensiones, k={report['k']}")
+    print(f"{'lote':>6} {'bucle ms/consulta':>18} {'lote ms/consulta':>17} {'aceleración':>12}")
+    for point in report["curve"]:
+        print(
+            f"{point['batch_size']:>6} {point['loop_ms_per_query']:>18.3f} "
+            f"{point['batch_ms_per_query']:>17.3f} {point['speedup']:>11.1f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Coste por consulta de la búsqueda por lotes")
+    parser.add_argument("--rows", type=int, default=20_000, help="Vectores del shard sintético")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Guarda los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    report = run(args.rows, args.dim, args.batch_sizes, args.repeats, args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
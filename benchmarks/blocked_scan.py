@@ -0,0 +1,135 @@
+""" Benchmark de la búsqueda exacta por bloques frente a la matriz residente en memoria
+
+Compara ``index="exact"`` (la matriz float32 completa mapeada y residente, con
+los ids y el índice del snapshot) con ``index="blocked"`` para varios tamaños
+de bloque y de shard: latencia por consulta y memoria residente. Cada modo se
+mide en un proceso nuevo que abre el almacén y solo busca, así el pico de RSS
+(``VmHWM`` en Linux) es el de ese modo: con bloques el crecimiento debe quedar
+acotado al tamaño del bloque aunque el shard crezca, y en la ruta residente
+crece con el shard.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.blocked_scan
+    python -m benchmarks.blocked_scan --rows 50000 200000 --block-rows 1024 4096 16384
+"""
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+
+import numpy as np
+
+from app.embeddings._store import EmbeddingStore
+from benchmarks import retrieval
+from benchmarks.quantization_recall import make_queries, synthetic_corpus
+
+K = 10
+
+
+def peak_rss_bytes() -> int:
+    """
+    Pico de RSS de este proceso. En Linux se lee ``VmHWM``: ``ru_maxrss`` se
+    hereda del proceso padre al crear el hijo y ocultaría el pico propio.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return retrieval.peak_rss_bytes()
+
+
+def measure(root: str, queries: np.ndarray, index: str, block_rows: int) -> dict:
+    """
+    Latencia (p50 y media) y RSS de las búsquedas de un modo. Se ejecuta en un
+    proceso propio: ``search_rss_bytes`` es lo que el pico de RSS creció al buscar.
+    """
+    store = EmbeddingStore(root)
+    before = peak_rss_bytes()
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search(query, K, index=index, block_rows=block_rows)
+        latencies.append(time.perf_counter() - start)
+    after = peak_rss_bytes()
+    store.close()
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "mean_ms": float(latencies.mean()),
+        "peak_rss_bytes": after,
+        "search_rss_bytes": after - before,
+    }
+
+
+def run(rows: int, dim: int, clusters: int, block_sizes, queries_count: int, seed: int) -> dict:
+    matrix = synthetic_corpus(rows, dim, clusters, seed)
+    queries = make_queries(matrix, queries_count, seed)
+    # Procesos nuevos (spawn): no heredan la matriz sintética ni el RSS de este proceso
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as root:
+        store = EmbeddingStore.open_or_create(root, dim)
+        store.replace_many(list(range(rows)), matrix, [b""] * rows, [""] * rows)
+        store.close()
+        store.compact()
+        store.refresh()
+        del matrix
+
+        # La búsqueda por bloques es exacta: mismos resultados que la residente
+        for query in queries[:5]:
+            expected = store.search(query, K, index="exact")[0].tolist()
+            assert store.search(query, K, index="blocked", block_rows=min(block_sizes))[0].tolist() == expected
+        store.close()
+
+        modes = [("resident", "exact", min(block_sizes))]
+        modes += [(f"blocked-{block_rows}", "blocked", block_rows) for block_rows in block_sizes]
+        report = {
+            "rows": rows,
+            "dim": dim,
+            "queries": queries_count,
+            "matrix_bytes": rows * dim * 4,
+            "modes": {},
+        }
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for mode, index, block_rows in modes:
+                result = pool.apply(measure, (root, queries, index, block_rows))
+                if index == "blocked":
+                    result["block_bytes"] = block_rows * dim * 4
+                report["modes"][mode] = result
+    return report
+
+
+def print_report(reports) -> None:
+    print(f"{'vectores':>9} {'MB f32':>7} {'modo':<16} {'p50 ms':>8} {'media ms':>9} {'RSS búsqueda MB':>16} {'pico RSS MB':>12}")
+    for report in reports:
+        for mode, result in report["modes"].items():
+            print(
+                f"{report['rows']:>9} {report['matrix_bytes'] / 2**20:>7.0f} {mode:<16} {result['p50_ms']:>8.2f} "
+                f"{result['mean_ms']:>9.2f} {result['search_rss_bytes'] / 2**20:>16.1f} {result['peak_rss_bytes'] / 2**20:>12.1f}"
+            )
+    print("RSS búsqueda: crecimiento del pico de RSS del proceso al buscar, tras abrir el almacén.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Búsqueda exacta por bloques frente a la matriz residente")
+    parser.add_argument("--rows", type=int, nargs="+", default=[25_000, 100_000], help="Vectores de cada shard sintético")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--block-rows", type=int, nargs="+", default=[1024, 4096, 16384])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Guarda los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    reports = [run(rows, args.dim, args.clusters, args.block_rows, args.queries, args.seed) for rows in args.rows]
+    print_report(reports)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+""" Benchmark de la búsqueda cuantizada: memoria residente, latencia y pérdida de recall@10 por modo
+
+La latencia de la primera pasada (``QuantizedMatrix.scores``) se compara con la
+de float32, que es el recorrido exacto: la cuantización ahorra memoria, y esta
+columna muestra cuánto cuesta (o ahorra) en tiempo en la máquina actual.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.quantization_recall
+    python -m benchmarks.quantization_recall --rows 100000 --queries 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.embeddings._quantization import QUANTIZATION_MODES
+from app.embeddings._store import EmbeddingStore
+
+K = 10
+
+
+def synthetic_corpus(rows: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Vectores unitarios agrupados en ``clusters`` temas, parecidos a embeddings reales."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    matrix = centers[rng.integers(0, clusters, rows)] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def make_queries(matrix: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Consultas cercanas a vectores del corpus, con ruido."""
+    rng = np.random.default_rng(seed + 1)
+    queries = matrix[rng.integers(0, len(matrix), count)] + 0.3 * rng.standard_normal((count, matrix.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def python_json_bytes(rows: int, dim: int) -> int:
+    """Memoria aproximada del formato actual cargado con ``json.load``: listas de floats de Python."""
+    one_vector = sys.getsizeof([0.0] * dim) + dim * sys.getsizeof(0.0)
+    return rows * (one_vector + sys.getsizeof("000000") + 8)
+
+
+def run(name: str, matrix: np.ndarray, queries: np.ndarray, rescore_factor: int, json_file_bytes: int = None) -> dict:
+    rows, dim = matrix.shape
+    with tempfile.TemporaryDirectory() as root:
+        store = EmbeddingStore.open_or_create(root, dim)
+        store.replace_many(list(range(rows)), matrix, [b""] * rows, [""] * rows)
+        store.close()
+        store.compact()
+
+        truth = [set(store.search(query, K)[0].tolist()) for query in queries]
+        report = {
+            "dataset": name,
+            "rows": rows,
+            "dim": dim,
+            "queries": len(queries),
+            "json_python_bytes": python_json_bytes(rows, dim),
+            "json_file_bytes": json_file_bytes,
+            "modes": {},
+        }
+        for mode in QUANTIZATION_MODES:
+            resident = store._quantized_snapshot(mode)
+            first_pass_ms = p50_ms(resident.scores, queries)
+            for factor in sorted({1, rescore_factor}):
+                recalls = [
+                    len(expected & set(store.search(query, K, mode, factor)[0].tolist())) / max(1, len(expected))
+                    for query, expected in zip(queries, truth)
+                ]
+                report["modes"][f"{mode}/rescore x{factor}"] = {
+                    "resident_bytes": resident.nbytes,
+                    f"recall@{K}": float(np.mean(recalls)),
+                    "first_pass_p50_ms": first_pass_ms,
+                    "search_p50_ms": p50_ms(lambda query: store.search(query, K, mode, factor), queries),
+                }
+                if mode == "float32":
+                    break
+    return report
+
+
+def p50_ms(function, queries: np.ndarray) -> float:
+    """Latencia mediana de ``function(query)``, tras una llamada de calentamiento."""
+    function(queries[0])
+    latencies = np.empty(len(queries))
+    for position, query in enumerate(queries):
+        start = time.perf_counter()
+        function(query)
+        latencies[position] = time.perf_counter() - start
+    return float(1000 * np.median(latencies))
+
+
+def print_report(report: dict) -> None:
+    print(f"\n== {report['dataset']}: {report['rows']} vectores x {report['dim']}, {report['queries']} consultas ==")
+    float32 = report["modes"]["float32/rescore x1"]
+    # Columnas "vs f32": memoria ahorrada y tiempo de la primera pasada relativo al recorrido exacto
+    print(
+        f"{'modo':<22}{'memoria':>12}{'vs f32':>9}{'vs JSON':>9}{'recall@10':>11}{'pérdida':>9}"
+        f"{'1ª pasada':>11}{'vs f32':>9}{'p50 ms':>9}"
+    )
+    for mode, result in report["modes"].items():
+        recall = result[f"recall@{K}"]
+        print(
+            f"{mode:<22}{result['resident_bytes'] / 1e6:>10.2f}MB"
+            f"{float32['resident_bytes'] / result['resident_bytes']:>8.1f}x"
+            f"{report['json_python_bytes'] / result['resident_bytes']:>8.1f}x"
+            f"{recall:>11.4f}{1 - recall:>9.4f}"
+            f"{result['first_pass_p50_ms']:>9.2f}ms{result['first_pass_p50_ms'] / float32['first_pass_p50_ms']:>8.2f}x"
+            f"{result['search_p50_ms']:>9.2f}"
+        )
+    if report["json_file_bytes"]:
+        print(f"JSON en disco: {report['json_file_bytes'] / 1e6:.2f}MB; cargado en Python: ~{report['json_python_bytes'] / 1e6:.2f}MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", default="embeddings_locales.json", help="Embeddings en el formato JSON actual")
+    parser.add_argument("--rows", type=int, default=20_000, help="Vectores del corpus sintético")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Guarda los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    reports = []
+    if os.path.exists(args.json):
+        with open(args.json, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        matrix = np.asarray(list(data.values()), dtype=np.float32)
+        # El corpus real es pequeño: todas sus filas sirven de consultas
+        reports.append(run(args.json, matrix, matrix, args.rescore_factor, os.path.getsize(args.json)))
+    else:
+        print(f"ADVERTENCIA: No se encontró '{args.json}', solo se usa el corpus sintético")
+
+    matrix = synthetic_corpus(args.rows, args.dim, args.clusters, args.seed)
+    reports.append(run("sintético", matrix, make_queries(matrix, args.queries, args.seed), args.rescore_factor))
+
+    for report in reports:
+        print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
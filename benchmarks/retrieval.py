@@ -0,0 +1,212 @@
+""" Benchmark de recuperación: velocidad, memoria y recall@k de cada backend de búsqueda
+
+Para cada tamaño de corpus sintético (vectores unitarios agrupados por temas,
+dimensión 768 como los embeddings actuales) construye un almacén, calcula la
+verdad de referencia con búsqueda exacta y mide cada combinación de backend
+(``exact``, ``ivf``, ``blocked``) y cuantización: tiempo de construcción,
+memoria residente, latencia p50/p95/p99, QPS y recall@k.
+
+Los resultados se guardan en JSON (con la versión del código y la máquina)
+para comparar ejecuciones; ``--compare`` muestra la diferencia con otra.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.retrieval
+    python -m benchmarks.retrieval --sizes 10000 100000 --nprobe 8 16 32
+    python -m benchmarks.retrieval --output nuevo.json --compare anterior.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.embeddings._ann import ANN_MIN_ROWS
+from app.embeddings._matrix_store import DEFAULT_BLOCK_ROWS
+from app.embeddings._quantization import QUANTIZATION_MODES
+from app.embeddings._scoring import top_k_rows
+from app.embeddings._store import EmbeddingStore
+from benchmarks.quantization_recall import make_queries, synthetic_corpus
+
+# Consultas por bloque al calcular la verdad de referencia
+_TRUTH_CHUNK = 256
+
+
+def ground_truth(matrix: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    """Los ``k`` vecinos exactos de cada consulta, calculados fuera del almacén."""
+    truth = []
+    for start in range(0, len(queries), _TRUTH_CHUNK):
+        rows, _ = top_k_rows(queries[start:start + _TRUTH_CHUNK] @ matrix.T, k)
+        truth.extend(set(row.tolist()) for row in rows)
+    return truth
+
+
+def measure(search, queries: np.ndarray, truth: List[set], k: int) -> dict:
+    """Latencias, QPS (un hilo) y recall@k de ``search(query) -> entry_ids``."""
+    search(queries[0])
+    latencies = np.empty(len(queries))
+    recalls = np.empty(len(queries))
+    for position, (query, expected) in enumerate(zip(queries, truth)):
+        start = time.perf_counter()
+        entry_ids = search(query)
+        latencies[position] = time.perf_counter() - start
+        recalls[position] = len(expected & set(entry_ids.tolist())) / max(1, len(expected))
+    latencies_ms = 1000 * latencies
+    return {
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+        "qps": float(len(queries) / latencies.sum()),
+        f"recall@{k}": float(recalls.mean()),
+    }
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def run_size(rows: int, args: argparse.Namespace) -> dict:
+    matrix = synthetic_corpus(rows, args.dim, args.clusters, args.seed)
+    queries = make_queries(matrix, args.queries, args.seed)
+    truth = ground_truth(matrix, queries, args.k)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = EmbeddingStore.open_or_create(root, args.dim)
+        start = time.perf_counter()
+        store.replace_many(list(range(rows)), matrix, [b""] * rows, [""] * rows)
+        store.close()
+        write_seconds = time.perf_counter() - start
+        # La compactación escribe el snapshot y, desde ANN_MIN_ROWS filas, construye el índice IVF
+        start = time.perf_counter()
+        store.compact()
+        compact_seconds = time.perf_counter() - start
+        del matrix
+
+        report = {
+            "rows": rows,
+            "dim": args.dim,
+            "queries": args.queries,
+            "k": args.k,
+            "build": {"write_seconds": write_seconds, "compact_seconds": compact_seconds},
+            "backends": {},
+        }
+        float32_bytes = rows * args.dim * 4
+
+        for mode in args.quantization:
+            start = time.perf_counter()
+            resident = store._quantized_snapshot(mode)
+            prepare_seconds = time.perf_counter() - start
+            report["backends"][f"exact/{mode}"] = {
+                "prepare_seconds": prepare_seconds,
+                "resident_bytes": int(resident.nbytes),
+                **measure(lambda query: store.search(query, args.k, mode, args.rescore_factor, index="exact")[0], queries, truth, args.k),
+                "peak_rss_bytes": peak_rss_bytes(),
+            }
+
+        ann = store._ann_index()
+        if ann is None:
+            print(f"ADVERTENCIA: {rows} filas < {ANN_MIN_ROWS}: el snapshot no tiene índice IVF, se omite")
+        else:
+            ann_bytes = ann.centroids.nbytes + ann.list_offsets.nbytes + ann.list_rows.nbytes
+            for nprobe in args.nprobe:
+                report["backends"][f"ivf/float32/nprobe={nprobe}"] = {
+                    "nlist": ann.nlist,
+                    # Las filas candidatas se leen del memmap float32 del snapshot
+                    "resident_bytes": int(ann_bytes + float32_bytes),
+                    **measure(lambda query: store.search(query, args.k, index="ivf", nprobe=nprobe)[0], queries, truth, args.k),
+                    "peak_rss_bytes": peak_rss_bytes(),
+                }
+
+        for block_rows in args.block_rows:
+            report["backends"][f"blocked/float32/rows={block_rows}"] = {
+                "resident_bytes": int(min(block_rows, rows) * args.dim * 4),
+                **measure(lambda query: store.search(query, args.k, index="blocked", block_rows=block_rows)[0], queries, truth, args.k),
+                "peak_rss_bytes": peak_rss_bytes(),
+            }
+        store.close()
+    return report
+
+
+def environment() -> dict:
+    """Versión del código y de la máquina, para saber qué se está comparando."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    k = report["k"]
+    build = report["build"]
+    print(
+        f"\n== {report['rows']} vectores x {report['dim']}, {report['queries']} consultas "
+        f"(escritura {build['write_seconds']:.1f}s, compactación + IVF {build['compact_seconds']:.1f}s) =="
+    )
+    print(f"{'backend':<28}{'memoria':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'QPS':>9}{f'recall@{k}':>11}")
+    for name, result in report["backends"].items():
+        line = (
+            f"{name:<28}{result['resident_bytes'] / 1e6:>9.1f}MB{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+            f"{result['p99_ms']:>9.2f}{result['qps']:>9.0f}{result[f'recall@{k}']:>11.4f}"
+        )
+        previous = (baseline or {}).get("backends", {}).get(name)
+        if previous is not None:
+            line += f"   p50 {result['p50_ms'] - previous['p50_ms']:+.2f}ms, recall {result[f'recall@{k}'] - previous[f'recall@{k}']:+.4f}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000], help="Filas de cada corpus sintético")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--quantization", nargs="+", default=list(QUANTIZATION_MODES), choices=QUANTIZATION_MODES)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--block-rows", type=int, nargs="+", default=[DEFAULT_BLOCK_ROWS])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument(
+        "--output",
+        default=f"retrieval-{datetime.datetime.now():%Y%m%d-%H%M%S}.json",
+        help="Archivo JSON de resultados (por defecto, uno con la fecha y hora)",
+    )
+    parser.add_argument("--compare", help="Resultados JSON de una ejecución anterior para mostrar diferencias")
+    args = parser.parse_args()
+
+    baselines: Dict[int, dict] = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baselines = {report["rows"]: report for report in json.load(f)["runs"]}
+
+    results = {"environment": environment(), "parameters": vars(args), "runs": []}
+    for rows in args.sizes:
+        report = run_size(rows, args)
+        results["runs"].append(report)
+        print_report(report, baselines.get(rows))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResultados guardados en '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
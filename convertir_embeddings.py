@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+
+from app.data._db_config import get_db
+from app.models.sql_alchemy_models import KnowledgeEntries
+from app.embeddings._generations import GenerationalEmbeddingStore
+from app.embeddings._sharded_store import convert_json_to_sharded_store
+from embeding import EMBEDDINGS_DIR
+
+# Archivos JSON del formato antiguo y el modelo con el que se generó cada uno.
+# Cada uno se convierte en una generación del almacén versionado. Si el almacén
+# es nuevo, el primero queda como generación activa y el siguiente como
+# generación en relleno: se completa con
+#   python generar_embeddings.py --model models/text-embedding-004 --cut-over
+DEFAULT_JSON_FILES = {
+    'embeddings_locales.json': 'models/embedding-001',
+    'embeddings_locales_test.json': 'models/text-embedding-004',
+}
+
+
+def load_business_ids(entry_ids):
+    """Negocio de cada entrada, leído de la base de datos (el JSON antiguo no lo guarda)."""
+    db = next(get_db())
+    try:
+        rows = (
+            db.query(KnowledgeEntries.entry_id, KnowledgeEntries.business_id)
+            .filter(KnowledgeEntries.entry_id.in_(entry_ids))
+            .all()
+        )
+        return {row.entry_id: row.business_id for row in rows}
+    finally:
+        db.close()
+
+
+def convert_all(json_files):
+    generations = None
+    for json_path, model in json_files.items():
+        if not os.path.exists(json_path):
+            print(f"-> No se encontró '{json_path}'. Se omite.")
+            continue
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entry_ids = [int(entry_id) for entry_id in data]
+        dim = len(next(iter(data.values())))
+        del data
+
+        if generations is None:
+            generations = GenerationalEmbeddingStore(EMBEDDINGS_DIR, model, dim)
+        generation = generations.create_generation(model, dim)
+        if generation.name != generations.active().name:
+            generation = generations.start_backfill(model, dim)
+
+        store, skipped = convert_json_to_sharded_store(json_path, generation.store.root, load_business_ids(entry_ids), model)
+        print(f"-> '{json_path}' convertido a la generación '{generation.name}' ({len(store.business_ids())} negocios).")
+        if skipped:
+            print(f"   Entradas omitidas porque ya no existen en la base de datos: {skipped}")
+    if generations is not None:
+        backfill = generations.backfill()
+        print(f"Generación activa: '{generations.active().name}'; en relleno: '{backfill.name if backfill else None}'.")
+
+
+if __name__ == "__main__":
+    # Uso: python convertir_embeddings.py [archivo.json modelo ...]
+    args = sys.argv[1:]
+    convert_all(dict(zip(args[::2], args[1::2])) if args else DEFAULT_JSON_FILES)
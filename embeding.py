@@ -1,68 +1,319 @@
 import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
-from typing import Dict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.embeddings._cache import CachedEmbeddingProvider
+from app.embeddings._filters import EntryMetadata, SearchFilter
+from app.embeddings._generations import Generation, GenerationalEmbeddingStore, get_generational_store
+from app.embeddings._provider import GeminiEmbeddingProvider, configure_gemini
+from app.embeddings._query_cache import QueryEmbeddingCache
+from app.embeddings._scoring import normalize_rows
+from app.embeddings._store import BackgroundCompactor
+from app.embeddings._texts import build_entry_text, build_item_text, text_hash
+from app.embeddings._worker import EmbeddingWorker
 
 # --- Configuración Inicial ---
 # Asegúrate de que esto se ejecute al inicio de tu aplicación
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("No se encontró la variable de entorno GEMINI_API_KEY.")
-genai.configure(api_key=api_key)
+configure_gemini()
 
 # --- Constantes ---
-# Es una buena práctica definir el modelo y el nombre del archivo en un solo lugar
+# Directorio del almacén versionado: una generación por (modelo, dimensión).
+# El modelo en uso lo decide el archivo ACTIVE del almacén (ver generar_embeddings.py);
+# estos valores solo se usan para crear la primera generación de un almacén vacío.
+EMBEDDINGS_DIR = 'embeddings'
+# Los items del catálogo son otra colección, con su propio almacén y su propia cola
+ITEM_EMBEDDINGS_DIR = os.getenv("ITEM_EMBEDDINGS_DIR", "embeddings_items")
+ITEM_EMBEDDING_QUEUE_PATH = os.getenv("ITEM_EMBEDDING_QUEUE_PATH", "item_embedding_queue.sqlite3")
 EMBEDDING_MODEL = 'models/text-embedding-004' # Modelo recomendado para tareas de RAG
-EMBEDDINGS_FILE = 'embeddings_locales_test.json'
+EMBEDDING_DIM = 768
+# Dimensión nativa del modelo: otras dimensiones se piden con output_dimensionality
+NATIVE_EMBEDDING_DIM = 768
+# Primera pasada de la búsqueda: "float32" (exacta), "float16" o "int8" (con re-puntuación exacta)
+SEARCH_QUANTIZATION = os.getenv("EMBEDDING_SEARCH_QUANTIZATION", "float32")
+# "ivf" usa el índice aproximado de los shards grandes (los pequeños no tienen y se buscan
+# de forma exacta); "exact" recorre siempre todos los vectores; "blocked" también, pero
+# leyéndolos del disco por bloques sin mantener la matriz en memoria.
+SEARCH_INDEX = os.getenv("EMBEDDING_SEARCH_INDEX", "ivf")
+# Listas IVF visitadas por consulta: más listas = más recall y más latencia
+SEARCH_NPROBE = int(os.getenv("EMBEDDING_SEARCH_NPROBE", "16"))
+# Filas por bloque con SEARCH_INDEX="blocked": más filas = menos lecturas y más memoria
+SEARCH_BLOCK_ROWS = int(os.getenv("EMBEDDING_SEARCH_BLOCK_ROWS", "4096"))
+# Fracción de filas borradas o reemplazadas de un índice IVF a partir de la cual se reconstruye
+ANN_MAX_TOMBSTONE_RATIO = float(os.getenv("EMBEDDING_ANN_MAX_TOMBSTONE_RATIO", "0.2"))
+
+# Todas las llamadas de embeddings pasan por la caché direccionada por contenido
+_embedding_providers = {}
+
+
+def get_embedding_provider(generation: Generation) -> CachedEmbeddingProvider:
+    """Proveedor (con caché) del modelo y la dimensión de una generación."""
+    key = (generation.model, generation.dim)
+    if key not in _embedding_providers:
+        _embedding_providers[key] = CachedEmbeddingProvider(_gemini_provider(generation))
+    return _embedding_providers[key]
+
+
+def _gemini_provider(generation: Generation) -> GeminiEmbeddingProvider:
+    output_dimensionality = generation.dim if generation.dim != NATIVE_EMBEDDING_DIM else None
+    return GeminiEmbeddingProvider(generation.model, output_dimensionality)
+
+
+def get_embeddings_store() -> GenerationalEmbeddingStore:
+    """Almacén compartido por todas las peticiones de este proceso."""
+    return get_generational_store(EMBEDDINGS_DIR, EMBEDDING_MODEL, EMBEDDING_DIM)
+
+
+def get_item_embeddings_store() -> GenerationalEmbeddingStore:
+    """Almacén de los vectores de los items (mismo modelo inicial que las entradas)."""
+    return get_generational_store(ITEM_EMBEDDINGS_DIR, EMBEDDING_MODEL, EMBEDDING_DIM)
+
+
+def create_compactor(store: Optional[GenerationalEmbeddingStore] = None) -> BackgroundCompactor:
+    """
+    Compactador en segundo plano de un almacén (por defecto, el de las entradas);
+    se arranca con la aplicación. También reconstruye los índices IVF con
+    demasiados tombstones.
+    """
+    return BackgroundCompactor(store or get_embeddings_store(), max_tombstone_ratio=ANN_MAX_TOMBSTONE_RATIO)
+
+
+# Las consultas repetidas (búsquedas y bot) se sirven desde una caché propia con TTL
+_query_caches = {}
+
+
+def get_query_cache(generation: Generation) -> QueryEmbeddingCache:
+    """
+    Caché de embeddings de consultas del modelo y la dimensión de una generación.
+    Va directo al proveedor, sin la caché de documentos: su LRU con TTL es el
+    único nivel, así las consultas caducan y no se guardan en disco.
+    """
+    key = (generation.model, generation.dim)
+    if key not in _query_caches:
+        _query_caches[key] = QueryEmbeddingCache(_gemini_provider(generation))
+    return _query_caches[key]
+
+
+def query_cache_stats() -> list:
+    """Métricas de las cachés de consultas: tasa de aciertos y tiempo ahorrado por modelo."""
+    return [{"dim": dim, **cache.stats()} for (_, dim), cache in list(_query_caches.items())]
+
+
+def embed_query(query: str, store: Optional[GenerationalEmbeddingStore] = None) -> Tuple[Generation, np.ndarray]:
+    """
+    Embebe una consulta (RETRIEVAL_QUERY, normalizada) con el modelo de la
+    generación activa de ``store`` (por defecto, el de las entradas).
+    """
+    generation = (store or get_embeddings_store()).active()
+    query_vector = get_query_cache(generation).embed(query)
+    return generation, normalize_rows(query_vector)
+
+
+def embed_queries(queries: List[str]) -> Tuple[Generation, np.ndarray]:
+    """Como ``embed_query`` para un lote: una fila normalizada por consulta."""
+    generation = get_embeddings_store().active()
+    return generation, normalize_rows(get_query_cache(generation).embed_many(queries))
+
+
+def search_entry_ids(business_id: int, query: str, k: int = 10, filters: Optional[SearchFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca las ``k`` entradas de un negocio más parecidas a ``query`` en la
+    generación activa. Devuelve ``(entry_ids, puntuaciones)`` de mayor a menor.
+    Con ``filters`` solo se puntúan las entradas que lo cumplen.
+    """
+    generation, query_vector = embed_query(query)
+    return generation.store.search(
+        business_id, query_vector, k, SEARCH_QUANTIZATION,
+        index=SEARCH_INDEX, nprobe=SEARCH_NPROBE, filters=filters, block_rows=SEARCH_BLOCK_ROWS,
+    )
+
+
+def search_entry_ids_batch(
+    business_id: int,
+    queries: List[str],
+    k: int = 10,
+    filters: Optional[SearchFilter] = None,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Búsqueda de varias consultas de un negocio: una llamada de embeddings por
+    lote y un producto matriz-matriz. Devuelve ``(entry_ids, puntuaciones)`` por consulta.
+    """
+    generation, query_matrix = embed_queries(queries)
+    return generation.store.search_many(business_id, query_matrix, k, filters)
+
 
-def add_embedding_to_store(entry_id: int, improved_title: str, improved_content: str):
+def search_state(business_id: int) -> tuple:
     """
-    Genera un embedding para una única entrada y lo añade al almacén JSON.
-    Si el archivo no existe, lo crea.
+    Estado de los vectores de un negocio en la generación activa: cambia con
+    cualquier escritura en su shard (p. ej. el worker guardó un embedding
+    nuevo) y al activar otra generación.
+    """
+    generation = get_embeddings_store().active()
+    return generation.name, generation.store.version(business_id)
+
+
+def score_entry_ids(business_id: int, query: str, entry_ids) -> Tuple[np.ndarray, np.ndarray]:
+    """Similitud de ``query`` con las entradas indicadas (las que no tienen vector se omiten)."""
+    generation, query_vector = embed_query(query)
+    return generation.store.score(business_id, entry_ids, query_vector)
+
+
+_embedding_worker = None
+
+
+def get_embedding_worker() -> EmbeddingWorker:
+    """Worker de embeddings de este proceso; la aplicación lo arranca y detiene en su lifespan."""
+    global _embedding_worker
+    if _embedding_worker is None:
+        _embedding_worker = EmbeddingWorker(get_embeddings_store(), get_embedding_provider)
+    return _embedding_worker
+
+
+def enqueue_embedding(
+    entry_id: int,
+    business_id: int,
+    improved_title: str,
+    improved_content: str,
+    categories: Optional[List[str]] = None,
+    content_type: Optional[str] = None,
+) -> None:
+    """
+    Encola la generación del embedding de una entrada. Vuelve en cuanto el
+    trabajo queda guardado en disco; el worker lo procesa en segundo plano.
+    ``categories`` y ``content_type`` se guardan con el vector para filtrar búsquedas.
+    """
+    metadata = EntryMetadata.of(categories, content_type)
+    get_embedding_worker().submit(entry_id, business_id, improved_title, improved_content, metadata)
+    print(f"-> Embedding de la entrada ID: {entry_id} encolado.")
+
+
+def update_embedding_metadata(entry_id: int, business_id: int, categories: Optional[List[str]], content_type: Optional[str]) -> None:
+    """Actualiza los metadatos de filtro del vector de una entrada editada, sin volver a embeberla."""
+    metadata = EntryMetadata.of(categories, content_type)
+    for generation in get_embeddings_store().write_generations():
+        generation.store.update_metadata(business_id, [entry_id], [metadata])
+
+
+def add_embedding_to_store(
+    entry_id: int,
+    business_id: int,
+    improved_title: str,
+    improved_content: str,
+    categories: Optional[List[str]] = None,
+    content_type: Optional[str] = None,
+):
+    """
+    Genera el embedding de una única entrada de forma síncrona y lo añade al
+    shard de su negocio en cada generación que recibe escrituras (la activa y,
+    durante una migración, la que se está rellenando). La aplicación usa
+    ``enqueue_embedding``; esta función queda para scripts y pruebas.
     """
     print(f"-> Iniciando la generación de embedding para la entrada ID: {entry_id}")
 
-    # 1. Cargar el almacén de embeddings existente o crear uno nuevo
-    embeddings_store: Dict[str, list] = {}
-    try:
-        if os.path.exists(EMBEDDINGS_FILE):
-            with open(EMBEDDINGS_FILE, 'r', encoding='utf-8') as f:
-                embeddings_store = json.load(f)
-            print(f"-> Almacén de embeddings '{EMBEDDINGS_FILE}' cargado con {len(embeddings_store)} entradas.")
-        else:
-            print(f"-> No se encontró '{EMBEDDINGS_FILE}'. Se creará un nuevo archivo.")
-            
-    except json.JSONDecodeError:
-        print(f"-> ADVERTENCIA: El archivo '{EMBEDDINGS_FILE}' está corrupto o vacío. Se creará uno nuevo.")
-    
-    # 2. Preparar el texto para generar el embedding
+    # 1. Preparar el texto para generar el embedding
     # Usamos el contenido mejorado para obtener el mejor contexto semántico
-    text_to_embed = f"Título: {improved_title}\nContenido: {improved_content}"
-
-    # 3. Generar el embedding con la API de Gemini
-    try:
-        result = genai.embed_content(
-            model=EMBEDDING_MODEL,
-            content=text_to_embed,
-            task_type="RETRIEVAL_DOCUMENT" # Tarea optimizada para búsqueda (RAG)
+    text_to_embed = build_entry_text(improved_title, improved_content)
+
+    for generation in get_embeddings_store().write_generations():
+        # 2. Generar el embedding con el modelo de la generación
+        try:
+            new_embedding = get_embedding_provider(generation).embed(
+                [text_to_embed],
+                task_type="RETRIEVAL_DOCUMENT" # Tarea optimizada para búsqueda (RAG)
+            )[0]
+            print(f"-> Embedding ({generation.model}) generado exitosamente para la entrada ID: {entry_id}")
+        except Exception as e:
+            print(f"ERROR: No se pudo generar el embedding ({generation.model}) para la entrada {entry_id}. Error: {e}")
+            # Decidimos no continuar si la API de embedding falla.
+            return
+
+        # 3. Añadir el registro al log del shard (si el ID ya existía, el nuevo vector lo reemplaza)
+        try:
+            generation.store.add(
+                business_id, entry_id, new_embedding, text_hash(text_to_embed), generation.model,
+                EntryMetadata.of(categories, content_type),
+            )
+            print(f"-> Embedding para la entrada {entry_id} guardado en '{generation.name}'.")
+        except Exception as e:
+            print(f"ERROR: No se pudo guardar el embedding en '{generation.name}'. Error: {e}")
+
+
+# --- Items del catálogo ---
+
+_item_embedding_worker = None
+
+
+def get_item_embedding_worker() -> EmbeddingWorker:
+    """Worker de embeddings de los items; la aplicación lo arranca y detiene en su lifespan."""
+    global _item_embedding_worker
+    if _item_embedding_worker is None:
+        _item_embedding_worker = EmbeddingWorker(
+            get_item_embeddings_store(),
+            get_embedding_provider,
+            pending_path=ITEM_EMBEDDING_QUEUE_PATH,
+            text_builder=build_item_text,
+            name="item-embedding-worker",
         )
-        new_embedding = result['embedding']
-        print(f"-> Embedding generado exitosamente para la entrada ID: {entry_id}")
-    except Exception as e:
-        print(f"ERROR: No se pudo generar el embedding para la entrada {entry_id}. Error: {e}")
-        # Decidimos no continuar si la API de embedding falla.
-        return
-
-    # 4. Añadir el nuevo embedding al diccionario (usando el ID como clave string)
-    embeddings_store[str(entry_id)] = new_embedding
-
-    # 5. Guardar el diccionario actualizado de vuelta en el archivo JSON
-    try:
-        with open(EMBEDDINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(embeddings_store, f, indent=4)
-        print(f"-> Embedding para la entrada {entry_id} guardado. El almacén ahora tiene {len(embeddings_store)} entradas.")
-    except Exception as e:
-        print(f"ERROR: No se pudo guardar el archivo de embeddings '{EMBEDDINGS_FILE}'. Error: {e}")
+    return _item_embedding_worker
+
+
+def item_metadata(category_ids: List[int]) -> EntryMetadata:
+    """Los ids de categoría de un item se guardan con su vector para filtrar búsquedas."""
+    return EntryMetadata.of([str(category_id) for category_id in category_ids], None)
+
+
+def enqueue_item_embedding(item_id: int, business_id: int, item_name: str, item_description: str, category_ids: List[int]) -> None:
+    """
+    Encola el embedding de un item creado o editado. Si el texto no cambió, la
+    caché de embeddings evita otra llamada a la API y solo se reescriben sus categorías.
+    """
+    get_item_embedding_worker().submit(item_id, business_id, item_name, item_description or "", item_metadata(category_ids))
+    print(f"-> Embedding del item ID: {item_id} encolado.")
 
+
+def delete_item_embedding(item_id: int, business_id: int) -> None:
+    """Borra el vector de un item (tombstone) en cada generación que recibe escrituras."""
+    get_item_embedding_worker().cancel([item_id])
+    for generation in get_item_embeddings_store().write_generations():
+        generation.store.delete(business_id, item_id)
+
+
+def search_item_ids(
+    business_id: int,
+    query: str,
+    k: int = 10,
+    category_ids: Optional[List[int]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca los ``k`` items de un negocio más parecidos a ``query``. Devuelve
+    ``(item_ids, puntuaciones)`` de mayor a menor; con ``category_ids`` solo
+    los items de alguna de esas categorías.
+    """
+    store = get_item_embeddings_store()
+    generation, query_vector = embed_query(query, store)
+    filters = SearchFilter.of([str(category_id) for category_id in category_ids or ()])
+    return generation.store.search(
+        business_id, query_vector, k, SEARCH_QUANTIZATION,
+        index=SEARCH_INDEX, nprobe=SEARCH_NPROBE, filters=filters, block_rows=SEARCH_BLOCK_ROWS,
+    )
+
+
+def nearest_items(
+    business_id: int,
+    item_name: str,
+    item_description: str,
+    k: int = 20,
+) -> Tuple[np.ndarray, np.ndarray, List[Optional[EntryMetadata]]]:
+    """
+    Items de un negocio más parecidos a un borrador (nombre y descripción):
+    ``(item_ids, puntuaciones, metadatos)``. El borrador se embebe como un
+    documento más, así que al crear el item su embedding ya está en la caché.
+    """
+    generation = get_item_embeddings_store().active()
+    text = build_item_text(item_name, item_description or "")
+    vector = normalize_rows(get_embedding_provider(generation).embed([text], task_type="RETRIEVAL_DOCUMENT")[0])
+    item_ids, scores = generation.store.search(
+        business_id, vector, k, SEARCH_QUANTIZATION,
+        index=SEARCH_INDEX, nprobe=SEARCH_NPROBE, block_rows=SEARCH_BLOCK_ROWS,
+    )
+    return item_ids, scores, generation.store.metadata(business_id, item_ids.tolist())
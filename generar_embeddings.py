@@ -1,81 +1,100 @@
-import os
-import json
-import datetime
-import time
-
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# --- Imports de SQLAlchemy ---
-from sqlalchemy import create_engine, String, DateTime, ForeignKey
-from sqlalchemy.orm import sessionmaker, Mapped, mapped_column, declarative_base
-from sqlalchemy.exc import OperationalError, SQLAlchemyError
+import argparse
 
 from app.data._db_config import get_db
 from app.models.sql_alchemy_models import KnowledgeEntries
-
-
-# --- Cargar variables de entorno ---
-load_dotenv()
-
-# --- Configuración de Gemini API ---
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("No se encontró la API Key de Gemini")
-genai.configure(api_key=api_key)
-embedding_model = "models/embedding-001"
-
+from app.embeddings._filters import EntryMetadata
+from app.embeddings._generations import generation_name
+from app.embeddings._rebuild import rebuild_generation
+from app.embeddings._texts import build_entry_text
+# Importar embeding configura Gemini y comparte con la aplicación el almacén y los proveedores
+from embeding import EMBEDDING_DIM, get_embedding_provider, get_embeddings_store
+
+
+def iter_entry_pages(db, after_entry_id: int, page_size: int):
+    """
+    Recorre las entradas por páginas ordenadas por entry_id (keyset), trayendo
+    solo las columnas necesarias. Nunca hay más de una página en memoria.
+    Se leen los campos mejorados: son los que embeben la aplicación y el worker.
+    """
+    last_entry_id = after_entry_id
+    while True:
+        page = (
+            db.query(
+                KnowledgeEntries.entry_id.label("id"),
+                KnowledgeEntries.business_id,
+                KnowledgeEntries.improved_title,
+                KnowledgeEntries.improved_content,
+                KnowledgeEntries.categories,
+                KnowledgeEntries.content_type,
+            )
+            .filter(KnowledgeEntries.entry_id > last_entry_id)
+            .order_by(KnowledgeEntries.entry_id)
+            .limit(page_size)
+            .all()
+        )
+        if not page:
+            return
+        yield page
+        last_entry_id = page[-1].id
 
 
 # --- SCRIPT PRINCIPAL ---
-def generate_and_save_embeddings():
-
+def generate_and_save_embeddings(
+    batch_size: int = 100,
+    max_concurrency: int = 4,
+    requests_per_minute: float = 1500,
+    page_size: int = 1000,
+    restart: bool = False,
+    model: str = None,
+    dim: int = EMBEDDING_DIM,
+    cut_over: bool = False,
+):
+    """
+    Genera (de forma incremental) los embeddings de todas las entradas.
+
+    Sin ``model`` se actualiza la generación activa. Con un ``model`` distinto
+    se rellena una generación nueva mientras la aplicación sigue buscando en
+    la activa y escribe las entradas nuevas en ambas; con ``cut_over`` la
+    generación nueva pasa a ser la activa al terminar sin errores.
+    """
     print("Iniciando proceso de generación de embeddings...")
-    
+
     db_session_generator = get_db()
     db = next(db_session_generator) # Obtenemos la sesión del generador
 
     try:
-        print("Paso 1: Obteniendo datos desde la base de datos...")
-        # Usamos el ORM de SQLAlchemy para consultar los datos
-        entries = db.query(KnowledgeEntries).all()
-
-        if not entries:
-            print("No se encontraron entradas en la base de datos.")
-            return
-
-        print(f"Se encontraron {len(entries)} entradas. Procesando...")
-        
-        all_embeddings = {}
-
-        for entry in entries:
-            # Combinamos título y contenido para un embedding más rico en contexto
-            text_to_embed = f"Título: {entry.title}\nContenido: {entry.content}"
-            
-            print(f"  -> Procesando entry_id: {entry.entry_id}")
-            
-            try:
-                # Paso 2: Generar el embedding con Gemini
-                result = genai.embed_content(
-                    model=embedding_model,
-                    content=text_to_embed,
-                    task_type="RETRIEVAL_DOCUMENT"
-                )
-                
-                # Usamos el entry_id como clave en el diccionario (convertido a string)
-                all_embeddings[str(entry.entry_id)] = result['embedding']
-
-            except Exception as e:
-                print(f"    ERROR al procesar la entrada {entry.entry_id}: {e}")
-
-        # Paso 3: Guardar los embeddings en un archivo JSON local
-        output_filename = 'embeddings_locales.json'
-        print(f"\nProceso completado. Guardando {len(all_embeddings)} embeddings en '{output_filename}'...")
-        
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(all_embeddings, f, indent=4)
-            
-        print("¡Guardado exitoso!")
+        generations = get_embeddings_store()
+        if model and generation_name(model, dim) != generations.active().name:
+            generation = generations.start_backfill(model, dim)
+            print(f"Rellenando la generación '{generation.name}' (activa: '{generations.active().name}')")
+        else:
+            generation = generations.active()
+            print(f"Actualizando la generación activa '{generation.name}'")
+
+        # La caché evita pagar de nuevo textos ya embebidos (p. ej. textos repetidos entre negocios)
+        totals = rebuild_generation(
+            generation,
+            get_embedding_provider(generation),
+            lambda after_id, size: iter_entry_pages(db, after_id, size),
+            # Mismo texto que embebe la aplicación: título y contenido mejorados
+            lambda entry: build_entry_text(entry.improved_title, entry.improved_content),
+            lambda entry: EntryMetadata.of(entry.categories, entry.content_type),
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute,
+            page_size=page_size,
+            restart=restart,
+            label="entradas",
+        )
+
+        # Cambiar de generación de forma atómica, solo si el relleno quedó completo
+        if cut_over and generations.backfill() is not None and generations.backfill().name == generation.name:
+            if totals["failed"]:
+                print("No se cambia de generación: hubo entradas fallidas. Vuelve a ejecutar el script para completarlas.")
+            else:
+                previous = generations.active().name
+                generations.cut_over()
+                print(f"Generación activa: '{generation.name}' (la anterior, '{previous}', se conserva).")
 
     finally:
         # Nos aseguramos de cerrar la sesión que abrimos
@@ -84,4 +103,16 @@ def generate_and_save_embeddings():
 
 
 if __name__ == "__main__":
-    generate_and_save_embeddings()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Genera los embeddings de todas las entradas de conocimiento.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Textos por llamada batch (máx. 100)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Lotes enviados en paralelo")
+    parser.add_argument("--rpm", type=float, default=1500, help="Límite de peticiones por minuto")
+    parser.add_argument("--page-size", type=int, default=1000, help="Entradas leídas por consulta a la base de datos")
+    parser.add_argument("--restart", action="store_true", help="Ignora el checkpoint y recorre todo desde el principio")
+    parser.add_argument("--model", help="Modelo de una generación nueva a rellenar (por defecto, el de la activa)")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM, help="Dimensión de la generación nueva")
+    parser.add_argument("--cut-over", action="store_true", help="Activa la generación nueva al terminar el relleno")
+    args = parser.parse_args()
+    generate_and_save_embeddings(
+        args.batch_size, args.concurrency, args.rpm, args.page_size, args.restart, args.model, args.dim, args.cut_over
+    )
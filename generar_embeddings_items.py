@@ -0,0 +1,98 @@
+import argparse
+from typing import List, NamedTuple
+
+from app.data._db_config import get_db
+from app.models.sql_alchemy_models import Item, ItemCategory
+from app.embeddings._rebuild import rebuild_generation
+from app.embeddings._texts import build_item_text
+# Importar embeding configura Gemini y comparte con la aplicación el almacén y los proveedores
+from embeding import get_embedding_provider, get_item_embeddings_store, item_metadata
+
+
+class ItemRow(NamedTuple):
+    id: int
+    business_id: int
+    item_name: str
+    item_description: str
+    category_ids: List[int]
+
+
+def iter_item_pages(db, after_item_id: int, page_size: int):
+    """
+    Recorre los items por páginas ordenadas por item_id (keyset), con los ids
+    de categoría de cada item (una consulta más por página).
+    """
+    last_item_id = after_item_id
+    while True:
+        page = (
+            db.query(Item.item_id, Item.business_id, Item.item_name, Item.item_description)
+            .filter(Item.item_id > last_item_id)
+            .order_by(Item.item_id)
+            .limit(page_size)
+            .all()
+        )
+        if not page:
+            return
+        categories = {}
+        for item_id, category_id in (
+            db.query(ItemCategory.item_id, ItemCategory.category_id)
+            .filter(ItemCategory.item_id.in_([item.item_id for item in page]))
+            .all()
+        ):
+            categories.setdefault(item_id, []).append(category_id)
+        yield [
+            ItemRow(item.item_id, item.business_id, item.item_name, item.item_description or "", categories.get(item.item_id, []))
+            for item in page
+        ]
+        last_item_id = page[-1].item_id
+
+
+def generate_and_save_item_embeddings(
+    batch_size: int = 100,
+    max_concurrency: int = 4,
+    requests_per_minute: float = 1500,
+    page_size: int = 1000,
+    restart: bool = False,
+):
+    """
+    Genera (de forma incremental) los embeddings de todos los items del catálogo
+    en la generación activa del almacén de items. La aplicación los mantiene
+    al día al crear, editar y borrar items; este script construye el índice la
+    primera vez y repara lo que haya quedado desfasado.
+    """
+    print("Iniciando proceso de generación de embeddings de items...")
+
+    db_session_generator = get_db()
+    db = next(db_session_generator)
+
+    try:
+        generation = get_item_embeddings_store().active()
+        print(f"Actualizando la generación activa '{generation.name}'")
+        rebuild_generation(
+            generation,
+            get_embedding_provider(generation),
+            lambda after_id, size: iter_item_pages(db, after_id, size),
+            lambda item: build_item_text(item.item_name, item.item_description),
+            lambda item: item_metadata(item.category_ids),
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute,
+            page_size=page_size,
+            restart=restart,
+            label="items",
+        )
+
+    finally:
+        if db:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera los embeddings de todos los items del catálogo.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Textos por llamada batch (máx. 100)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Lotes enviados en paralelo")
+    parser.add_argument("--rpm", type=float, default=1500, help="Límite de peticiones por minuto")
+    parser.add_argument("--page-size", type=int, default=1000, help="Items leídos por consulta a la base de datos")
+    parser.add_argument("--restart", action="store_true", help="Ignora el checkpoint y recorre todo desde el principio")
+    args = parser.parse_args()
+    generate_and_save_item_embeddings(args.batch_size, args.concurrency, args.rpm, args.page_size, args.restart)
@@ -0,0 +1,90 @@
+""" Fixtures compartidas: servidor falso de Gemini y corpus sintéticos
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import numpy as np
+import pytest
+
+# Los módulos que configuran Gemini al importarse exigen una clave; nunca se usa contra la API real
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+
+class FakeGeminiServer:
+    """
+    Endpoint local que imita ``embedContent`` y ``batchEmbedContents`` por REST.
+    Cada texto recibe un vector determinista; ``fail_next`` respuestas seguidas
+    devuelven ``fail_status`` para probar reintentos.
+    """
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.requests: List[int] = []
+        self.fail_next = 0
+        self.fail_status = 429
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    failing = server.fail_next > 0
+                    if failing:
+                        server.fail_next -= 1
+                if failing:
+                    self._reply(server.fail_status, {"error": {"code": server.fail_status, "message": "falso", "status": "RESOURCE_EXHAUSTED"}})
+                    return
+                if "requests" in body:
+                    texts = [request["content"]["parts"][0]["text"] for request in body["requests"]]
+                    payload = {"embeddings": [{"values": server.vector(text)} for text in texts]}
+                else:
+                    texts = [body["content"]["parts"][0]["text"]]
+                    payload = {"embedding": {"values": server.vector(texts[0])}}
+                with server._lock:
+                    server.requests.append(len(texts))
+                self._reply(200, payload)
+
+            def _reply(self, status: int, payload: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(text.encode("utf-8")[:8].ljust(8, b"\0"), "little") ^ len(text)
+        return np.random.default_rng(seed).standard_normal(self.dim).tolist()
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """Gemini apuntando (``GEMINI_API_ENDPOINT``) a un servidor falso local."""
+    from app.embeddings._provider import configure_gemini
+
+    server = FakeGeminiServer()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("GEMINI_API_ENDPOINT", server.endpoint)
+    configure_gemini()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def clustered_vectors(rows: int, dim: int, clusters: int = 50, seed: int = 0) -> np.ndarray:
+    """Vectores unitarios agrupados por temas, como los embeddings reales."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    matrix = centers[rng.integers(0, clusters, rows)] + 0.35 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
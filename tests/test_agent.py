@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+import time
+
+from app.utils.agent_improved import EnhancementAgent
+
+
+class FakeModel:
+    """Sustituye al ``GenerativeModel`` de Gemini y cuenta las llamadas."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def _response(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+        payload = {"improved_title": "Título", "improved_content": "Contenido", "icon": "HomeIcon", "categories": ["📦 envíos"]}
+        return type("Response", (), {"text": json.dumps(payload)})()
+
+    def generate_content(self, prompt):
+        time.sleep(self.delay)
+        return self._response(prompt)
+
+    async def generate_content_async(self, prompt):
+        await asyncio.sleep(self.delay)
+        return self._response(prompt)
+
+
+def make_agent(tmp_path, delay=0.0, **kwargs):
+    agent = EnhancementAgent(disk_path=str(tmp_path / "agent.sqlite3"), **kwargs)
+    agent.model = FakeModel(delay)
+    return agent
+
+
+def test_repeated_entry_uses_cache(tmp_path):
+    agent = make_agent(tmp_path)
+    first = agent.enhance("envios", "tardan 3 dias")
+    first.categories.append("modificado")
+
+    second = agent.enhance("envios", "tardan 3 dias")
+
+    assert len(agent.model.prompts) == 1
+    assert second.categories == ["📦 envíos"]
+    assert "envios" in agent.model.prompts[0] and "tardan 3 dias" in agent.model.prompts[0]
+
+
+def test_disk_cache_is_shared_between_agents(tmp_path):
+    make_agent(tmp_path).enhance("envios", "tardan 3 dias")
+
+    other = make_agent(tmp_path)
+    other.enhance("envios", "tardan 3 dias")
+
+    assert other.model.prompts == []
+    assert other.stats()["disk"]["hits"] == 1
+
+
+def test_prompt_change_invalidates_cache(tmp_path):
+    make_agent(tmp_path).enhance("envios", "tardan 3 dias")
+
+    other = make_agent(tmp_path, icons=["HomeIcon"])
+    other.enhance("envios", "tardan 3 dias")
+
+    assert len(other.model.prompts) == 1
+
+
+def test_concurrent_requests_share_one_call(tmp_path):
+    agent = make_agent(tmp_path, delay=0.05)
+    threads = [threading.Thread(target=agent.enhance, args=("a", "b")) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(agent.model.prompts) == 1
+
+
+def test_enhance_async_shares_calls_and_cache(tmp_path):
+    agent = make_agent(tmp_path, delay=0.02)
+
+    async def main():
+        results = await asyncio.gather(*(agent.enhance_async("a", "b") for _ in range(5)))
+        results.append(await agent.enhance_async("a", "b"))
+        return results
+
+    results = asyncio.run(main())
+
+    assert len(agent.model.prompts) == 1
+    assert all(result.improved_title == "Título" for result in results)
+    # La versión sync encuentra la misma respuesta en caché
+    agent.enhance("a", "b")
+    assert len(agent.model.prompts) == 1
@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import OperationalError
+
+from app.data import _knowledge_entry_crud as entry_data
+from app.schemas._knowledge_entry import ImprovedEntryData, KnowledgeEntryCreate
+from app.service import _knowledge_entry_crud as entry_service
+
+
+class FakeAsyncSession:
+    """Imita lo que usa el camino async de un ``AsyncSession``: add/commit/refresh/rollback."""
+
+    def __init__(self, fail_commit=False):
+        self.fail_commit = fail_commit
+        self.added = []
+        self.rollbacks = 0
+        self._ids = itertools.count(1)
+
+    def add(self, entry):
+        self.added.append(entry)
+
+    async def commit(self):
+        await asyncio.sleep(0.01)
+        if self.fail_commit:
+            raise OperationalError("INSERT", {}, Exception("conexión perdida"))
+
+    async def refresh(self, entry):
+        entry.entry_id = next(self._ids)
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def service(monkeypatch):
+    enqueued = []
+    indexed = []
+
+    async def enhance(title, content):
+        await asyncio.sleep(0.05)
+        return ImprovedEntryData(improved_title=title.upper(), improved_content=content, icon="HomeIcon", categories=["📦 envíos"])
+
+    monkeypatch.setattr(entry_service, "create_enhanced_entry_agent_async", enhance)
+    monkeypatch.setattr(entry_service, "enqueue_embedding", lambda **job: enqueued.append(job))
+    monkeypatch.setattr(entry_data, "_index_entry", lambda entry: indexed.append(entry.entry_id))
+    return enqueued, indexed
+
+
+def entry(index=0):
+    return KnowledgeEntryCreate(business_id=7, title=f"envios {index}", content="tardan 3 dias", content_type="faq")
+
+
+def test_create_entry_async_saves_indexes_and_enqueues(service):
+    enqueued, indexed = service
+    db = FakeAsyncSession()
+
+    created = asyncio.run(entry_service.create_knowledge_entry_service_async(db, entry()))
+
+    assert created.entry_id == 1 and created.improved_title == "ENVIOS 0"
+    assert db.added[0].categories == ["📦 envíos"]
+    assert indexed == [1]
+    assert enqueued == [{
+        "entry_id": 1, "business_id": 7, "improved_title": "ENVIOS 0", "improved_content": "tardan 3 dias",
+        "categories": ["📦 envíos"], "content_type": "faq",
+    }]
+
+
+def test_concurrent_creations_overlap(service):
+    enqueued, _ = service
+
+    async def main():
+        db = FakeAsyncSession()
+        return await asyncio.gather(*(entry_service.create_knowledge_entry_service_async(db, entry(i)) for i in range(50)))
+
+    start = time.perf_counter()
+    created = asyncio.run(main())
+
+    # Cada alta espera 60 ms entre agente y BD: en serie serían 3 s
+    assert time.perf_counter() - start < 1.5
+    assert len(created) == 50 and len(enqueued) == 50
+    assert len({item.entry_id for item in created}) == 50
+
+
+def test_database_error_rolls_back_and_raises_app_error(service):
+    enqueued, indexed = service
+    db = FakeAsyncSession(fail_commit=True)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(entry_service.create_knowledge_entry_service_async(db, entry()))
+
+    assert db.rollbacks == 1
+    assert error.value.detail["error"] == "EntryServiceError"
+    assert enqueued == [] and indexed == []
+
+
+def test_enqueue_failure_keeps_created_entry(service, monkeypatch):
+    def broken(**job):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(entry_service, "enqueue_embedding", broken)
+
+    created = asyncio.run(entry_service.create_knowledge_entry_service_async(FakeAsyncSession(), entry()))
+
+    assert created.entry_id == 1
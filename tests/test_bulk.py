@@ -0,0 +1,143 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.embeddings import _bulk
+from app.embeddings._bulk import RateLimiter, embed_texts_bulk
+from app.embeddings._provider import GeminiEmbeddingProvider
+
+
+class FakeProvider:
+    """Proveedor en memoria: registra los lotes y falla según ``fail``."""
+
+    def __init__(self, dim: int = 4, fail=lambda texts, call: False):
+        self.dim = dim
+        self.fail = fail
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed(self, texts, task_type="RETRIEVAL_DOCUMENT"):
+        with self._lock:
+            call = len(self.batches)
+            self.batches.append(list(texts))
+        if self.fail(texts, call):
+            raise RuntimeError("fallo simulado")
+        return np.array([[float(text.split("-")[1])] * self.dim for text in texts], dtype=np.float32)
+
+
+def items(count):
+    return [(entry_id, f"texto-{entry_id}") for entry_id in range(count)]
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Los reintentos no esperan de verdad; se registran las esperas pedidas."""
+    delays = []
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        # Las esperas cortas son del limitador de tasa: esas sí se cumplen
+        if seconds >= 0.1:
+            delays.append(seconds)
+        else:
+            real_sleep(seconds)
+
+    monkeypatch.setattr(_bulk.time, "sleep", sleep)
+    monkeypatch.setattr(_bulk.random, "random", lambda: 0.5)
+    return delays
+
+
+def test_batches_and_callback_on_calling_thread():
+    provider = FakeProvider()
+    saved = {}
+    threads = set()
+
+    def on_batch(entry_ids, matrix):
+        threads.add(threading.get_ident())
+        for entry_id, vector in zip(entry_ids, matrix):
+            saved[entry_id] = vector
+
+    report = embed_texts_bulk(provider, items(250), on_batch, batch_size=100, max_concurrency=3, requests_per_minute=60_000)
+
+    assert sorted(len(batch) for batch in provider.batches) == [50, 100, 100]
+    assert report.entries == 250 and report.batches == 3 and not report.failed_entry_ids
+    assert sorted(saved) == list(range(250))
+    assert all(vector[0] == entry_id for entry_id, vector in saved.items())
+    assert threads == {threading.get_ident()}
+
+
+def test_batch_size_is_capped_at_provider_limit():
+    provider = FakeProvider()
+    embed_texts_bulk(provider, items(250), lambda ids, matrix: None, batch_size=500, requests_per_minute=60_000)
+    assert max(len(batch) for batch in provider.batches) == _bulk.MAX_BATCH_SIZE
+
+
+def test_retries_with_exponential_backoff(no_sleep):
+    provider = FakeProvider(fail=lambda texts, call: call < 2)
+    saved = []
+
+    report = embed_texts_bulk(
+        provider, items(10), lambda ids, matrix: saved.extend(ids),
+        batch_size=10, max_concurrency=1, requests_per_minute=60_000, backoff_seconds=1.0,
+    )
+
+    assert report.retries == 2
+    assert report.entries == 10 and not report.failed_entry_ids
+    assert no_sleep == [1.0, 2.0]
+    assert sorted(saved) == list(range(10))
+
+
+def test_failed_batches_are_reported_and_others_saved(no_sleep):
+    # El lote que contiene la entrada 7 falla siempre
+    provider = FakeProvider(fail=lambda texts, call: "texto-7" in texts)
+    saved = []
+
+    report = embed_texts_bulk(
+        provider, items(30), lambda ids, matrix: saved.extend(ids),
+        batch_size=10, max_concurrency=2, requests_per_minute=60_000, max_retries=2,
+    )
+
+    assert sorted(report.failed_entry_ids) == list(range(10))
+    assert sorted(saved) == list(range(10, 30))
+    assert report.retries == 2
+    assert len(no_sleep) == 2
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(requests_per_minute=1200, burst=1)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    # Un token inicial y después uno cada 50 ms
+    assert time.monotonic() - start >= 0.19
+
+
+def test_bulk_respects_rate_limit():
+    provider = FakeProvider()
+    start = time.monotonic()
+    embed_texts_bulk(provider, items(50), lambda ids, matrix: None, batch_size=10, max_concurrency=1, requests_per_minute=1200)
+    assert len(provider.batches) == 5
+    assert time.monotonic() - start >= 0.19
+
+
+def test_rate_limiter_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+
+
+def test_bulk_against_fake_gemini_endpoint(fake_gemini, no_sleep):
+    fake_gemini.fail_next = 1
+    provider = GeminiEmbeddingProvider("models/text-embedding-004")
+    saved = {}
+
+    def on_batch(entry_ids, matrix):
+        saved.update(zip(entry_ids, matrix))
+
+    report = embed_texts_bulk(provider, items(120), on_batch, batch_size=50, max_concurrency=2, requests_per_minute=60_000)
+
+    assert report.entries == 120 and not report.failed_entry_ids
+    assert report.retries == 1
+    assert sorted(fake_gemini.requests) == [20, 50, 50]
+    np.testing.assert_allclose(saved[3], fake_gemini.vector("texto-3"), rtol=1e-6)
@@ -0,0 +1,222 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.embeddings._cache import CachedEmbeddingProvider
+from app.embeddings._query_cache import QueryEmbeddingCache
+from app.search._result_cache import SearchResultCache
+from app.search._versions import KnowledgeVersions
+from app.utils import cache as cache_module
+from app.utils.cache import AsyncSingleFlight, DiskCache, LRUCache, SingleFlight
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+class CountingProvider:
+    model = "modelo"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def embed(self, texts, task_type="RETRIEVAL_DOCUMENT"):
+        self.calls.append((list(texts), task_type))
+        time.sleep(self.delay)
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1, "expired": 0}
+
+
+def test_lru_entries_expire_after_ttl(clock):
+    cache = LRUCache(max_entries=10, ttl_seconds=60)
+    cache.set("a", 1)
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 2
+
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1 and len(cache) == 0
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "valor"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while flight.shared < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ["valor"] * 8
+
+
+def test_single_flight_propagates_errors_and_forgets_key():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("fallo")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: 2) == 2
+
+
+def test_async_single_flight_shares_one_task():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "valor"
+
+    async def main():
+        flight = AsyncSingleFlight()
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert results == ["valor"] * 5 and calls == [1] and flight.shared == 4
+
+
+def test_async_single_flight_survives_waiter_cancellation():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "valor"
+
+    async def main():
+        flight = AsyncSingleFlight()
+        first = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "valor"
+    assert calls == [1]
+
+
+def test_disk_cache_persists_and_evicts_oldest(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DiskCache(path, max_bytes=1000)
+    for index in range(9):
+        cache.set(f"k{index}", bytes(100))
+    assert cache.get("k0") == bytes(100)
+    assert cache.get_many(["k1", "x"]) == {"k1": bytes(100)}
+
+    cache.set_many({"k9": bytes(100), "k10": bytes(100)})
+
+    # Se expulsan las entradas menos usadas hasta quedar por debajo del 90 % del límite
+    assert cache.stats()["bytes"] <= 900
+    assert DiskCache(path, max_bytes=1000).get("k10") == bytes(100)
+
+
+def test_cached_provider_reuses_memory_and_disk(tmp_path):
+    provider = CountingProvider()
+    path = str(tmp_path / "emb.sqlite3")
+    cached = CachedEmbeddingProvider(provider, disk_path=path)
+
+    first = cached.embed(["hola  mundo", "hola mundo", "otro"])
+    np.testing.assert_array_equal(first[0], first[1])
+    assert provider.calls == [(["hola  mundo", "otro"], "RETRIEVAL_DOCUMENT")]
+
+    # Otro proceso con la misma caché en disco no vuelve a llamar al proveedor
+    again = CachedEmbeddingProvider(CountingProvider(), disk_path=path)
+    np.testing.assert_array_equal(again.embed(["otro"]), first[2:])
+    assert again.provider_texts == 0
+
+
+def test_query_cache_expires_and_calls_upstream_again(clock):
+    provider = CountingProvider()
+    cache = QueryEmbeddingCache(provider, max_entries=10, ttl_seconds=60)
+
+    cache.embed("Hola")
+    cache.embed("  hola ")
+    assert len(provider.calls) == 1 and provider.calls[0][1] == "RETRIEVAL_QUERY"
+
+    clock.now += 61
+    cache.embed("hola")
+    assert len(provider.calls) == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_query_cache_single_flight():
+    provider = CountingProvider(delay=0.05)
+    cache = QueryEmbeddingCache(provider)
+    threads = [threading.Thread(target=cache.embed, args=("consulta",)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(provider.calls) == 1
+
+
+def test_query_cache_embed_many_batches_misses():
+    provider = CountingProvider()
+    cache = QueryEmbeddingCache(provider)
+    cache.embed("a")
+
+    matrix = cache.embed_many(["a", "bb", "BB", "ccc"])
+
+    assert matrix[:, 0].tolist() == [1, 2, 2, 3]
+    assert provider.calls[1] == (["bb", "ccc"], "RETRIEVAL_QUERY")
+
+
+def test_search_result_cache_invalidated_by_version(tmp_path):
+    versions = KnowledgeVersions(str(tmp_path / "versions.sqlite3"))
+    cache = SearchResultCache(versions, lambda business_id: 0)
+    searches = []
+
+    def search():
+        searches.append(1)
+        return np.array([1, 2]), np.array([0.9, 0.5], dtype=np.float32)
+
+    cache.get_or_search(1, "Hola", 5, "semantic", None, search)
+    ids, _ = cache.get_or_search(1, "hola", 5, "semantic", None, search)
+    assert len(searches) == 1 and not ids.flags.writeable
+
+    versions.bump(1)
+    cache.get_or_search(1, "hola", 5, "semantic", None, search)
+    assert len(searches) == 2
@@ -0,0 +1,110 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app.search._bm25 import BM25Index, LexicalIndex, entry_terms, tokenize
+from app.search._fusion import RRF_K, reciprocal_rank_fusion
+from app.search._versions import KnowledgeVersions
+
+ENTRIES = [
+    (1, "Horario de atención", "Atendemos de lunes a viernes de 9 a 18.", ["Soporte"]),
+    (2, "Política de envíos", "Los envíos nacionales tardan 3 días hábiles.", ["Envíos"]),
+    (3, "Repuesto ABC-123", "El repuesto ABC-123 es compatible con la versión v2.5.", ["Repuestos"]),
+    (4, "Devoluciones", "Aceptamos devoluciones dentro de 30 días. Los envíos de devolución son gratis.", ["Soporte"]),
+]
+
+
+def build_index(entries=ENTRIES):
+    index = BM25Index()
+    for entry in entries:
+        index.add(*entry)
+    return index
+
+
+def reference_scores(entries, query, k1=1.2, b=0.75):
+    """BM25 directo sobre los términos de cada entrada, sin índice invertido."""
+    documents = {entry_id: entry_terms(title, content, categories) for entry_id, title, content, categories in entries}
+    average_length = sum(sum(terms.values()) for terms in documents.values()) / len(documents)
+    scores = Counter()
+    for term in set(tokenize(query)):
+        containing = [entry_id for entry_id, terms in documents.items() if term in terms]
+        idf = math.log(1 + (len(documents) - len(containing) + 0.5) / (len(containing) + 0.5))
+        for entry_id in containing:
+            frequency = documents[entry_id][term]
+            length = sum(documents[entry_id].values())
+            scores[entry_id] += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+    return scores
+
+
+def test_tokenize_strips_accents_and_splits_codes():
+    assert tokenize("Envíos ABC-123 v2.5") == ["envios", "abc-123", "abc", "123", "v2.5", "v2", "5"]
+    assert tokenize(None) == []
+
+
+def test_scores_match_reference():
+    index = build_index()
+    for query in ["envíos devoluciones", "abc-123", "horario soporte", "nada"]:
+        expected = reference_scores(ENTRIES, query)
+        ids, scores = index.search(query, k=10)
+        assert dict(zip(ids.tolist(), scores.tolist())) == pytest.approx(dict(expected), rel=1e-5)
+
+
+def test_code_query_ranks_exact_product_first():
+    ids, _ = build_index().search("ABC-123", k=3)
+    assert ids.tolist() == [3]
+
+
+def test_remove_and_readd_update_scores():
+    index = build_index()
+    index.remove(2)
+    index.remove(99)
+    remaining = [entry for entry in ENTRIES if entry[0] != 2]
+
+    ids, scores = index.search("envíos", k=10)
+    assert ids.tolist() == [4]
+    assert scores[0] == pytest.approx(reference_scores(remaining, "envíos")[4], rel=1e-5)
+
+    # Reindexar una entrada reemplaza sus términos y reutiliza su slot
+    index.add(4, "Cambios", "Sin costo.", None)
+    assert index.search("devoluciones", k=10)[0].tolist() == []
+    assert len(index) == 3
+
+
+def test_lexical_index_tracks_versions(tmp_path):
+    versions = KnowledgeVersions(str(tmp_path / "versions.sqlite3"))
+    loads = []
+
+    def loader(business_id):
+        loads.append(business_id)
+        return ENTRIES
+
+    lexical = LexicalIndex(loader, versions)
+    assert lexical.search(1, "horario")[0].tolist() == [1]
+
+    # Un alta de este proceso actualiza el índice sin recargar
+    lexical.entry_saved(1, 5, "Horario de verano", "En enero cerramos a las 14.", None)
+    assert 5 in lexical.search(1, "verano")[0].tolist()
+    assert loads == [1]
+
+    # Un cambio de otro proceso sube la versión: se recarga desde la base
+    versions.bump(1)
+    lexical.search(1, "horario")
+    assert loads == [1, 1]
+
+
+def test_rrf_combines_rankings():
+    semantic = np.array([10, 20, 30])
+    lexical = np.array([30, 40])
+
+    ids, scores = reciprocal_rank_fusion([semantic, lexical], k=3)
+
+    # 30 aparece en ambas listas y supera a quien solo encabeza una; los empates conservan el orden de entrada
+    assert ids.tolist() == [30, 10, 20]
+    assert scores[0] == np.float32(1 / (RRF_K + 3) + 1 / (RRF_K + 1))
+
+
+def test_rrf_empty_rankings():
+    ids, scores = reciprocal_rank_fusion([np.array([], dtype=np.int64)], k=5)
+    assert len(ids) == 0 and len(scores) == 0
@@ -0,0 +1,99 @@
+import os
+from typing import List, NamedTuple
+
+import numpy as np
+import pytest
+
+from app.embeddings._filters import EntryMetadata
+from app.embeddings._generations import GenerationalEmbeddingStore
+from app.embeddings._rebuild import checkpoint_path, rebuild_generation, save_checkpoint
+
+DIM = 4
+MODEL = "models/prueba"
+
+
+class Row(NamedTuple):
+    id: int
+    business_id: int
+    text: str
+    category: str
+
+
+class FakeProvider:
+    model = MODEL
+
+    def __init__(self):
+        self.texts: List[str] = []
+
+    def embed(self, texts, task_type="RETRIEVAL_DOCUMENT"):
+        self.texts.extend(texts)
+        return np.array([[len(text), 1, 0, 0] for text in texts], dtype=np.float32)
+
+    def stats(self):
+        return {}
+
+
+def pages_of(rows):
+    def iter_pages(after_id, page_size):
+        # Paginación por keyset, como las consultas a la base
+        remaining = sorted((row for row in rows if row.id > after_id), key=lambda row: row.id)
+        for start in range(0, len(remaining), page_size):
+            yield remaining[start:start + page_size]
+    return iter_pages
+
+
+def rebuild(generation, rows, provider=None, **kwargs):
+    provider = provider or FakeProvider()
+    totals = rebuild_generation(
+        generation, provider, pages_of(rows),
+        lambda row: row.text, lambda row: EntryMetadata.of([row.category], None),
+        page_size=10, requests_per_minute=60_000, **kwargs,
+    )
+    return totals, provider
+
+
+@pytest.fixture
+def generation(tmp_path):
+    return GenerationalEmbeddingStore(str(tmp_path), MODEL, DIM).active()
+
+
+def stored_ids(generation):
+    return {
+        business_id: sorted(fingerprints)
+        for business_id, fingerprints in generation.store.iter_fingerprints()
+        if fingerprints
+    }
+
+
+def test_rebuild_is_incremental(generation):
+    rows = [Row(entry_id, entry_id % 2, f"texto {entry_id}", "a") for entry_id in range(1, 31)]
+    totals, _ = rebuild(generation, rows)
+    assert totals["embedded"] == 30 and totals["deleted"] == 0
+    assert stored_ids(generation) == {0: list(range(2, 31, 2)), 1: list(range(1, 31, 2))}
+
+    changed = [row._replace(text="texto nuevo") if row.id == 5 else row for row in rows]
+    changed = [row._replace(category="b") if row.id == 6 else row for row in changed]
+    # 7 se borró de la base, 8 cambió de negocio y 30 (el último) también se borró
+    changed = [row._replace(business_id=1) if row.id == 8 else row for row in changed if row.id not in (7, 30)]
+
+    totals, provider = rebuild(generation, changed)
+
+    assert sorted(provider.texts) == ["texto 8", "texto nuevo"]
+    assert totals["embedded"] == 2 and totals["metadata"] == 1 and totals["deleted"] == 2
+    assert stored_ids(generation) == {
+        0: [entry_id for entry_id in range(2, 30, 2) if entry_id != 8],
+        1: sorted([entry_id for entry_id in range(1, 30, 2) if entry_id != 7] + [8]),
+    }
+    assert generation.store.metadata(0, [6]) == [EntryMetadata.of(["b"], None)]
+    assert not os.path.exists(checkpoint_path(generation))
+
+
+def test_rebuild_resumes_from_checkpoint(generation):
+    rows = [Row(entry_id, 1, f"texto {entry_id}", "a") for entry_id in range(1, 21)]
+    save_checkpoint(generation, 15)
+
+    totals, provider = rebuild(generation, rows)
+    assert totals["rows"] == 5 and len(provider.texts) == 5
+
+    totals, provider = rebuild(generation, rows, restart=True)
+    assert totals["rows"] == 20 and len(provider.texts) == 15
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+
+from app.embeddings._ann import ANN_MIN_ROWS
+from app.embeddings._filters import EntryMetadata, SearchFilter
+from app.embeddings._quantization import QuantizedMatrix
+from app.embeddings._store import EmbeddingStore
+from tests.conftest import clustered_vectors
+
+DIM = 32
+ROWS = ANN_MIN_ROWS + 1000
+K = 10
+CATEGORIES = ["ventas", "soporte", "envios"]
+CONTENT_TYPES = ["faq", "politica"]
+
+
+def metadata_for(entry_id):
+    return EntryMetadata.of([CATEGORIES[entry_id % 3]], CONTENT_TYPES[entry_id % 2])
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("store"))
+    store = EmbeddingStore.open_or_create(root, DIM)
+    matrix = clustered_vectors(ROWS, DIM)
+    entry_ids = list(range(1, ROWS + 1))
+    store.replace_many(entry_ids, matrix, [b""] * ROWS, ["modelo"] * ROWS, [metadata_for(i) for i in entry_ids])
+    # Con más de ANN_MIN_ROWS filas la compactación construye el índice IVF
+    assert store.compact()
+    # Cambios posteriores quedan en el log: reemplazos, borrados y altas
+    store.delete_many(list(range(1, 200, 3)))
+    extra = clustered_vectors(100, DIM, seed=1)
+    store.replace_many(list(range(2, 202, 2)), extra, [b""] * 100, ["modelo"] * 100, [metadata_for(i) for i in range(2, 202, 2)])
+    store.add(ROWS + 1, clustered_vectors(1, DIM, seed=2)[0], metadata=metadata_for(ROWS + 1))
+    yield EmbeddingStore(root)
+    store.close()
+
+
+@pytest.fixture(scope="module")
+def queries():
+    return clustered_vectors(30, DIM, seed=3)
+
+
+def brute_force(store, query, k=K):
+    entry_ids, matrix = store.live()
+    scores = np.asarray(matrix) @ query
+    order = np.argsort(-scores, kind="stable")[:k]
+    return entry_ids[order], scores[order]
+
+
+def recall(expected, found):
+    return len(set(expected.tolist()) & set(found.tolist())) / len(expected)
+
+
+def test_exact_matches_brute_force(store, queries):
+    for query in queries:
+        ids, scores = store.search(query, K)
+        expected_ids, expected_scores = brute_force(store, query)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+        assert recall(expected_ids, ids) == 1.0
+
+
+def test_exact_skips_deleted_and_sees_overlay(store):
+    deleted_id = 7
+    new_id = ROWS + 1
+    ids, _ = store.search(store.get(new_id), K)
+    assert ids[0] == new_id
+    assert store.get(deleted_id) is None
+    for query in clustered_vectors(10, DIM, seed=4):
+        assert deleted_id not in store.search(query, ROWS)[0]
+
+
+def test_blocked_equals_exact(store, queries):
+    for query in queries:
+        exact_ids, exact_scores = store.search(query, K)
+        ids, scores = store.search(query, K, index="blocked", block_rows=257)
+        np.testing.assert_array_equal(ids, exact_ids)
+        np.testing.assert_allclose(scores, exact_scores, rtol=1e-6)
+
+
+def test_blocked_does_not_load_snapshot_index(store, queries, monkeypatch):
+    # Un lector nuevo sin vistas en caché: la ruta por bloques no debe pedir los ids ni el índice completos
+    reader = EmbeddingStore(store.root)
+    for name in ("ids", "index", "rows"):
+        monkeypatch.setattr(reader._snapshot, name, lambda: pytest.fail("la ruta por bloques cargó el snapshot completo"))
+    for query in queries:
+        ids, scores = reader.search(query, K, index="blocked", block_rows=257)
+        exact_ids, exact_scores = store.search(query, K)
+        np.testing.assert_array_equal(ids, exact_ids)
+        np.testing.assert_allclose(scores, exact_scores, rtol=1e-6)
+    reader.close()
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_recall(store, queries, quantization):
+    recalls = []
+    for query in queries:
+        exact_ids, exact_scores = store.search(query, K)
+        ids, scores = store.search(query, K, quantization=quantization, rescore_factor=4)
+        recalls.append(recall(exact_ids, ids))
+        # Los candidatos se re-puntúan en float32: las puntuaciones son exactas
+        _, rescored = store.score(ids, query)
+        np.testing.assert_allclose(scores, rescored, rtol=1e-5, atol=1e-6)
+    assert np.mean(recalls) >= 0.95
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_scores_match_dequantized(quantization):
+    # Con 768 dimensiones se puntúan varios bloques y el último queda incompleto
+    matrix = clustered_vectors(1234, 768, seed=5)
+    quantized = QuantizedMatrix.from_float32(matrix, quantization)
+    dequantized = quantized.data.astype(np.float32)
+    if quantized.scales is not None:
+        dequantized *= quantized.scales[:, None]
+
+    for query in clustered_vectors(5, 768, seed=6):
+        np.testing.assert_allclose(quantized.scores(query), dequantized @ query, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(quantized.scores(query), matrix @ query, atol=0.02)
+
+
+def test_ivf_recall(store, queries):
+    recalls = [recall(store.search(query, K)[0], store.search(query, K, index="ivf")[0]) for query in queries]
+    assert np.mean(recalls) >= 0.9
+    # Visitando todas las listas el IVF es exacto
+    for query in queries[:5]:
+        ids, _ = store.search(query, K, index="ivf", nprobe=10 ** 6)
+        assert recall(store.search(query, K)[0], ids) == 1.0
+
+
+def test_ivf_finds_overlay_rows(store):
+    new_id = ROWS + 1
+    ids, _ = store.search(store.get(new_id), K, index="ivf")
+    assert ids[0] == new_id
+
+
+def test_filtered_matches_brute_force(store, queries):
+    search_filter = SearchFilter.of(["soporte"], "faq")
+    entry_ids, matrix = store.live()
+    allowed = np.array([search_filter.matches(metadata) for metadata in store.metadata(entry_ids)])
+    for query in queries[:10]:
+        ids, scores = store.search(query, K, filters=search_filter)
+        scores_all = np.asarray(matrix)[allowed] @ query
+        order = np.argsort(-scores_all, kind="stable")[:K]
+        np.testing.assert_allclose(scores, scores_all[order], rtol=1e-5, atol=1e-6)
+        assert set(ids.tolist()) <= set(entry_ids[allowed].tolist())
+        assert recall(entry_ids[allowed][order], ids) == 1.0
+
+
+def test_search_many_equals_search(store, queries):
+    for query, (ids, scores) in zip(queries, store.search_many(queries, K)):
+        expected_ids, expected_scores = store.search(query, K)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
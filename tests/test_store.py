@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.embeddings._filters import EntryMetadata
+from app.embeddings._segment_log import list_segments
+from app.embeddings._store import CURRENT_FILE, LOG_DIR, EmbeddingStore, compact_store
+
+DIM = 8
+
+
+def unit(seed):
+    vector = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def contents(store):
+    entry_ids, matrix = store.live()
+    return {int(entry_id): np.asarray(row) for entry_id, row in zip(entry_ids, matrix)}
+
+
+def populate(store):
+    for entry_id in range(20):
+        store.add(entry_id, unit(entry_id), b"h%d" % entry_id, "modelo", EntryMetadata.of(["c%d" % (entry_id % 3)], "faq"))
+    store.replace(5, unit(100), b"h5b", "modelo")
+    store.delete_many([7, 8])
+
+
+def test_writes_are_visible_after_refresh(tmp_path):
+    store = EmbeddingStore.open_or_create(str(tmp_path), DIM)
+    populate(store)
+    reader = EmbeddingStore(str(tmp_path))
+
+    state = contents(reader)
+
+    assert sorted(state) == [i for i in range(20) if i not in (7, 8)]
+    np.testing.assert_allclose(state[5], unit(100), rtol=1e-6)
+    assert reader.fingerprints()[5][:2] == (b"h5b", "modelo")
+    assert reader.metadata([3])[0] == EntryMetadata(("c0",), "faq")
+
+
+def test_compaction_preserves_contents(tmp_path):
+    store = EmbeddingStore.open_or_create(str(tmp_path), DIM)
+    populate(store)
+    before = contents(EmbeddingStore(str(tmp_path)))
+    fingerprints = EmbeddingStore(str(tmp_path)).fingerprints()
+
+    store.close()
+    assert store.compact()
+
+    after = EmbeddingStore(str(tmp_path))
+    assert store.log_bytes() == 0
+    assert sorted(contents(after)) == sorted(before)
+    for entry_id, vector in before.items():
+        np.testing.assert_allclose(contents(after)[entry_id], vector, rtol=1e-6)
+    assert after.fingerprints() == fingerprints
+    assert list_segments(os.path.join(str(tmp_path), LOG_DIR)) == []
+
+
+def test_writes_during_compaction_survive(tmp_path):
+    store = EmbeddingStore.open_or_create(str(tmp_path), DIM)
+    populate(store)
+    # El segmento del escritor sigue abierto: la compactación lo lee hasta un offset y no lo borra
+    assert store.compact()
+    store.add(50, unit(50))
+    store.delete(0)
+
+    reader = EmbeddingStore(str(tmp_path))
+    assert 50 in reader and 0 not in reader
+    assert store.compact()
+    assert 50 in EmbeddingStore(str(tmp_path)) and 0 not in EmbeddingStore(str(tmp_path))
+
+
+def test_recovers_from_torn_write(tmp_path):
+    store = EmbeddingStore.open_or_create(str(tmp_path), DIM)
+    populate(store)
+    store.close()
+    log_dir = os.path.join(str(tmp_path), LOG_DIR)
+    segment = os.path.join(log_dir, list_segments(log_dir)[0])
+    # Simula una caída a mitad del último registro (el borrado de 8)
+    with open(segment, "r+b") as f:
+        f.truncate(os.path.getsize(segment) - 5)
+
+    reopened = EmbeddingStore(str(tmp_path))
+    state = contents(reopened)
+    assert 5 in state and 7 not in state and 8 in state
+    assert compact_store(str(tmp_path))
+    assert sorted(contents(EmbeddingStore(str(tmp_path)))) == sorted(state)
+
+
+def test_interrupted_compaction_leaves_store_readable(tmp_path):
+    store = EmbeddingStore.open_or_create(str(tmp_path), DIM)
+    populate(store)
+    store.close()
+    with open(os.path.join(str(tmp_path), CURRENT_FILE), encoding="utf-8") as f:
+        current = json.load(f)
+    # Un snapshot a medio escribir de una compactación que no llegó a publicarse
+    next_snapshot = os.path.join(str(tmp_path), "snapshot-%06d" % (int(current["snapshot"].split("-")[1]) + 1))
+    os.makedirs(next_snapshot)
+    with open(os.path.join(next_snapshot, "vectors.f32"), "wb") as f:
+        f.write(b"basura")
+
+    before = contents(EmbeddingStore(str(tmp_path)))
+    assert compact_store(str(tmp_path))
+    after = contents(EmbeddingStore(str(tmp_path)))
+    assert sorted(after) == sorted(before)
+
+
+def test_rejects_wrong_dimension(tmp_path):
+    store = EmbeddingStore.open_or_create(str(tmp_path), DIM)
+    with pytest.raises(ValueError):
+        store.add(1, np.zeros(DIM + 1, np.float32))
+    with pytest.raises(ValueError):
+        EmbeddingStore.open_or_create(str(tmp_path), DIM + 1)
@@ -0,0 +1,138 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.embeddings._filters import EntryMetadata
+from app.embeddings._generations import GenerationalEmbeddingStore
+from app.embeddings._worker import EmbeddingJob, EmbeddingWorker, PendingEmbeddings
+
+DIM = 4
+MODEL = "models/prueba"
+
+
+class FakeProvider:
+    model = MODEL
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.batches = []
+
+    def embed(self, texts, task_type="RETRIEVAL_DOCUMENT"):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("servicio no disponible")
+        self.batches.append(len(texts))
+        return np.array([[len(text), 1, 0, 0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def pending(tmp_path):
+    return PendingEmbeddings(str(tmp_path / "pending.sqlite3"))
+
+
+def job(entry_id, business_id=1):
+    return EmbeddingJob(entry_id, business_id, f"titulo {entry_id}", "contenido", metadata=EntryMetadata.of(["a"], "faq"))
+
+
+def test_put_leases_job_until_it_is_due(pending):
+    pending.put(job(1), lease_seconds=60)
+    pending.put(job(2), lease_seconds=-1)
+
+    claimed = pending.claim_due(10, lease_seconds=60, max_attempts=5)
+
+    assert [item.entry_id for item in claimed] == [2]
+    assert claimed[0].metadata == EntryMetadata.of(["a"], "faq")
+    # Una vez reservado no vuelve a salir hasta que venza la nueva reserva
+    assert pending.claim_due(10, lease_seconds=60, max_attempts=5) == []
+
+
+def test_requeued_job_survives_done_of_old_version(pending):
+    first = pending.put(job(1), lease_seconds=60)
+    second = pending.put(job(1), lease_seconds=60)
+    assert (first.version, second.version) == (1, 2)
+
+    pending.done([EmbeddingJob(1, 1, "", "", version=1)])
+    assert len(pending) == 1
+    pending.done([second])
+    assert len(pending) == 0
+
+
+def test_failed_jobs_retry_until_max_attempts(pending):
+    pending.put(job(1), lease_seconds=-1)
+    for attempt in range(3):
+        claimed = pending.claim_due(10, lease_seconds=60, max_attempts=3)
+        assert [item.attempts for item in claimed] == [attempt]
+        pending.failed(claimed, retry_at=time.time() - 1)
+
+    assert pending.claim_due(10, lease_seconds=60, max_attempts=3) == []
+    assert len(pending) == 1
+
+
+def make_worker(tmp_path, provider, **kwargs):
+    store = GenerationalEmbeddingStore(str(tmp_path / "store"), MODEL, DIM)
+    worker = EmbeddingWorker(
+        store, lambda generation: provider, pending_path=str(tmp_path / "queue.sqlite3"),
+        max_wait_seconds=0.01, backoff_seconds=0.01, **kwargs,
+    )
+    return store, worker
+
+
+def test_worker_embeds_submitted_entries(tmp_path):
+    provider = FakeProvider()
+    store, worker = make_worker(tmp_path, provider, batch_size=8)
+    for entry_id in range(20):
+        worker.submit(entry_id, entry_id % 2, f"titulo {entry_id}", "contenido")
+
+    while worker.stats()["queued"] or worker.stats()["pending"]:
+        worker._process(worker._next_batch())
+
+    shards = store.active().store
+    assert worker.processed == 20
+    assert max(provider.batches) <= 8
+    assert sorted(shards.shard(0).live()[0].tolist()) == list(range(0, 20, 2))
+    assert 1 in shards.shard(1)
+
+
+def test_worker_retries_failed_batch(tmp_path):
+    provider = FakeProvider(fail_times=1)
+    store, worker = make_worker(tmp_path, provider, lease_seconds=0)
+    worker.submit(1, 1, "titulo", "contenido")
+
+    worker._process(worker._next_batch())
+    assert worker.failures == 1 and worker.stats()["pending"] == 1
+
+    time.sleep(0.02)
+    worker._process(worker._next_batch())
+    assert worker.stats()["pending"] == 0
+    assert 1 in store.active().store.shard(1)
+
+
+def test_due_jobs_are_claimed_while_queue_is_busy(tmp_path):
+    provider = FakeProvider()
+    _, worker = make_worker(tmp_path, provider, batch_size=8, max_queue=1000)
+    # Trabajos de un proceso anterior cuya reserva ya venció
+    for entry_id in range(1000, 1005):
+        worker.pending.put(job(entry_id), lease_seconds=-1)
+    for entry_id in range(100):
+        worker.submit(entry_id, 1, "titulo", "contenido")
+
+    batch = worker._next_batch()
+
+    assert len(batch) == 8
+    assert sum(item.entry_id >= 1000 for item in batch) == 4
+
+
+def test_worker_thread_drains_queue(tmp_path):
+    provider = FakeProvider()
+    _, worker = make_worker(tmp_path, provider)
+    worker.start()
+    try:
+        for entry_id in range(50):
+            worker.submit(entry_id, 1, "titulo", "contenido")
+        deadline = time.monotonic() + 5
+        while worker.processed < 50 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.stop(timeout=5)
+    assert worker.processed == 50 and worker.stats()["pending"] == 0